@@ -1,4 +1,69 @@
+"""
+Authentification JWT (en-tête Authorization ou cookie "access").
+
+Mode « utilisateur porté par le jeton » (JWT_TOKEN_USER = True, désactivé
+par défaut) : le jeton d'accès porte, en plus de l'id, username, is_active,
+is_staff, is_superuser et la version des rôles (claim "rv", voir
+rbac.cache.roles_version) au moment de son émission. Tant que cette
+version est la version courante, la requête est authentifiée par un
+TokenUser construit depuis le jeton, sans lire la table des utilisateurs ;
+les permissions viennent du cache rbac.cache. Toute modification de rôles
+ou de fiche utilisateur change la version : les jetons émis avant
+repassent par la base (chargement et contrôles habituels) jusqu'au
+prochain rafraîchissement.
+
+Les vues qui ont besoin de la fiche complète (groupes, écriture...)
+passent par db_user().
+"""
+from django.conf import settings
+from django.contrib.auth import get_user_model
 from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+
+from rbac.cache import roles_version
+
+ROLES_VERSION_CLAIM = "rv"
+
+
+def token_user_enabled():
+    return getattr(settings, "JWT_TOKEN_USER", False)
+
+
+def stamp_access_token(access, user):
+    """Copie dans le jeton d'accès ce qu'il faut pour authentifier sans requête"""
+    access["username"] = user.get_username()
+    access["is_active"] = user.is_active
+    access["is_staff"] = user.is_staff
+    access["is_superuser"] = user.is_superuser
+    access[ROLES_VERSION_CLAIM] = roles_version()
+    return access
+
+
+class ErpTokenUser(TokenUser):
+    @property
+    def is_active(self):
+        return bool(self.token.get("is_active", False))
+
+
+def token_user(validated_token):
+    """TokenUser si le jeton est à jour (version des rôles courante), sinon None"""
+    if ROLES_VERSION_CLAIM not in validated_token or api_settings.USER_ID_CLAIM not in validated_token:
+        return None
+    version = roles_version()
+    if not validated_token.get("is_active") or validated_token[ROLES_VERSION_CLAIM] != version:
+        return None
+    user = ErpTokenUser(validated_token)
+    user._rbac_version = version  # rbac.cache : pas de seconde lecture dans la requête
+    return user
+
+
+def db_user(user):
+    """Fiche utilisateur en base (une requête si user vient du jeton)"""
+    if isinstance(user, TokenUser):
+        return get_user_model().objects.get(pk=user.pk)
+    return user
+
 
 class CookieJWTAuthentication(JWTAuthentication):
     def authenticate(self, request):
@@ -12,3 +77,10 @@ class CookieJWTAuthentication(JWTAuthentication):
             return None
         validated_token = self.get_validated_token(raw_token)
         return self.get_user(validated_token), validated_token
+
+    def get_user(self, validated_token):
+        if token_user_enabled():
+            user = token_user(validated_token)
+            if user is not None:
+                return user
+        return super().get_user(validated_token)
@@ -1,3 +1,57 @@
-from django.test import TestCase
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from rbac import cache
+
+from .auth import ErpTokenUser
+
+
+@override_settings(JWT_TOKEN_USER=True)
+class TokenUserTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name='vendeur')
+        cls.group.permissions.add(Permission.objects.get(content_type__app_label='rbac', codename='sales_view'))
+        cls.user = get_user_model().objects.create_user('vendeur', 'vendeur@example.com', 'secret-pass')
+        cls.user.groups.add(cls.group)
+
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            cache.invalidate()
+        self.client = APIClient()
+        response = self.client.post('/api/auth/token/', {'username': 'vendeur', 'password': 'secret-pass'}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+    def user_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        return response, sum('auth_user"' in q['sql'] and 'auth_permission' not in q['sql']
+                             for q in ctx.captured_queries)
+
+    def test_no_user_lookup_while_roles_unchanged(self):
+        self.client.get('/api/sales/orders/')  # ensemble de permissions mis en cache
+        response, lookups = self.user_queries('/api/sales/orders/')
+        self.assertEqual((response.status_code, lookups), (200, 0))
+        self.assertIsInstance(response.wsgi_request.user, ErpTokenUser)
+        self.assertEqual(self.client.get('/api/auth/me/').json()['roles'], ['vendeur'])
+
+    def test_stale_token_falls_back_to_database(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save()
+        self.assertEqual(self.client.get('/api/sales/orders/').status_code, 401)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = True
+            self.user.save()
+            self.group.permissions.clear()
+        response, lookups = self.user_queries('/api/sales/orders/')
+        self.assertEqual((response.status_code, lookups), (403, 1))
+        self.client.post('/api/auth/refresh/')  # jeton réémis à la version courante
+        response, lookups = self.user_queries('/api/sales/orders/')
+        self.assertEqual((response.status_code, lookups), (403, 0))
@@ -3,10 +3,11 @@ from django.contrib.auth.models import Group
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status, permissions
+from rest_framework_simplejwt.settings import api_settings
 from rest_framework_simplejwt.tokens import RefreshToken
 from .serializers import MeSerializer, AdminCreateUserSerializer
 from .utils import attach_token_cookies, clear_tokens
-from .auth import CookieJWTAuthentication
+from .auth import CookieJWTAuthentication, db_user, stamp_access_token, token_user_enabled
 from .permissions import IsAdminUserStrict
 
 User = get_user_model()
@@ -34,7 +35,7 @@ class LoginView(APIView):
             return Response({"detail": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
         refresh = RefreshToken.for_user(user)
-        access = refresh.access_token
+        access = stamp_access_token(refresh.access_token, user)
 
         res = Response({"ok": True})
         attach_token_cookies(res, str(access), str(refresh))
@@ -49,7 +50,12 @@ class RefreshView(APIView):
             return Response({"detail": "No refresh token"}, status=status.HTTP_401_UNAUTHORIZED)
         try:
             refresh = RefreshToken(token)
-            access = str(refresh.access_token)
+            access = refresh.access_token
+            if token_user_enabled():
+                # jeton porteur de l'utilisateur : fiche et version des rôles relues à chaque rafraîchissement
+                user = User.objects.get(pk=refresh[api_settings.USER_ID_CLAIM], is_active=True)
+                stamp_access_token(access, user)
+            access = str(access)
             res = Response({"ok": True})
             # issue only a new access here (keep refresh stable)
             attach_token_cookies(res, access_token=access)
@@ -71,7 +77,7 @@ class MeView(APIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def get(self, request):
-        return Response(MeSerializer(request.user).data)
+        return Response(MeSerializer(db_user(request.user)).data)
 
 class AdminCreateUserView(APIView):
     authentication_classes = [CookieJWTAuthentication]
@@ -0,0 +1,31 @@
+"""
+Budgets par endpoint pour le banc d'essai (benchmarks.harness).
+
+`queries` : requêtes SQL maximum pour un appel.
+`growth`  : requêtes supplémentaires tolérées quand le jeu de données grossit
+            (0 = pas de N+1).
+`ms`, `peak_kb` : temps et pic mémoire maximum (None = non contrôlé ; ces
+            valeurs dépendent de la machine, à fixer en CI).
+
+Les clés sont les noms d'endpoints ("sales:order-list", "warehouse:dashboard-stats"...).
+settings.BENCHMARK_BUDGETS complète ou remplace ces valeurs.
+"""
+from django.conf import settings
+
+DEFAULT_BUDGET = {
+    'queries': 12,
+    'growth': 0,
+    'ms': None,
+    'peak_kb': None,
+}
+
+BUDGETS = {
+    # 'sales:order-list': {'queries': 8, 'ms': 250},
+}
+
+
+def budget_for(name):
+    budget = dict(DEFAULT_BUDGET)
+    budget.update(BUDGETS.get(name, {}))
+    budget.update(getattr(settings, 'BENCHMARK_BUDGETS', {}).get(name, {}))
+    return budget
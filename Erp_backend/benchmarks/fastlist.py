@@ -0,0 +1,61 @@
+"""
+Comparaison du chemin rapide des listes (erp_api.fastlist) avec les serializers.
+
+Chaque liste est appelée avec et sans FAST_LIST_ENABLED sur le même jeu de
+données : les deux réponses doivent être identiques, les temps sont
+rapportés côte à côte. Tout se déroule dans une transaction annulée.
+"""
+import time
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from .harness import _host
+from .seed import scaled, seed
+
+LIST_URLS = {
+    'sales:product-list': '/api/sales/products/',
+    'warehouse:material-list': '/api/warehouse/materials/',
+    'warehouse:stockmovement-list': '/api/warehouse/stock-movements/',
+}
+
+
+def _timed(client, url, params, enabled, repeat):
+    with override_settings(FAST_LIST_ENABLED=enabled):
+        best = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            response = client.get(url, params)
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+    return response, round(best * 1000, 1)
+
+
+def compare(factor=1, page_size=None, repeat=3, user=None, **sizes):
+    """Une mesure par liste : rows, ms (serializer), fast_ms, speedup, identical"""
+    results = []
+    with transaction.atomic():
+        if user is None:
+            user = get_user_model().objects.create_superuser('bench', 'bench@example.com', None)
+        client = APIClient(HTTP_HOST=_host())
+        client.force_authenticate(user)
+        seed(seed_value=factor, **scaled(factor, **sizes))
+
+        params = {'page_size': page_size} if page_size else {}
+        for name, url in LIST_URLS.items():
+            slow, ms = _timed(client, url, params, False, repeat)
+            fast, fast_ms = _timed(client, url, params, True, repeat)
+            body = slow.json()
+            results.append({
+                'endpoint': name,
+                'rows': len(body['results'] if isinstance(body, dict) else body),
+                'status': (slow.status_code, fast.status_code),
+                'ms': ms,
+                'fast_ms': fast_ms,
+                'speedup': round(ms / fast_ms, 2) if fast_ms else None,
+                'identical': slow.content == fast.content,
+            })
+        transaction.set_rollback(True)
+    return results
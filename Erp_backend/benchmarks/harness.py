@@ -0,0 +1,191 @@
+"""
+Banc d'essai des endpoints DRF : nombre de requêtes, temps et pic mémoire.
+
+Chaque endpoint GET des routers sales, warehouse et customers (liste,
+détail, actions supplémentaires) est appelé après chaque tour de
+génération de données ; un endpoint dont le nombre de requêtes augmente
+avec le volume (N+1) ou qui dépasse son budget (voir budgets.py) est
+signalé. Tout se déroule dans une transaction annulée à la fin, avec un
+cache local au process (BENCH_CACHES) vidé avant chaque appel : le cache
+configuré (Redis...) n'est ni lu ni vidé.
+"""
+import time
+import tracemalloc
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLResolver, get_resolver
+from rest_framework.test import APIClient
+
+from sales.models import Product
+from warehouse.models import Material
+
+from .budgets import budget_for
+from .seed import scaled, seed
+
+ROUTER_MODULES = ('sales.urls', 'warehouse.urls', 'customers.urls')
+BENCH_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmarks'},
+}
+
+# Paramètres obligatoires de certaines actions
+ENDPOINT_PARAMS = {
+    'warehouse:stockmovement-by-material': lambda: {
+        'material_id': Material.objects.order_by('-pk').values_list('pk', flat=True).first(),
+    },
+    'sales:product-atp': lambda: {
+        'ids': ','.join(str(pk) for pk in Product.objects.order_by('-created_at').values_list('pk', flat=True)[:50]),
+    },
+}
+
+
+def _mount_points():
+    """Préfixe sous lequel chaque module d'URLs est inclus dans ROOT_URLCONF"""
+    mounts = {}
+    for pattern in get_resolver().url_patterns:
+        if isinstance(pattern, URLResolver):
+            name = getattr(pattern.urlconf_name, '__name__', None)
+            if name:
+                mounts.setdefault(name, f'/{pattern.pattern}')
+    return mounts
+
+
+def _host():
+    hosts = [h.lstrip('.') for h in settings.ALLOWED_HOSTS if h != '*']
+    return hosts[0] if hosts else 'localhost'
+
+
+def _latest_pk(viewset):
+    queryset = viewset.queryset.model._default_manager.all()
+    fields = {f.name for f in queryset.model._meta.get_fields()}
+    ordering = ['-created_at', '-pk'] if 'created_at' in fields else ['-pk']
+    return queryset.order_by(*ordering).values_list('pk', flat=True).first()
+
+
+def endpoints():
+    """Endpoints GET de chaque router : dicts name, url, kind ('list', 'detail', 'action')"""
+    mounts = _mount_points()
+    for module_name in ROUTER_MODULES:
+        app = module_name.split('.')[0]
+        mount = mounts[module_name]
+        router = import_module(module_name).router
+        for prefix, viewset, basename in router.registry:
+            base = f'{mount}{prefix}/'
+            if hasattr(viewset, 'list'):
+                yield {'name': f'{app}:{basename}-list', 'url': base, 'kind': 'list', 'viewset': viewset}
+            if hasattr(viewset, 'retrieve'):
+                yield {'name': f'{app}:{basename}-detail', 'url': base + '{pk}/', 'kind': 'detail', 'viewset': viewset}
+            for extra in viewset.get_extra_actions():
+                if 'get' not in extra.mapping:
+                    continue
+                url = base + ('{pk}/' if extra.detail else '') + f'{extra.url_path}/'
+                yield {
+                    'name': f'{app}:{basename}-{extra.url_name}',
+                    'url': url,
+                    'kind': 'action',
+                    'viewset': viewset,
+                }
+
+
+def measure(client, url, params=None):
+    """Un appel à froid (cache vidé) : requêtes et pic mémoire, puis un second pour le temps"""
+    cache.clear()
+    # le journal des requêtes est borné (9000) : plein après le seed, il fausserait le compte
+    connection.queries_log.clear()
+    tracemalloc.start()
+    with CaptureQueriesContext(connection) as ctx:
+        response = client.get(url, params)
+        if response.streaming:
+            b''.join(response.streaming_content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    cache.clear()
+    start = time.perf_counter()
+    timed = client.get(url, params)
+    if timed.streaming:
+        b''.join(timed.streaming_content)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'status': response.status_code,
+        'queries': len(ctx),
+        'ms': round(elapsed * 1000, 1),
+        'peak_kb': round(peak / 1024, 1),
+    }
+
+
+def _run_round(client, factor, page_sizes, only):
+    rows = []
+    for endpoint in endpoints():
+        if only and not any(part in endpoint['name'] for part in only):
+            continue
+        url = endpoint['url']
+        if '{pk}' in url:
+            pk = _latest_pk(endpoint['viewset'])
+            if pk is None:
+                continue
+            url = url.format(pk=pk)
+        params = ENDPOINT_PARAMS.get(endpoint['name'], dict)()
+        for page_size in page_sizes if endpoint['kind'] == 'list' else (None,):
+            query = dict(params, page_size=page_size) if page_size else params
+            rows.append({
+                'endpoint': endpoint['name'],
+                'url': url,
+                'page_size': page_size,
+                'factor': factor,
+                **measure(client, url, query),
+            })
+    return rows
+
+
+def check(row, baseline):
+    """Liste des dépassements de budget d'une mesure (baseline : même endpoint au premier tour)"""
+    budget = budget_for(row['endpoint'])
+    violations = []
+    if row['status'] >= 400:
+        violations.append(f"HTTP {row['status']}")
+    if row['queries'] > budget['queries']:
+        violations.append(f"{row['queries']} requêtes > {budget['queries']}")
+    if baseline is not None and row['growth'] > budget['growth']:
+        violations.append(f"+{row['growth']} requêtes avec le volume (N+1 ?)")
+    if budget['ms'] is not None and row['ms'] > budget['ms']:
+        violations.append(f"{row['ms']} ms > {budget['ms']}")
+    if budget['peak_kb'] is not None and row['peak_kb'] > budget['peak_kb']:
+        violations.append(f"{row['peak_kb']} Ko > {budget['peak_kb']}")
+    return violations
+
+
+def run(factors=(1, 3), page_sizes=(None,), only=None, user=None, **sizes):
+    """
+    Génère les données par tours (facteurs d'échelle cumulés sur DEFAULT_SIZES),
+    mesure tous les endpoints après chaque tour et retourne les mesures ;
+    chaque mesure porte sa croissance par rapport au premier tour et ses
+    dépassements de budget ('violations'). Rien n'est conservé en base ni
+    dans le cache configuré.
+    """
+    results = []
+    with override_settings(CACHES=BENCH_CACHES), transaction.atomic():
+        if user is None:
+            user = get_user_model().objects.create_superuser('bench', 'bench@example.com', None)
+        client = APIClient(HTTP_HOST=_host())
+        client.raise_request_exception = False  # une erreur 500 est une mesure en échec
+        client.force_authenticate(user)
+
+        for factor in factors:
+            seed(seed_value=factor, **scaled(factor, **sizes))
+            results.extend(_run_round(client, factor, page_sizes, only))
+        transaction.set_rollback(True)
+        cache.clear()
+
+    first = {}
+    for row in results:
+        key = (row['endpoint'], row['page_size'])
+        baseline = first.setdefault(key, row if row['factor'] == factors[0] else None)
+        row['growth'] = row['queries'] - baseline['queries'] if baseline else 0
+        row['violations'] = check(row, baseline if baseline is not row else None)
+    return results
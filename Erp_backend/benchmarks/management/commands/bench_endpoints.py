@@ -0,0 +1,51 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.harness import run
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic data in a rolled-back transaction and measure every GET "
+        "endpoint of the sales, warehouse and customers routers (queries, time, peak memory)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--factors", default="1,3",
+                            help="Comma-separated dataset scale factors, seeded cumulatively (default: 1,3)")
+        parser.add_argument("--page-size", type=int, action="append", dest="page_sizes",
+                            help="Page size for list endpoints (repeatable)")
+        parser.add_argument("--only", action="append", help="Only endpoints whose name contains this (repeatable)")
+        parser.add_argument("--json", dest="json_path", help="Write all measurements to this file")
+        parser.add_argument("--no-fail", action="store_true", help="Report budget violations without failing")
+
+    def handle(self, *args, **options):
+        try:
+            factors = tuple(float(f) for f in options["factors"].split(","))
+        except ValueError:
+            raise CommandError("--factors must be numbers, e.g. 1,3")
+        page_sizes = tuple(options["page_sizes"] or (None,))
+
+        results = run(factors=factors, page_sizes=page_sizes, only=options["only"])
+
+        last = [row for row in results if row["factor"] == factors[-1]]
+        self.stdout.write(f"{'endpoint':50} {'page':>5} {'http':>4} {'queries':>7} {'growth':>6} {'ms':>8} {'peak KB':>9}")
+        for row in last:
+            line = (
+                f"{row['endpoint']:50} {row['page_size'] or '-':>5} {row['status']:>4} "
+                f"{row['queries']:>7} {row['growth']:>+6} {row['ms']:>8} {row['peak_kb']:>9}"
+            )
+            self.stdout.write(self.style.ERROR(line) if row["violations"] else line)
+
+        if options["json_path"]:
+            with open(options["json_path"], "w") as fh:
+                json.dump(results, fh, indent=2)
+
+        failures = [row for row in results if row["violations"]]
+        for row in failures:
+            self.stderr.write(f"{row['endpoint']} (x{row['factor']}): {', '.join(row['violations'])}")
+        if failures and not options["no_fail"]:
+            raise CommandError(f"{len(failures)} measurement(s) over budget")
+        self.stdout.write(self.style.SUCCESS(f"{len(results)} measurement(s), all within budget")
+                          if not failures else f"{len(failures)} over budget")
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.fastlist import compare
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed synthetic data in a rolled-back transaction and time the product, material "
+        "and stock movement lists with and without the values()-based fast path."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--factor", type=float, default=3, help="Dataset scale factor (default: 3)")
+        parser.add_argument("--page-size", type=int, help="Page size for the list endpoints")
+        parser.add_argument("--repeat", type=int, default=5, help="Timed calls per variant, best kept (default: 5)")
+
+    def handle(self, *args, **options):
+        results = compare(factor=options["factor"], page_size=options["page_size"], repeat=options["repeat"])
+
+        self.stdout.write(f"{'endpoint':32} {'rows':>6} {'serializer ms':>13} {'fast ms':>8} {'speedup':>7}")
+        for row in results:
+            line = (
+                f"{row['endpoint']:32} {row['rows']:>6} {row['ms']:>13} "
+                f"{row['fast_ms']:>8} {row['speedup']:>6}x"
+            )
+            self.stdout.write(line if row["identical"] else self.style.ERROR(line + "  (different JSON)"))
+
+        different = [row["endpoint"] for row in results if not row["identical"]]
+        if different:
+            raise CommandError(f"fast path output differs for: {', '.join(different)}")
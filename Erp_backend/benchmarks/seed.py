@@ -0,0 +1,174 @@
+"""
+Jeux de données synthétiques pour le banc d'essai des endpoints.
+
+seed(**sizes) ajoute des données à la base courante (à appeler dans une
+transaction annulée ensuite, voir harness.run) ; plusieurs appels
+s'additionnent, ce qui permet de mesurer un endpoint à deux volumes.
+"""
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.utils import timezone
+
+from customers import models as crm
+from sales import models as sales
+from sales.models import bulk_create_lines, deferred_totals
+from warehouse import models as wh
+
+DEFAULT_SIZES = {
+    'customers': 20,
+    'products': 30,
+    'orders': 20,
+    'lines_per_order': 5,
+    'deliveries': 10,
+    'invoices': 15,
+    'payments_per_invoice': 2,
+    'quotes': 10,
+    'materials': 30,
+    'movements_per_material': 4,
+    'purchase_orders': 15,
+    'items_per_purchase_order': 4,
+}
+
+
+def scaled(factor, **overrides):
+    sizes = {key: max(1, int(value * factor)) for key, value in DEFAULT_SIZES.items()}
+    sizes.update(overrides)
+    return sizes
+
+
+def _tag():
+    return f'{timezone.now():%H%M%S%f}{random.randrange(1000):03d}'
+
+
+def seed_sales(rng, tag, customers, products, orders, lines_per_order, deliveries,
+               invoices, payments_per_invoice, quotes, **_):
+    sales_point = sales.SalesPoint.objects.create(name=f'Bench {tag}')
+    customer_objs = sales.Customer.objects.bulk_create([
+        sales.Customer(name=f'Client {tag}-{i}', email=f'c{i}-{tag}@example.com')
+        for i in range(customers)
+    ])
+    product_objs = sales.Product.objects.bulk_create([
+        sales.Product(
+            sku=f'SKU-{tag}-{i}', name=f'Produit {i}',
+            unit_price=Decimal(rng.randint(100, 10000)), stock_qty=Decimal('100000'),
+            tax_rate=Decimal('19.00'),
+        )
+        for i in range(products)
+    ])
+
+    def line_rows(n):
+        return [
+            dict(product=rng.choice(product_objs), quantity=Decimal(rng.randint(1, 5)),
+                 unit_price=None, tax_rate=None)
+            for _ in range(n)
+        ]
+
+    order_objs = []
+    with deferred_totals():
+        for i in range(orders):
+            order = sales.Order.objects.create(
+                customer=rng.choice(customer_objs), sales_point=sales_point,
+                status=sales.Order.Status.CONFIRMED,
+            )
+            bulk_create_lines(sales.OrderLine, order, line_rows(lines_per_order))
+            order_objs.append(order)
+
+        for i in range(quotes):
+            quote = sales.Quote.objects.create(customer=rng.choice(customer_objs), sales_point=sales_point)
+            bulk_create_lines(sales.QuoteLine, quote, line_rows(lines_per_order))
+
+        for i in range(invoices):
+            order = order_objs[i % len(order_objs)]
+            invoice = sales.Invoice.objects.create(
+                customer=order.customer, order=order, status=sales.Invoice.Status.ISSUED,
+                due_date=timezone.localdate() + timedelta(days=rng.randint(-60, 30)),
+            )
+            bulk_create_lines(sales.InvoiceLine, invoice, line_rows(lines_per_order))
+
+    invoice_objs = list(sales.Invoice.objects.filter(customer__in=customer_objs))
+    sales.Payment.objects.bulk_create([
+        sales.Payment(invoice=invoice, amount=Decimal(rng.randint(1, 50)), reference=f'P-{tag}')
+        for invoice in invoice_objs
+        for _ in range(payments_per_invoice)
+    ])
+    for invoice in invoice_objs:
+        invoice.recompute_totals()
+
+    for order in order_objs[:deliveries]:
+        note = sales.DeliveryNote.objects.create(order=order)
+        sales.DeliveryLine.objects.bulk_create([
+            sales.DeliveryLine(delivery=note, order_line=line, quantity=line.quantity)
+            for line in order.lines.all()
+        ])
+
+
+def seed_customers(rng, tag, customers, **_):
+    customer_objs = crm.Customer.objects.bulk_create([
+        crm.Customer(name=f'Client {tag}-{i}', email=f'crm{i}-{tag}@example.com')
+        for i in range(customers)
+    ])
+    crm.CustomerContact.objects.bulk_create([
+        crm.CustomerContact(customer=customer, name=f'Contact {j}', is_primary=not j)
+        for customer in customer_objs
+        for j in range(2)
+    ])
+
+
+def seed_warehouse(rng, tag, materials, movements_per_material, purchase_orders,
+                   items_per_purchase_order, **_):
+    categories = wh.Category.objects.bulk_create([
+        wh.Category(name=f'Catégorie {tag}-{i}') for i in range(max(1, materials // 10))
+    ])
+    suppliers = wh.Supplier.objects.bulk_create([
+        wh.Supplier(name=f'Fournisseur {tag}-{i}') for i in range(max(1, materials // 5))
+    ])
+    material_objs = wh.Material.objects.bulk_create([
+        wh.Material(
+            name=f'Matière {tag}-{i}', reference=f'MAT-{tag}-{i}',
+            category=rng.choice(categories + [None]), supplier=rng.choice(suppliers),
+            stock=Decimal(rng.randint(0, 500)), min_stock=Decimal(rng.randint(1, 100)),
+            unit='kg', price=Decimal(rng.randint(1, 200)),
+        )
+        for i in range(materials)
+    ])
+    movements = []
+    for material in material_objs:
+        stock = material.stock
+        for _ in range(movements_per_material):
+            quantity = Decimal(rng.randint(1, 20))
+            movements.append(wh.StockMovement(
+                material=material, movement_type='in', quantity=quantity,
+                previous_stock=stock, new_stock=stock + quantity,
+            ))
+            stock += quantity
+    wh.StockMovement.objects.bulk_create(movements)
+
+    orders = wh.PurchaseOrder.objects.bulk_create([
+        wh.PurchaseOrder(
+            order_number=f'PO-{tag}-{i}', supplier=rng.choice(suppliers),
+            status=rng.choice(['draft', 'sent', 'confirmed', 'received']),
+            order_date=timezone.localdate() - timedelta(days=rng.randint(0, 300)),
+        )
+        for i in range(purchase_orders)
+    ])
+    wh.PurchaseOrderItem.objects.bulk_create([
+        wh.PurchaseOrderItem(
+            purchase_order=order, material=rng.choice(material_objs),
+            quantity=Decimal(rng.randint(1, 50)), unit_price=Decimal(rng.randint(1, 200)),
+        )
+        for order in orders
+        for _ in range(items_per_purchase_order)
+    ])
+
+
+def seed(seed_value=0, **sizes):
+    """Ajoute un jeu de données de la taille demandée (DEFAULT_SIZES complété par sizes)."""
+    rng = random.Random(seed_value)
+    sizes = {**DEFAULT_SIZES, **sizes}
+    tag = _tag()
+    seed_sales(rng, tag, **sizes)
+    seed_customers(rng, tag, **sizes)
+    seed_warehouse(rng, tag, **sizes)
+    return sizes
@@ -0,0 +1,46 @@
+from django.core.cache import cache
+from django.test import TestCase
+
+from erp_api.fastlist import plan_for
+from sales.serializers import ProductSerializer
+from warehouse.serializers import MaterialListSerializer, StockMovementSerializer
+
+from .fastlist import compare
+from .harness import endpoints, run
+
+
+class EndpointBudgetTests(TestCase):
+    """Garde-fou N+1 : aucun endpoint GET ne doit dépasser son budget (voir budgets.py)"""
+
+    def test_every_router_is_covered(self):
+        names = {endpoint['name'] for endpoint in endpoints()}
+        for expected in ('sales:order-list', 'warehouse:material-detail', 'customers:customer-list'):
+            self.assertIn(expected, names)
+
+    def test_endpoints_within_budget(self):
+        results = run(factors=(1, 2), page_sizes=(None, 10))
+        failures = [
+            f"{row['endpoint']} (x{row['factor']}): {', '.join(row['violations'])}"
+            for row in results if row['violations']
+        ]
+        self.assertEqual(failures, [], '\n'.join(failures))
+
+    def test_configured_cache_left_untouched(self):
+        cache.set('bench-probe', 1)
+        self.addCleanup(cache.delete, 'bench-probe')
+        run(factors=(1,), only=('sales:order-list',))
+        self.assertEqual(cache.get('bench-probe'), 1)
+
+
+class FastListTests(TestCase):
+    """Le chemin rapide des listes (erp_api.fastlist) rend exactement le JSON des serializers"""
+
+    def test_list_serializers_are_supported(self):
+        for serializer_class in (ProductSerializer, MaterialListSerializer, StockMovementSerializer):
+            self.assertIsNotNone(plan_for(serializer_class), serializer_class.__name__)
+
+    def test_identical_output(self):
+        for page_size in (None, 7):
+            for row in compare(factor=1, page_size=page_size, repeat=1):
+                self.assertEqual(row['status'], (200, 200), row['endpoint'])
+                self.assertTrue(row['identical'], f"{row['endpoint']} (page_size={page_size})")
@@ -1,6 +1,15 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class CustomersConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'customers'
+
+    def ready(self):
+        from erp_api import search
+
+        search.register('customers.Customer', (
+            'name', 'email', 'phone', 'tax_id', 'billing_address', 'shipping_address',
+        ))
+        post_migrate.connect(search.ensure_indexes, sender=self)
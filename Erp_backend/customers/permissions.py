@@ -1,17 +1,19 @@
 from rest_framework import permissions
 
+from rbac.cache import granted
+
 def has_any(user, codes: list[str]) -> bool:
     if not getattr(user, "is_authenticated", False):
         return False
     if getattr(user, "is_superuser", False):
         return True
+    perms = []
     for code in codes:
-        if "." in code and user.has_perm(code):
-            return True
+        if "." in code:
+            perms.append(code)
         # Try both namespaces to match your existing style
-        if user.has_perm(f"rbac.{code}") or user.has_perm(f"customers.{code}"):
-            return True
-    return False
+        perms += [f"rbac.{code}", f"customers.{code}"]
+    return granted(user, perms)
 
 class CustomersPermission(permissions.BasePermission):
     ACTION_PERMS = {
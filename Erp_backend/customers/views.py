@@ -5,6 +5,9 @@ from django_filters.rest_framework import DjangoFilterBackend
 from django.db import transaction
 from django.db.models import Q
 
+from erp_api.pagination import KeysetPagination
+from erp_api.search import IndexedSearchFilter
+
 from .models import Customer, CustomerContact
 from .serializers import (
     CustomerSerializer, CustomerWriteSerializer,
@@ -15,7 +18,8 @@ from .permissions import CustomersPermission
 class CustomerViewSet(viewsets.ModelViewSet):
     queryset = Customer.objects.all().order_by("name").prefetch_related("contacts")
     permission_classes = [IsAuthenticated, CustomersPermission]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, filters.OrderingFilter]
     filterset_fields = ("is_active",)
     search_fields = ("name", "email", "phone", "tax_id", "billing_address", "shipping_address")
     ordering_fields = ("name", "created_at", "updated_at")
@@ -0,0 +1,120 @@
+"""
+Cache de résultats calculés (tableaux de bord, statistiques...).
+
+Chaque namespace a un numéro de version stocké dans le cache : les clés
+incluent la version, donc invalider un namespace = incrémenter sa version,
+sans avoir à connaître ni supprimer les clés existantes. Les anciennes
+entrées expirent d'elles-mêmes (TTL court).
+
+Les compteurs hits/misses sont tenus dans le même backend : globaux avec un
+cache partagé (Redis, Memcached), par process avec LocMemCache.
+
+Avec un cache par process (LocMemCache, le défaut), la version n'est
+incrémentée que dans le worker qui écrit : les autres servent leurs
+entrées jusqu'à expiration. Les TTL y sont donc plafonnés à
+RESULT_CACHE_LOCAL_MAX_TTL, quel que soit le TTL configuré.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULT_TTL = 30  # secondes
+DEFAULT_LOCAL_MAX_TTL = 30
+LOCAL_BACKENDS = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+_namespaces: set[str] = set()
+
+
+def shared() -> bool:
+    """True si le cache est commun à tous les workers (invalidate() vu de tous)"""
+    return settings.CACHES["default"]["BACKEND"] not in LOCAL_BACKENDS
+
+
+def ttl_for(namespace: str) -> int:
+    ttls = getattr(settings, "RESULT_CACHE_TTLS", {})
+    if namespace in ttls:
+        ttl = int(ttls[namespace])
+    else:
+        ttl = int(getattr(settings, "RESULT_CACHE_TTL", DEFAULT_TTL))
+    if not shared():
+        ttl = min(ttl, int(getattr(settings, "RESULT_CACHE_LOCAL_MAX_TTL", DEFAULT_LOCAL_MAX_TTL)))
+    return ttl
+
+
+def version(namespace: str) -> int:
+    """Version courante du namespace (change à chaque invalidate())"""
+    # Une version perdue (éviction) repart d'une valeur jamais utilisée
+    return cache.get_or_set(f"rc:{namespace}:v", time.time_ns, None)
+
+
+def _incr(key: str):
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # évincée entre add() et incr()
+        cache.set(key, 1, None)
+
+
+def get_or_compute(namespace: str, key: str, compute, ttl: int | None = None):
+    """Retourne le résultat en cache ou appelle compute() et le met en cache."""
+    _namespaces.add(namespace)
+    full_key = f"rc:{namespace}:{version(namespace)}:{key}"
+    value = cache.get(full_key)
+    if value is not None:
+        _incr(f"rc:{namespace}:hits")
+        return value
+
+    _incr(f"rc:{namespace}:misses")
+    value = compute()
+    cache.set(full_key, value, ttl_for(namespace) if ttl is None else ttl)
+    return value
+
+
+def invalidate(*namespaces: str):
+    """
+    Invalide les namespaces après le commit de la transaction en cours
+    (immédiatement hors transaction) : une lecture concurrente ne peut pas
+    remettre en cache des données d'avant le commit.
+    """
+    def bump():
+        for namespace in namespaces:
+            try:
+                cache.incr(f"rc:{namespace}:v")
+            except ValueError:
+                cache.set(f"rc:{namespace}:v", time.time_ns(), None)
+
+    transaction.on_commit(bump)
+
+
+def register(*namespaces: str):
+    """Déclare des namespaces pour qu'ils apparaissent dans metrics() avant le premier appel."""
+    _namespaces.update(namespaces)
+
+
+def metrics(namespaces=None) -> dict:
+    names = sorted(namespaces or _namespaces)
+    keys = [f"rc:{n}:{kind}" for n in names for kind in ("hits", "misses")]
+    values = cache.get_many(keys)
+    result = {}
+    for name in names:
+        hits = values.get(f"rc:{name}:hits", 0)
+        misses = values.get(f"rc:{name}:misses", 0)
+        total = hits + misses
+        result[name] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / total, 4) if total else None,
+            "ttl": ttl_for(name),
+        }
+    return result
+
+
+def reset_metrics(namespaces=None):
+    names = namespaces or _namespaces
+    cache.delete_many([f"rc:{n}:{kind}" for n in names for kind in ("hits", "misses")])
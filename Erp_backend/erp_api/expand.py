@@ -0,0 +1,116 @@
+"""
+Champs à la demande pour les serializers de lecture : ?fields= et ?expand=.
+
+Sans aucun de ces paramètres, la réponse est inchangée (tous les champs, y
+compris les objets imbriqués). Dès qu'un des deux est présent :
+
+- les champs listés dans Meta.expandable_fields (lignes, détails client...)
+  ne sont inclus que s'ils sont demandés dans ?expand= ou ?fields= ;
+- ?fields= restreint en plus la réponse aux champs listés.
+
+Les chemins pointés s'appliquent aux objets imbriqués :
+?fields=id,code,lines.quantity&expand=lines.product_detail
+
+Les viewsets consultent selection_includes() pour ne précharger
+(select/prefetch_related) que ce qui sera sérialisé.
+"""
+from rest_framework import serializers
+
+FIELDS_PARAM = 'fields'
+EXPAND_PARAM = 'expand'
+
+
+def _parse(value):
+    """'a,b.c,b.d' -> {'a': {}, 'b': {'c': {}, 'd': {}}}"""
+    tree = {}
+    for path in (value or '').split(','):
+        node = tree
+        for part in filter(None, path.strip().split('.')):
+            node = node.setdefault(part, {})
+    return tree
+
+
+def request_selection(request):
+    """(fields, expand) demandés, ou None si la requête ne restreint rien"""
+    if request is None:
+        return None
+    params = request.query_params
+    if FIELDS_PARAM not in params and EXPAND_PARAM not in params:
+        return None
+    return _parse(params.get(FIELDS_PARAM)), _parse(params.get(EXPAND_PARAM))
+
+
+def selection_includes(request, path):
+    """True si l'objet imbriqué `path` ('lines.product_detail') sera sérialisé"""
+    selection = request_selection(request)
+    for part in path.split('.'):
+        if selection is None:
+            return True
+        fields, expand = selection
+        if part not in fields and part not in expand:
+            return False
+        selection = fields.get(part, {}), expand.get(part, {})
+    return True
+
+
+class ExpandableFieldsMixin:
+    """
+    À combiner avec un ModelSerializer de lecture. Meta.expandable_fields :
+    noms des champs coûteux (objets imbriqués), omis sauf demande explicite
+    dès que la requête porte ?fields= ou ?expand=.
+    """
+
+    def _selection(self):
+        if hasattr(self, '_expand_selection'):
+            return self._expand_selection
+        root = self.parent.parent if isinstance(self.parent, serializers.ListSerializer) else self.parent
+        if root is not None:
+            return None
+        return request_selection(self.context.get('request'))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self._selection()
+        if selection is None:
+            return fields
+
+        only, expand = selection
+        expandable = set(getattr(self.Meta, 'expandable_fields', ()))
+        for name in list(fields):
+            if name in expand or name in only:
+                pass
+            elif only or name in expandable:
+                del fields[name]
+                continue
+            nested = fields[name]
+            if isinstance(nested, serializers.ListSerializer):
+                nested = nested.child
+            if isinstance(nested, ExpandableFieldsMixin):
+                nested._expand_selection = (only.get(name, {}), expand.get(name, {}))
+        return fields
+
+
+class ExpandableQuerysetMixin:
+    """
+    Viewset : select/prefetch_related conditionnés aux champs demandés.
+    expand_select_related / expand_prefetch_related : {chemin sérialisé: lookup}.
+    """
+    expand_select_related = {}
+    expand_prefetch_related = {}
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        request = getattr(self, 'request', None)
+        select = [
+            lookup for path, lookup in self.expand_select_related.items()
+            if selection_includes(request, path)
+        ]
+        prefetch = [
+            lookup for path, lookup in self.expand_prefetch_related.items()
+            if selection_includes(request, path)
+        ]
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
@@ -0,0 +1,213 @@
+"""
+Lecture rapide des listes : réponses construites directement depuis
+.values(), sans instancier de modèle ni parcourir le serializer ligne à ligne.
+
+Un plan est compilé une fois par classe de serializer : pour chaque champ,
+la colonne à lire (une source pointée 'material.name' devient la jointure
+'material__name') et le field DRF dont to_representation() formate la
+valeur, d'où un JSON identique à celui du serializer (mêmes clés, même
+ordre, même traitement des relations nulles). Les propriétés du modèle
+(is_low_stock, total_value...) sont évaluées sur un objet léger qui porte
+les colonnes locales : elles ne doivent lire que des champs du modèle.
+
+Un serializer contenant un champ non pris en charge (serializer imbriqué,
+SerializerMethodField, relation multiple, source='*'...) garde le chemin
+habituel. FAST_LIST_ENABLED = False désactive le tout.
+"""
+import inspect
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models
+from django.utils.functional import cached_property
+from rest_framework import serializers
+from rest_framework.fields import empty, is_simple_callable
+from rest_framework.relations import PKOnlyObject
+from rest_framework.response import Response
+
+from .expand import ExpandableFieldsMixin, request_selection
+
+VALUE, PK, ATTRIBUTE = 'value', 'pk', 'attribute'
+SKIP = object()
+
+_plans = {}
+
+
+class Unsupported(Exception):
+    """Champ que le plan ne sait pas lire depuis .values()"""
+
+
+def _model_attributes(model):
+    """Propriétés et méthodes déclarées sur le modèle (et ses parents abstraits)"""
+    attributes = {}
+    for klass in reversed(model.__mro__):
+        if not issubclass(klass, models.Model) or klass is models.Model:
+            continue
+        for name, value in vars(klass).items():
+            if name.startswith('__'):
+                continue
+            if isinstance(value, (property, cached_property)) or inspect.isfunction(value):
+                attributes[name] = value
+    return attributes
+
+
+def _row_class(model):
+    """Classe légère portant les propriétés du modèle ; attributs = colonnes locales"""
+    def __init__(self, values):
+        self.__dict__.update(values)
+
+    return type(f'{model.__name__}Row', (), {**_model_attributes(model), '__init__': __init__})
+
+
+class FieldPlan:
+    """Lecture d'un serializer de liste depuis queryset.values()"""
+
+    def __init__(self, serializer_class):
+        serializer = serializer_class(context={})
+        self.model = serializer.Meta.model
+        self.attributes = _model_attributes(self.model)
+        self.entries = []
+        self.columns = {self.model._meta.pk.attname}
+
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            self.entries.append(self.compile_field(name, field))
+
+        self.row_class = None
+        if any(entry[1] == ATTRIBUTE for entry in self.entries):
+            self.row_class = _row_class(self.model)
+            self.columns.update(f.attname for f in self.model._meta.concrete_fields)
+
+    # -------- compilation --------
+    def compile_field(self, name, field):
+        """(nom, type, colonne ou attribut, field, colonnes des FK nullables traversées, repli)"""
+        if (
+            isinstance(field, (serializers.BaseSerializer, serializers.SerializerMethodField,
+                               serializers.HiddenField, serializers.ManyRelatedField))
+            or field.source == '*'
+        ):
+            raise Unsupported(name)
+
+        if isinstance(field, serializers.RelatedField):
+            if not isinstance(field, serializers.PrimaryKeyRelatedField) or len(field.source_attrs) != 1:
+                raise Unsupported(name)
+            model_field = self._get_field(self.model, field.source_attrs[0], name)
+            if not (model_field.many_to_one or model_field.one_to_one):
+                raise Unsupported(name)
+            self.columns.add(model_field.attname)
+            return name, PK, model_field.attname, field, (), None
+
+        model, lookups, guards = self.model, [], []
+        for i, attr in enumerate(field.source_attrs):
+            try:
+                model_field = model._meta.get_field(attr)
+            except FieldDoesNotExist:
+                if len(field.source_attrs) == 1 and attr in self.attributes:
+                    return name, ATTRIBUTE, attr, field, (), None
+                raise Unsupported(name)
+            if not model_field.concrete or model_field.many_to_many:
+                raise Unsupported(name)
+            lookups.append(attr)
+            if model_field.is_relation:
+                if i == len(field.source_attrs) - 1:
+                    raise Unsupported(name)  # objet lié entier
+                if model_field.null:
+                    guards.append('__'.join(lookups))
+                model = model_field.related_model
+
+        # relation nulle en chemin : même repli que Field.get_attribute()
+        fallback = None
+        if guards:
+            if field.default is not empty:
+                fallback = field.get_default
+            elif not field.allow_null:
+                if field.required:
+                    raise Unsupported(name)
+                fallback = SKIP
+        column = '__'.join(lookups)
+        self.columns.add(column)
+        self.columns.update(guards)
+        return name, VALUE, column, field, tuple(guards), fallback
+
+    @staticmethod
+    def _get_field(model, attr, name):
+        try:
+            return model._meta.get_field(attr)
+        except FieldDoesNotExist:
+            raise Unsupported(name)
+
+    # -------- lecture --------
+    def values(self, queryset, extra=()):
+        """queryset.values() des colonnes du plan (et des clés de tri, pour la pagination)"""
+        ordering = queryset.query.order_by or queryset.model._meta.ordering or ()
+        keys = {o.lstrip('-') for o in ordering if isinstance(o, str)} - {'pk', '?'}
+        return queryset.values(*sorted(self.columns | keys | set(extra)))
+
+    def render(self, rows):
+        data = []
+        row_class = self.row_class
+        for row in rows:
+            instance = row_class(row) if row_class is not None else None
+            item = {}
+            for name, kind, key, field, guards, fallback in self.entries:
+                if kind == ATTRIBUTE:
+                    value = getattr(instance, key)
+                    if is_simple_callable(value):
+                        value = value()
+                elif guards and any(row[guard] is None for guard in guards):
+                    if fallback is SKIP:
+                        continue
+                    value = fallback() if fallback is not None else None
+                else:
+                    value = row[key]
+
+                if value is None:
+                    item[name] = None
+                elif kind == PK:
+                    item[name] = field.to_representation(PKOnlyObject(value))
+                else:
+                    item[name] = field.to_representation(value)
+            data.append(item)
+        return data
+
+
+def plan_for(serializer_class):
+    """Plan compilé (mis en cache) ou None si le serializer n'est pas pris en charge"""
+    try:
+        return _plans[serializer_class]
+    except KeyError:
+        pass
+    try:
+        plan = FieldPlan(serializer_class)
+    except Unsupported:
+        plan = None
+    _plans[serializer_class] = plan
+    return plan
+
+
+class FastListMixin:
+    """
+    Viewset : list() lue par le plan du serializer de liste quand c'est
+    possible, sinon le chemin DRF habituel. Filtres, tri et pagination
+    (KeysetPagination accepte les lignes dict) s'appliquent inchangés.
+    """
+
+    def get_fast_list_plan(self):
+        if not getattr(settings, 'FAST_LIST_ENABLED', True):
+            return None
+        serializer_class = self.get_serializer_class()
+        if issubclass(serializer_class, ExpandableFieldsMixin) and request_selection(self.request) is not None:
+            return None
+        return plan_for(serializer_class)
+
+    def list(self, request, *args, **kwargs):
+        plan = self.get_fast_list_plan()
+        if plan is None:
+            return super().list(request, *args, **kwargs)
+
+        queryset = plan.values(self.filter_queryset(self.get_queryset()))
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(queryset))
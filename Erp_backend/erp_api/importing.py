@@ -0,0 +1,164 @@
+"""
+Outils communs aux imports en masse (catalogue produits, matières...).
+
+read_rows() lit un fichier CSV ou JSON ligne à ligne (dicts, cellules vides
+omises : le champ garde sa valeur actuelle ou son défaut) ; batched() découpe
+en paquets ; ImportReport compte créations / mises à jour et garde les
+erreurs ligne par ligne sans interrompre l'import.
+
+request_rows() et ImportCommand partagent la lecture d'un import entre les
+actions import/ des viewsets et les commandes manage.py import_*.
+"""
+import csv
+import io
+import json
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+
+DEFAULT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+
+
+class ImportFormatError(ValueError):
+    """Fichier illisible (format inconnu, JSON invalide...)"""
+
+
+def detect_format(name='', content_type=''):
+    name, content_type = (name or '').lower(), (content_type or '').lower()
+    if name.endswith('.json') or 'json' in content_type:
+        return 'json'
+    if name.endswith('.csv') or 'csv' in content_type or 'text/plain' in content_type:
+        return 'csv'
+    raise ImportFormatError('Format de fichier inconnu : CSV ou JSON attendu.')
+
+
+def read_rows(stream, fmt):
+    """Dicts d'un flux binaire ou texte ; JSON : liste d'objets ou {"rows": [...]}"""
+    if isinstance(stream, (bytes, str)):
+        stream = io.BytesIO(stream.encode() if isinstance(stream, str) else stream)
+    if fmt == 'csv':
+        text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='') if not isinstance(stream, io.TextIOBase) else stream
+        for row in csv.DictReader(text):
+            yield {key.strip(): value.strip() for key, value in row.items() if key and value not in (None, '')}
+        return
+    if fmt == 'json':
+        try:
+            data = json.load(stream)
+        except ValueError as exc:
+            raise ImportFormatError(f'JSON invalide : {exc}')
+        if isinstance(data, dict):
+            data = data.get('rows')
+        if not isinstance(data, list):
+            raise ImportFormatError('JSON : liste d\'objets ou {"rows": [...]} attendu.')
+        for row in data:
+            yield row if isinstance(row, dict) else {}
+        return
+    raise ImportFormatError(f'Format inconnu : {fmt}.')
+
+
+def request_rows(request):
+    """Lignes d'une requête d'import : fichier multipart "file", liste JSON ou {"rows": [...]}"""
+    upload = request.FILES.get('file')
+    if upload is not None:
+        return read_rows(upload, detect_format(upload.name, upload.content_type))
+    rows = request.data.get('rows') if isinstance(request.data, dict) else request.data
+    if not isinstance(rows, list):
+        raise ImportFormatError('Fichier "file", liste JSON ou {"rows": [...]} attendu.')
+    # comme read_rows : un élément qui n'est pas un objet est une ligne vide, signalée en erreur
+    return [row if isinstance(row, dict) else {} for row in rows]
+
+
+def is_dry_run(request):
+    return request.query_params.get('dry_run', '').lower() in ('1', 'true', 'yes')
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def flatten_errors(detail):
+    """ValidationError.detail DRF -> {champ: 'message; message'}"""
+    if isinstance(detail, dict):
+        return {
+            key: '; '.join(str(m) for m in (value if isinstance(value, list) else [value]))
+            for key, value in detail.items()
+        }
+    return {'non_field_errors': '; '.join(str(m) for m in detail)}
+
+
+class ImportReport:
+    def __init__(self, dry_run=False):
+        self.dry_run = dry_run
+        self.total = 0
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, row, key, errors):
+        """row : numéro de ligne de données (1 = première), key : identifiant métier"""
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'key': key, 'errors': errors})
+
+    def mark(self):
+        """Position du rapport avant un paquet (voir fail_batch)"""
+        return self.failed, len(self.errors)
+
+    def fail_batch(self, mark, batch, key, exc):
+        """
+        Paquet annulé par une erreur de base (verrou, interblocage...) : ses
+        erreurs déjà signalées depuis `mark` sont remplacées par une erreur
+        sur chacune de ses lignes. batch : (numéro, ligne) ; key(ligne).
+        """
+        self.failed, count = mark
+        del self.errors[count:]
+        for number, row in batch:
+            self.error(number, key(row), {'non_field_errors': str(exc)})
+
+    def as_dict(self):
+        return {
+            'dry_run': self.dry_run,
+            'total': self.total,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+class ImportCommand(BaseCommand):
+    """Commande manage.py d'import : importer(rows, batch_size=, dry_run=, created_by=) -> ImportReport"""
+    importer = None
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON file')
+        parser.add_argument('--format', choices=('csv', 'json'), help='Default: from the file extension')
+        parser.add_argument('--batch-size', type=int)
+        parser.add_argument('--dry-run', action='store_true', help='Validate only, write nothing')
+        parser.add_argument('--errors', dest='errors_path', help='Write the per-row error report (JSON) to this file')
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options['format'] or detect_format(options['path'])
+            with open(options['path'], 'rb') as fh:
+                report = type(self).importer(
+                    read_rows(fh, fmt), batch_size=options['batch_size'], dry_run=options['dry_run'],
+                    created_by=self.__module__.rsplit('.', 1)[-1],  # nom de la commande
+                )
+        except (OSError, ImportFormatError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report.errors[:20]:
+            self.stderr.write(f"row {error['row']} ({error['key']}): {error['errors']}")
+        if options['errors_path']:
+            with open(options['errors_path'], 'w') as fh:
+                json.dump(report.errors, fh, indent=2, ensure_ascii=False)
+        summary = (
+            f'{report.total} row(s): {report.created} created, {report.updated} updated, {report.failed} failed'
+            + (' (dry run)' if report.dry_run else '')
+        )
+        self.stdout.write(self.style.SUCCESS(summary) if not report.failed else self.style.WARNING(summary))
@@ -0,0 +1,235 @@
+"""
+Pagination par curseur (keyset) pour les grandes listes.
+
+La page suivante est lue avec un filtre sur les clés de tri de la dernière
+ligne (ex: created_at < x OR (created_at = x AND id < y)) au lieu d'un
+OFFSET : le coût reste celui d'une page, même loin dans l'historique. Le tri
+est celui de la requête (?ordering=... de OrderingFilter ou Meta.ordering),
+complété par la clé primaire pour départager les égalités.
+
+Activée par ?page_size= ou ?cursor= (les clients existants reçoivent encore
+la liste complète), ou pour toutes les requêtes avec PAGINATION_REQUIRED.
+?count=true ajoute le total (un COUNT en plus).
+
+Un tri sur un champ nullable ou calculé ne peut pas servir de clé : le
+curseur porte alors un simple décalage.
+"""
+import base64
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+DEFAULT_PAGE_SIZE = 50
+DEFAULT_MAX_PAGE_SIZE = 500
+
+
+def _resolve_field(model, path):
+    """
+    (champ, nullable) au bout d'un chemin 'customer__name' ; nullable si un
+    des champs traversés l'est. (None, True) pour une annotation.
+    """
+    field, nullable = None, False
+    for part in path.split('__'):
+        try:
+            field = model._meta.pk if part == 'pk' else model._meta.get_field(part)
+        except FieldDoesNotExist:
+            return None, True
+        if not field.concrete:
+            return None, True
+        nullable = nullable or field.null
+        if field.is_relation:
+            model = field.related_model
+    return field, nullable
+
+
+class KeysetPagination(BasePagination):
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+
+    def __init__(self):
+        self.page_size = getattr(settings, 'PAGINATION_PAGE_SIZE', DEFAULT_PAGE_SIZE)
+        self.max_page_size = getattr(settings, 'PAGINATION_MAX_PAGE_SIZE', DEFAULT_MAX_PAGE_SIZE)
+        self.required = getattr(settings, 'PAGINATION_REQUIRED', False)
+
+    # -------- paramètres --------
+    def is_requested(self, request):
+        params = request.query_params
+        return self.required or self.cursor_query_param in params or self.page_size_query_param in params
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get(self.page_size_query_param, self.page_size))
+        except ValueError:
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    # -------- clés de tri --------
+    def get_ordering(self, queryset):
+        """Clés de tri de la requête + pk ; None si le tri contient des expressions"""
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering or [])
+        if not all(isinstance(o, str) for o in ordering):
+            return None
+        names = {o.lstrip('-') for o in ordering}
+        if not names & {'pk', 'id', queryset.model._meta.pk.name}:
+            descending = ordering[0].startswith('-') if ordering else False
+            ordering.append('-pk' if descending else 'pk')
+        return ordering
+
+    def keyset_usable(self, model, ordering):
+        if ordering is None:
+            return False
+        for key in ordering:
+            field, nullable = _resolve_field(model, key.lstrip('-'))
+            if field is None or nullable:
+                return False
+        return True
+
+    @staticmethod
+    def key_value(row, key):
+        name = key.lstrip('-')
+        if isinstance(row, dict):
+            return row['id' if name == 'pk' else name]
+        value = row
+        for part in name.split('__'):
+            value = getattr(value, part)
+        return value
+
+    # -------- curseur --------
+    def encode_cursor(self, payload):
+        raw = json.dumps(payload, separators=(',', ':'), default=str).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded + '=' * (-len(encoded) % 4))
+            payload = json.loads(raw)
+            if not isinstance(payload, dict):
+                raise ValueError
+            return payload
+        except (TypeError, ValueError):
+            raise NotFound('Curseur invalide.')
+
+    def keyset_filter(self, model, ordering, values, backwards):
+        """WHERE k1 (<|>)= v1 AND (k1 (<|>) v1 OR (k1 = v1 AND k2 (<|>) v2) ...)"""
+        try:
+            values = [
+                _resolve_field(model, key.lstrip('-'))[0].to_python(value)
+                for key, value in zip(ordering, values, strict=True)
+            ]
+        except (TypeError, ValueError, ValidationError):
+            raise NotFound('Curseur invalide.')
+
+        def op(key, strict=True):
+            after = key.startswith('-') == backwards  # True : valeurs croissantes
+            return ('gt' if after else 'lt') + ('' if strict else 'e')
+
+        disjunction = Q()
+        for i, key in enumerate(ordering):
+            equal = {k.lstrip('-'): v for k, v in zip(ordering[:i], values[:i])}
+            disjunction |= Q(**equal, **{f'{key.lstrip("-")}__{op(key)}': values[i]})
+        first = ordering[0]
+        return Q(**{f'{first.lstrip("-")}__{op(first, strict=False)}': values[0]}) & disjunction
+
+    # -------- pagination --------
+    def paginate_queryset(self, queryset, request, view=None):
+        if not self.is_requested(request):
+            return None
+
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.count = queryset.count() if self._wants_count(request) else None
+        ordering = self.get_ordering(queryset)
+        cursor = self.decode_cursor(request) or {}
+        backwards = bool(cursor.get('r'))
+        self.keyset = self.keyset_usable(queryset.model, ordering)
+
+        if self.keyset:
+            self.ordering = ordering
+            if backwards:
+                ordering = [o[1:] if o.startswith('-') else f'-{o}' for o in ordering]
+            queryset = queryset.order_by(*ordering)
+            if 'v' in cursor:
+                queryset = queryset.filter(
+                    self.keyset_filter(queryset.model, self.ordering, cursor['v'], backwards)
+                )
+            rows = list(queryset[:self.page_size + 1])
+        else:
+            if ordering is not None:
+                queryset = queryset.order_by(*ordering)
+            try:
+                self.offset = max(0, int(cursor.get('o', 0)))
+            except (TypeError, ValueError):
+                raise NotFound('Curseur invalide.')
+            rows = list(queryset[self.offset:self.offset + self.page_size + 1])
+
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if self.keyset and backwards:
+            rows.reverse()
+            self.has_next, self.has_previous = bool(cursor), has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = bool(cursor) if self.keyset else self.offset > 0
+        self.page = rows
+        return rows
+
+    def _wants_count(self, request):
+        return request.query_params.get(self.count_query_param, '').lower() in ('1', 'true', 'yes')
+
+    def _link(self, payload):
+        url = self.request.build_absolute_uri()
+        if payload is None:
+            return remove_query_param(url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, self.encode_cursor(payload))
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        if not self.keyset:
+            return self._link({'o': self.offset + self.page_size})
+        if not self.page:
+            return None
+        last = self.page[-1]
+        return self._link({'v': [self.key_value(last, key) for key in self.ordering]})
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.keyset:
+            offset = max(0, self.offset - self.page_size)
+            return self._link({'o': offset} if offset else None)
+        if not self.page:
+            return None
+        first = self.page[0]
+        return self._link({'v': [self.key_value(first, key) for key in self.ordering], 'r': 1})
+
+    def get_paginated_response(self, data):
+        body = OrderedDict()
+        if self.count is not None:
+            body['count'] = self.count
+        body['next'] = self.get_next_link()
+        body['previous'] = self.get_previous_link()
+        body['results'] = data
+        return Response(body)
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'count': {'type': 'integer'},
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
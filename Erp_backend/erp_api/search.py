@@ -0,0 +1,300 @@
+"""
+Recherche indexée pour ?search= (SearchFilter) sur les grandes tables.
+
+Les modèles déclarés avec register() reçoivent un index plein texte selon le
+moteur de base de données :
+
+- SQLite : table virtuelle FTS5 (tokenizer trigram, SQLite >= 3.34) en
+  « external content » sur la table du modèle, tenue à jour par des
+  triggers (insert / update des colonnes indexées / delete), donc aussi
+  pour bulk_create() et update(). La clé est le rowid implicite de la table
+  (les clés UUID ne peuvent pas en servir) : après un VACUUM, lancer
+  manage.py rebuild_search_index ;
+- PostgreSQL : extension pg_trgm et index GIN sur l'expression des colonnes.
+
+L'index est créé (ou complété puis reconstruit) à chaque migrate par
+post_migrate : une reconstruction de table par une migration SQLite fait
+disparaître les triggers, ils sont recréés au migrate suivant.
+
+IndexedSearchFilter remplace SearchFilter : quand les search_fields de la vue
+sont exactement les colonnes d'un index disponible, les termes d'au moins
+MIN_TERM_LENGTH caractères passent par l'index et les résultats sont triés
+par pertinence (sauf ?ordering=) ; les termes plus courts, les termes trop
+fréquents (SEARCH_RANK_LIMIT), les autres vues et les autres moteurs gardent
+le filtre icontains habituel.
+"""
+import logging
+import operator
+from functools import reduce
+
+from django.apps import apps
+from django.conf import settings
+from django.db import DatabaseError, connections, models
+from django.db.models.expressions import RawSQL
+from rest_framework import filters
+
+logger = logging.getLogger(__name__)
+
+MIN_TERM_LENGTH = 3  # un trigramme
+DEFAULT_RANK_LIMIT = 1000
+
+_indexes = []
+_available = {}
+
+
+class SearchIndex:
+    def __init__(self, model_label, fields):
+        self.model_label = model_label
+        self.fields = tuple(fields)
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    @property
+    def table(self):
+        return f'{self.model._meta.db_table}_search'
+
+    def columns(self):
+        opts = self.model._meta
+        return [opts.get_field(name).column for name in self.fields]
+
+    def backend(self, connection):
+        return BACKENDS.get(connection.vendor)
+
+    # -------- installation --------
+    def ensure(self, using='default'):
+        """Crée ce qui manque (table, triggers, index) ; True si l'index est utilisable"""
+        connection = connections[using]
+        backend = self.backend(connection)
+        if backend is None:
+            return False
+        try:
+            backend.ensure(self, connection)
+        except DatabaseError as exc:
+            logger.warning('Index de recherche %s non installé : %s', self.table, exc)
+            _available[using, self.table] = False
+            return False
+        _available[using, self.table] = True
+        return True
+
+    def rebuild(self, using='default'):
+        connection = connections[using]
+        backend = self.backend(connection)
+        if backend is not None and self.ensure(using):
+            backend.rebuild(self, connection)
+
+    def is_available(self, using):
+        key = using, self.table
+        if key not in _available:
+            connection = connections[using]
+            backend = self.backend(connection)
+            _available[key] = backend is not None and backend.is_installed(self, connection)
+        return _available[key]
+
+    # -------- recherche --------
+    def search(self, queryset, terms):
+        """
+        queryset restreint aux lignes contenant tous les termes, trié par
+        pertinence ; None si plus de SEARCH_RANK_LIMIT lignes correspondent
+        (terme trop fréquent : classer toutes les lignes coûte plus cher que
+        le LIKE habituel, qui s'arrête dès la page remplie).
+        """
+        connection = connections[queryset.db]
+        backend = self.backend(connection)
+        limit = getattr(settings, 'SEARCH_RANK_LIMIT', DEFAULT_RANK_LIMIT)
+        if backend.count_matches(self, connection, terms, limit + 1) > limit:
+            return None
+        return backend.search(self, queryset, terms).order_by(backend.rank_ordering)
+
+
+class SQLiteFTS5:
+    """FTS5 trigram en external content ; rank (bm25) croissant = plus pertinent"""
+    rank_ordering = 'search_rank'
+
+    @staticmethod
+    def _names(index, connection):
+        qn = connection.ops.quote_name
+        return qn(index.table), qn(index.model._meta.db_table), [qn(c) for c in index.columns()]
+
+    def _statements(self, index, connection):
+        # clé : rowid implicite de la table (les clés primaires UUID ne peuvent pas servir de rowid FTS)
+        fts, table, cols = self._names(index, connection)
+        name = index.table
+        col_list = ', '.join(cols)
+        new = ', '.join(f'new.{c}' for c in cols)
+        old = ', '.join(f'old.{c}' for c in cols)
+        delete = f"INSERT INTO {fts}({fts}, rowid, {col_list}) VALUES ('delete', old.rowid, {old});"
+        insert = f'INSERT INTO {fts}(rowid, {col_list}) VALUES (new.rowid, {new});'
+        return {
+            name: (
+                f'CREATE VIRTUAL TABLE {fts} USING fts5({col_list}, '
+                f"content={table}, content_rowid=rowid, tokenize='trigram')"
+            ),
+            f'{name}_ai': f'CREATE TRIGGER "{name}_ai" AFTER INSERT ON {table} BEGIN {insert} END',
+            f'{name}_ad': f'CREATE TRIGGER "{name}_ad" AFTER DELETE ON {table} BEGIN {delete} END',
+            f'{name}_au': (
+                f'CREATE TRIGGER "{name}_au" AFTER UPDATE OF {col_list} ON {table} '
+                f'BEGIN {delete} {insert} END'
+            ),
+        }
+
+    @staticmethod
+    def _existing(names, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT name FROM sqlite_master WHERE name IN ({', '.join(['%s'] * len(names))})",
+                list(names),
+            )
+            return {row[0] for row in cursor.fetchall()}
+
+    def is_installed(self, index, connection):
+        names = set(self._statements(index, connection))
+        return names == self._existing(names, connection)
+
+    def ensure(self, index, connection):
+        statements = self._statements(index, connection)
+        existing = self._existing(statements, connection)
+        missing = [sql for name, sql in statements.items() if name not in existing]
+        if not missing:
+            return
+        with connection.cursor() as cursor:
+            for sql in missing:
+                cursor.execute(sql)
+        self.rebuild(index, connection)
+
+    def rebuild(self, index, connection):
+        fts = connection.ops.quote_name(index.table)
+        with connection.cursor() as cursor:
+            cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+    @staticmethod
+    def _match(terms):
+        return ' AND '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+    def count_matches(self, index, connection, terms, limit):
+        fts = connection.ops.quote_name(index.table)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT count(*) FROM (SELECT 1 FROM {fts} WHERE {fts} MATCH %s LIMIT %s)',
+                [self._match(terms), limit],
+            )
+            return cursor.fetchone()[0]
+
+    def search(self, index, queryset, terms):
+        fts, table, _ = self._names(index, connections[queryset.db])
+        match = self._match(terms)
+        # jointure sur la table FTS : MATCH évalué une fois, puis accès par rowid
+        return queryset.extra(
+            tables=[index.table],
+            where=[f'{fts} MATCH %s', f'{fts}.rowid = {table}.rowid'],
+            params=[match],
+            select={'search_rank': f'{fts}.rank'},
+        )
+
+
+class PostgresTrigram:
+    """pg_trgm : LIKE '%terme%' servi par l'index GIN, tri par similarity() décroissante"""
+    rank_ordering = '-search_rank'
+
+    @staticmethod
+    def _expression(index, connection, qualified):
+        qn = connection.ops.quote_name
+        prefix = f'{qn(index.model._meta.db_table)}.' if qualified else ''
+        parts = " || ' ' || ".join(f"coalesce({prefix}{qn(c)}::text, '')" for c in index.columns())
+        return f'lower({parts})'
+
+    def is_installed(self, index, connection):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1 FROM pg_indexes WHERE indexname = %s', [f'{index.table}_trgm'])
+            return cursor.fetchone() is not None
+
+    def ensure(self, index, connection):
+        qn = connection.ops.quote_name
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {qn(index.table + "_trgm")} '
+                f'ON {qn(index.model._meta.db_table)} '
+                f'USING gin (({self._expression(index, connection, False)}) gin_trgm_ops)'
+            )
+
+    def rebuild(self, index, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f'REINDEX INDEX {connection.ops.quote_name(index.table + "_trgm")}')
+
+    def count_matches(self, index, connection, terms, limit):
+        model = index.model
+        return self._filter(index, model._default_manager.using(connection.alias), terms)[:limit].count()
+
+    def _filter(self, index, queryset, terms):
+        expression = self._expression(index, connections[queryset.db], True)
+        for term in terms:
+            pattern = '%{}%'.format(term.lower().replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_'))
+            queryset = queryset.filter(RawSQL(f'{expression} LIKE %s', [pattern], output_field=models.BooleanField()))
+        return queryset
+
+    def search(self, index, queryset, terms):
+        expression = self._expression(index, connections[queryset.db], True)
+        return self._filter(index, queryset, terms).annotate(
+            search_rank=RawSQL(f'similarity({expression}, %s)', [' '.join(terms).lower()],
+                               output_field=models.FloatField()),
+        )
+
+
+BACKENDS = {
+    'sqlite': SQLiteFTS5(),
+    'postgresql': PostgresTrigram(),
+}
+
+
+def register(model_label, fields):
+    """Déclare un index ('app.Model', champs texte) ; à appeler depuis AppConfig.ready()"""
+    index = SearchIndex(model_label, fields)
+    _indexes.append(index)
+    return index
+
+
+def index_for(model, fields):
+    for index in _indexes:
+        if index.model is model and set(index.fields) == set(fields):
+            return index
+    return None
+
+
+def registered(app_label=None):
+    return [i for i in _indexes if app_label is None or i.model_label.split('.')[0] == app_label]
+
+
+def ensure_indexes(sender, using='default', **kwargs):
+    """post_migrate : installe les index de l'application migrée"""
+    for index in registered(sender.label):
+        index.ensure(using)
+
+
+class IndexedSearchFilter(filters.SearchFilter):
+
+    def filter_queryset(self, request, queryset, view):
+        search_fields = self.get_search_fields(view, request)
+        search_terms = self.get_search_terms(request)
+        if not search_fields or not search_terms:
+            return queryset
+
+        index = index_for(queryset.model, search_fields)
+        if index is None or not index.is_available(queryset.db):
+            return super().filter_queryset(request, queryset, view)
+
+        indexed = [t for t in search_terms if len(t) >= MIN_TERM_LENGTH]
+        short = [t for t in search_terms if len(t) < MIN_TERM_LENGTH]
+        if indexed:
+            matches = index.search(queryset, indexed)
+            if matches is None:
+                return super().filter_queryset(request, queryset, view)
+            queryset = matches
+        if short:
+            lookups = [self.construct_search(str(f), queryset) for f in search_fields]
+            queryset = queryset.filter(reduce(operator.and_, (
+                reduce(operator.or_, (models.Q(**{lookup: term}) for lookup in lookups))
+                for term in short
+            )))
+        return queryset
@@ -45,6 +45,7 @@ INSTALLED_APPS = [
     'warehouse',  
     'django_filters',
     "customers",
+    "benchmarks",
 ]
 
 MIDDLEWARE = [
@@ -136,7 +137,7 @@ from rest_framework.settings import api_settings
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        # en-tête Authorization puis cookie "access" (voir JWT_TOKEN_USER)
         "accounts.auth.CookieJWTAuthentication",
     ],
     "DEFAULT_PERMISSION_CLASSES": [
@@ -144,7 +145,7 @@ REST_FRAMEWORK = {
     ],
      "DEFAULT_FILTER_BACKENDS": [
         "django_filters.rest_framework.DjangoFilterBackend",
-        "rest_framework.filters.SearchFilter",
+        "erp_api.search.IndexedSearchFilter",  # index plein texte si déclaré, sinon SearchFilter
         "rest_framework.filters.OrderingFilter",
     ],
     
@@ -159,6 +160,63 @@ SIMPLE_JWT = {
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
 
+# Jetons d'accès porteurs de l'utilisateur (accounts.auth) : pas de lecture de
+# la table des utilisateurs par requête tant que la version des rôles n'a pas
+# changé (version tenue en base, rbac.RolesVersion).
+JWT_TOKEN_USER = False
+
+# Numérotation des documents (sales.sequences) : numéros réservés par bloc et
+# par worker. 1 pour un préfixe qui doit rester sans trous (factures).
+DOCUMENT_SEQUENCE_BLOCK_SIZE = 50
+DOCUMENT_SEQUENCE_BLOCK_SIZES = {
+    "INV": 1,
+}
+
+# Pagination par curseur (erp_api.pagination) des grandes listes : activée
+# par ?page_size= / ?cursor=, ou toujours si PAGINATION_REQUIRED.
+PAGINATION_PAGE_SIZE = 50
+PAGINATION_MAX_PAGE_SIZE = 500
+PAGINATION_REQUIRED = False
+
+# Listes lues depuis .values() sans passer par les modèles (erp_api.fastlist)
+# pour les viewsets qui l'activent (FastListMixin) ; même JSON.
+FAST_LIST_ENABLED = True
+
+# Recherche indexée (erp_api.search) : au-delà de ce nombre de correspondances,
+# pas de tri par pertinence, ?search= repasse par le LIKE habituel.
+SEARCH_RANK_LIMIT = 1000
+
+# Exports en flux (erp_api.export) : taille des paquets lus en base et écrits dans la réponse.
+EXPORT_CHUNK_SIZE = 2000
+
+# Imports en masse (erp_api.importing) : lignes validées et écrites par paquet.
+IMPORT_BATCH_SIZE = 1000
+
+# Expiration des devis (sales.expiry) : taille des lots d'UPDATE et période
+# du passage automatique dans le process web (secondes, 0 = désactivé ;
+# sinon planifier manage.py expire_quotes).
+QUOTE_EXPIRY_BATCH_SIZE = 1000
+QUOTE_EXPIRY_INTERVAL = 0
+
+# Réapprovisionnement (warehouse.replenishment) : une matière en stock bas est
+# commandée jusqu'à min_stock × ce facteur (commandes en cours déduites).
+REPLENISHMENT_TARGET_FACTOR = 2
+
+# Cache des indicateurs calculés (erp_api.caching). LocMemCache par défaut :
+# un cache par process ; configurer CACHES (Redis...) pour le partager.
+# Sans cache partagé, une invalidation n'est vue que du worker qui écrit :
+# les TTL sont alors plafonnés à RESULT_CACHE_LOCAL_MAX_TTL.
+RESULT_CACHE_TTL = 30  # secondes
+RESULT_CACHE_LOCAL_MAX_TTL = 30
+RESULT_CACHE_TTLS = {
+    # "warehouse.stock": 60,
+    "sales.aging": 24 * 3600,  # avec CACHES partagé ; clé par jour, invalidé à chaque écriture facture / paiement
+}
+
+# Permissions résolues par utilisateur (rbac.cache) : clés versionnées par la
+# version des rôles en base, valables dans tous les workers.
+RBAC_PERMISSIONS_CACHE_TTL = 3600
+
 CORS_ALLOW_CREDENTIALS = True
 CORS_ALLOWED_ORIGINS = [
     "http://localhost:3000",
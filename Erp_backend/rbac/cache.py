@@ -0,0 +1,79 @@
+"""
+Permissions résolues par utilisateur, en cache.
+
+user_permissions(user) : frozenset des permissions "app_label.codename"
+que l'utilisateur tient en direct ou par ses groupes (même ensemble que
+ModelBackend.get_all_permissions), calculé en une requête puis gardé dans
+le cache Django (erp_api.caching, namespace "rbac.permissions"). L'auth
+JWT charge un nouvel utilisateur à chaque requête : le cache par instance
+de Django ne sert pas d'une requête à l'autre, celui-ci si.
+
+La clé inclut la version des rôles, tenue en base (RolesVersion, une ligne
+lue par clé primaire) et non dans le cache : toute modification de groupes
+ou de permissions (appartenance, permissions d'un groupe, seed_roles...)
+l'incrémente dans la même transaction (rbac.signals), ce qui invalide les
+ensembles de tous les utilisateurs dans tous les workers dès le commit,
+même avec un cache par process (LocMemCache). is_active et is_superuser
+sont lus sur l'utilisateur chargé, jamais mis en cache ; un changement de
+fiche utilisateur incrémente aussi la version (jetons porteurs de
+l'utilisateur, voir accounts.auth).
+"""
+from django.conf import settings
+from django.contrib.auth.models import Permission
+from django.db.models import F, Q
+
+from erp_api import caching
+
+from .models import RolesVersion
+
+CACHE_NAMESPACE = "rbac.permissions"
+caching.register(CACHE_NAMESPACE)
+
+VERSION_ROW = 1
+DEFAULT_TTL = 3600  # secondes ; clés versionnées par la base, pas de plafond par process
+
+
+def invalidate():
+    """Incrémente la version des rôles (dans la transaction en cours)"""
+    if not RolesVersion.objects.filter(pk=VERSION_ROW).update(value=F("value") + 1):
+        RolesVersion.objects.get_or_create(pk=VERSION_ROW, defaults={"value": 1})
+
+
+def roles_version():
+    """Version courante des rôles (une requête sur la clé primaire) ; voir aussi accounts.auth"""
+    return RolesVersion.objects.filter(pk=VERSION_ROW).values_list("value", flat=True).first() or 0
+
+
+def _compute(user):
+    # par clé : user peut être un utilisateur porté par le jeton (accounts.auth)
+    rows = (
+        Permission.objects.filter(Q(user=user.pk) | Q(group__user=user.pk))
+        .values_list("content_type__app_label", "codename")
+        .distinct()
+    )
+    return frozenset(f"{app_label}.{codename}" for app_label, codename in rows)
+
+
+def user_permissions(user):
+    """Permissions "app_label.codename" de l'utilisateur (vide si anonyme ou inactif)"""
+    if not getattr(user, "is_active", False) or user.pk is None:
+        return frozenset()
+    perms = getattr(user, "_rbac_perms", None)  # plusieurs contrôles dans la même requête
+    if perms is None:
+        version = getattr(user, "_rbac_version", None)  # déjà lue à l'authentification (accounts.auth)
+        if version is None:
+            version = roles_version()
+        perms = caching.get_or_compute(
+            CACHE_NAMESPACE, f"{version}:{user.pk}", lambda: _compute(user),
+            ttl=int(getattr(settings, "RBAC_PERMISSIONS_CACHE_TTL", DEFAULT_TTL)),
+        )
+        user._rbac_perms = perms
+    return perms
+
+
+def granted(user, perms):
+    """True si l'utilisateur (actif) est superuser ou tient une des permissions "app_label.codename" """
+    if getattr(user, "is_active", False) and getattr(user, "is_superuser", False):
+        return True
+    held = user_permissions(user)
+    return any(perm in held for perm in perms)
@@ -1,5 +1,12 @@
 from django.db import models
 
+
+class RolesVersion(models.Model):
+    """Version des rôles (rbac.cache) : une seule ligne, incrémentée à chaque changement de groupes / permissions"""
+    value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+
 class Feature(models.Model):
     """Dummy model to host custom permissions (we won't use the table)."""
     class Meta:
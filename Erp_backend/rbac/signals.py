@@ -0,0 +1,32 @@
+"""Invalidation des permissions en cache (rbac.cache) à chaque changement de rôles"""
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+
+from . import cache
+
+User = get_user_model()
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+@receiver(m2m_changed, sender=Group.permissions.through)
+def roles_changed(sender, action, **kwargs):
+    if action in ("post_add", "post_remove", "post_clear"):
+        cache.invalidate()
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, update_fields=None, **kwargs):
+    # is_active / is_superuser / is_staff sont copiés dans les jetons d'accès (accounts.auth) ;
+    # la date de dernière connexion seule ne change rien
+    if update_fields is None or set(update_fields) - {"last_login"}:
+        cache.invalidate()
+
+
+@receiver(post_delete, sender=User)  # un id supprimé peut être réattribué (SQLite)
+@receiver(post_delete, sender=Group)
+@receiver([post_save, post_delete], sender=Permission)
+def permissions_changed(sender, **kwargs):
+    cache.invalidate()
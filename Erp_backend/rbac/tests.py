@@ -1,3 +1,64 @@
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import cache as django_cache
+from django.db import connection
+from django.db.models import F
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
 
-# Create your tests here.
+from . import cache
+from .models import RolesVersion
+
+
+class PermissionCacheTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.group = Group.objects.create(name='vendeur')
+        cls.group.permissions.add(Permission.objects.get(content_type__app_label='rbac', codename='sales_view'))
+        cls.user = get_user_model().objects.create_user('vendeur', 'vendeur@example.com', 'x')
+        cls.user.groups.add(cls.group)
+
+    def setUp(self):
+        # ensembles laissés par un autre test : même version une fois sa transaction annulée
+        django_cache.clear()
+        self.client = APIClient()
+
+    def get(self, url):
+        # comme l'authentification JWT : un utilisateur fraîchement chargé à chaque requête
+        self.client.force_authenticate(get_user_model().objects.get(pk=self.user.pk))
+        return self.client.get(url)
+
+    def permission_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            status_code = self.get(url).status_code
+        return status_code, sum('auth_permission' in q['sql'] for q in ctx.captured_queries)
+
+    def test_resolved_once_then_served_from_cache(self):
+        self.assertEqual(self.permission_queries('/api/sales/orders/'), (200, 1))
+        self.assertEqual(self.permission_queries('/api/sales/orders/'), (200, 0))
+        self.assertEqual(self.get('/api/sales/invoices/').status_code, 403)
+        self.assertEqual(cache.user_permissions(self.user), frozenset({'rbac.sales_view'}))
+
+    def test_role_change_invalidates(self):
+        self.assertEqual(self.get('/api/sales/orders/').status_code, 200)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.group.permissions.clear()
+        self.assertEqual(self.get('/api/sales/orders/').status_code, 403)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.user_permissions.add(
+                Permission.objects.get(content_type__app_label='rbac', codename='sales_view'),
+            )
+        self.assertEqual(self.get('/api/sales/orders/').status_code, 200)
+
+    def test_change_committed_by_another_worker_is_seen(self):
+        self.assertEqual(self.get('/api/sales/orders/').status_code, 200)
+        # autre worker : écritures et version en base, rien dans le cache de ce process
+        Group.permissions.through.objects.filter(group=self.group).delete()
+        RolesVersion.objects.update(value=F('value') + 1)
+        self.assertEqual(self.get('/api/sales/orders/').status_code, 403)
+
+    def test_inactive_user_holds_nothing(self):
+        self.user.is_active = False
+        self.assertFalse(cache.granted(self.user, ['rbac.sales_view']))
@@ -1,7 +1,8 @@
 # sales/admin.py
 from django.contrib import admin
 from .models import (
-    Customer, Product, Order, OrderLine, DeliveryNote, DeliveryLine, Invoice, InvoiceLine, Payment
+    Customer, Product, Order, OrderLine, DeliveryNote, DeliveryLine, Invoice, InvoiceLine, Payment,
+    DocumentSequence, ProductStockMovement,
 )
 
 class OrderLineInline(admin.TabularInline):
@@ -40,3 +41,14 @@ class InvoiceAdmin(admin.ModelAdmin):
 admin.site.register(Customer)
 admin.site.register(Product)
 admin.site.register(Payment)
+
+@admin.register(DocumentSequence)
+class DocumentSequenceAdmin(admin.ModelAdmin):
+    list_display = ("prefix","last_value","updated_at")
+
+@admin.register(ProductStockMovement)
+class ProductStockMovementAdmin(admin.ModelAdmin):
+    list_display = ("created_at","product","movement_type","quantity","previous_stock","new_stock","delivery")
+    list_filter = ("movement_type",)
+    search_fields = ("product__sku","product__name","notes")
+    readonly_fields = ("previous_stock","new_stock","created_at")
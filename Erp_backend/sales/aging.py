@@ -0,0 +1,129 @@
+# sales/aging.py
+"""
+Balance âgée des créances clients.
+
+Une seule requête groupée par (client, tranche) : chaque facture émise (ni
+brouillon ni annulée) est classée par un CASE SQL selon son échéance
+(due_date, à défaut issue_date) — non échue, 1-30, 31-60, 61-90, plus de
+90 jours de retard à la date d'arrêté — et les soldes sont sommés par
+groupe ; les lignes (au plus une par tranche et par client) sont remises
+en colonnes en Python, les noms des clients lus ensuite par paquets
+(grouper sur la jointure client coûte plus que la requête elle-même). Les
+bornes sont des dates calculées une fois en Python : aucune arithmétique
+de dates propre au moteur.
+
+À la date du jour, le solde d'une facture est balance_due et seules les
+factures ouvertes sont lues (index status / due_date). À une date passée
+(as_of), les paiements reçus après cette date sont rajoutés au solde et les
+factures émises après sont ignorées. Les changements de statut (annulation)
+ne sont pas historisés : une facture annulée depuis n'apparaît plus.
+
+Résultat mis en cache pour la journée (clé = date d'arrêté + date du jour),
+invalidé à chaque écriture de facture ou de paiement (sales.signals). Sans
+CACHES partagé, l'invalidation ne touche que le worker qui écrit : le TTL
+est alors plafonné (RESULT_CACHE_LOCAL_MAX_TTL, voir erp_api.caching).
+"""
+import datetime
+from decimal import Decimal
+
+from django.db import models
+from django.db.models import Case, Count, Exists, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from erp_api import caching
+
+from .models import Customer, Invoice, Payment
+
+CACHE_NAMESPACE = "sales.aging"
+caching.register(CACHE_NAMESPACE)
+
+# (clé, retard minimum en jours) ; la dernière tranche est ouverte
+BUCKETS = (("current", None), ("1_30", 1), ("31_60", 31), ("61_90", 61), ("90_plus", 91))
+OPEN_STATUSES = (Invoice.Status.ISSUED, Invoice.Status.PARTIALLY_PAID)
+UNPOSTED = (Invoice.Status.DRAFT, Invoice.Status.CANCELLED)
+NAME_BATCH_SIZE = 1000
+
+MONEY_FIELD = models.DecimalField(max_digits=14, decimal_places=2)
+ZERO = Value(Decimal("0.00"), output_field=MONEY_FIELD)
+
+
+def invalidate():
+    caching.invalidate(CACHE_NAMESPACE)
+
+
+def _bucket(as_of):
+    """CASE SQL : tranche de retard de l'échéance (annotation `due`) à la date as_of"""
+    whens = []
+    for key, min_days in BUCKETS[1:]:
+        whens.append(When(due__lte=as_of - datetime.timedelta(days=min_days), then=Value(key)))
+    # conditions testées de la plus ancienne à la plus récente
+    return Case(*reversed(whens), default=Value(BUCKETS[0][0]), output_field=models.CharField())
+
+
+def _open_invoices(as_of):
+    """Factures ouvertes à la date as_of, annotées `due` et `open_amount`"""
+    invoices = Invoice.objects.annotate(due=Coalesce("due_date", "issue_date"))
+    if as_of >= timezone.localdate():
+        return invoices.filter(status__in=OPEN_STATUSES, balance_due__gt=0).annotate(open_amount=F("balance_due"))
+
+    # paiements reçus après la fin de la journée as_of : pas encore encaissés à cette date
+    cutoff = timezone.make_aware(datetime.datetime.combine(as_of + datetime.timedelta(days=1), datetime.time.min))
+    later = Payment.objects.filter(invoice=OuterRef("pk"), received_at__gte=cutoff)
+    later_total = later.order_by().values("invoice").annotate(s=Sum("amount")).values("s")
+    return (
+        invoices.exclude(status__in=UNPOSTED)
+        .filter(issue_date__lte=as_of)
+        .filter(Q(balance_due__gt=0) | Exists(later))
+        .annotate(open_amount=F("balance_due") + Coalesce(Subquery(later_total, output_field=MONEY_FIELD), ZERO))
+    )
+
+
+def compute(as_of, customer_id=None):
+    invoices = _open_invoices(as_of)
+    if customer_id is not None:
+        invoices = invoices.filter(customer_id=customer_id)
+    rows = (
+        invoices.annotate(bucket=_bucket(as_of))
+        .order_by()
+        .values("customer_id", "bucket")
+        .annotate(amount=Sum("open_amount"), invoices=Count("id"))
+    )
+
+    keys = [key for key, _ in BUCKETS]
+    totals = dict.fromkeys(keys + ["total"], Decimal("0.00"))
+    customers = {}
+    for row in rows:
+        if row["amount"] <= 0:
+            continue
+        customer = customers.get(row["customer_id"])
+        if customer is None:
+            customer = customers[row["customer_id"]] = {
+                "customer": row["customer_id"],
+                "customer_name": "",
+                "invoices": 0,
+                **dict.fromkeys(keys + ["total"], Decimal("0.00")),
+            }
+        customer["invoices"] += row["invoices"]
+        for key in (row["bucket"], "total"):
+            customer[key] += row["amount"]
+            totals[key] += row["amount"]
+
+    ids = list(customers)
+    for i in range(0, len(ids), NAME_BATCH_SIZE):
+        for pk, name in Customer.objects.filter(pk__in=ids[i:i + NAME_BATCH_SIZE]).values_list("pk", "name"):
+            customers[pk]["customer_name"] = name
+    return {
+        "as_of": as_of,
+        "buckets": keys,
+        "totals": totals,
+        "customers": sorted(customers.values(), key=lambda c: (-c["total"], c["customer_name"])),
+    }
+
+
+def aging_report(as_of=None, customer_id=None):
+    today = timezone.localdate()
+    as_of = as_of or today
+    # la date du jour fait partie de la clé : « aujourd'hui » change à minuit
+    key = f"{as_of:%Y-%m-%d}:{today:%Y-%m-%d}:{customer_id or 'all'}"
+    return caching.get_or_compute(CACHE_NAMESPACE, key, lambda: compute(as_of, customer_id))
@@ -1,6 +1,20 @@
 from django.apps import AppConfig
+from django.core.signals import request_started
+from django.db.models.signals import post_migrate
 
 
 class SalesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'sales'
+
+    def ready(self):
+        from erp_api import search
+
+        from . import expiry, signals  # noqa: F401  (signals : branchement des récepteurs)
+
+        # sélecteur produits du POS et recherche client (voir erp_api.search)
+        search.register('sales.Product', ('sku', 'name', 'description'))
+        search.register('sales.Customer', ('name', 'email', 'phone'))
+        post_migrate.connect(search.ensure_indexes, sender=self)
+        # expiration périodique des devis, si QUOTE_EXPIRY_INTERVAL (voir sales.expiry)
+        request_started.connect(expiry.start_runner, dispatch_uid='sales.expiry.start_runner')
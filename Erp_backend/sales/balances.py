@@ -0,0 +1,143 @@
+# sales/balances.py
+"""
+Soldes clients : Customer.total_invoiced, total_paid, balance_due,
+last_invoice_date et last_payment_at.
+
+Une facture compte pour son client dès qu'elle est émise (ni brouillon ni
+annulée), pour le total et le montant réglé enregistrés. Chaque écriture
+d'une facture (Invoice.save, recompute_totals — donc aussi Payment.save —,
+delete) passe l'état enregistré avant et après à invoice_changed(), qui
+applique l'écart par un UPDATE relatif (F() + delta) sur la fiche client :
+coût constant, sans relire les factures du client. Trier ou filtrer les
+clients par encours revient à lire une colonne indexée.
+
+Les écritures qui contournent les modèles (update(), bulk_create(), SQL)
+ne sont pas suivies : rebuild() (manage.py rebuild_customer_balances)
+recalcule tous les soldes depuis les factures.
+"""
+from collections import defaultdict
+from decimal import Decimal
+from typing import NamedTuple
+
+from django.db import models
+from django.db.models import F, Max, OuterRef, Q, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+from .models import Customer, Invoice, Payment
+
+ZERO = Decimal("0.00")
+UNPOSTED = (Invoice.Status.DRAFT, Invoice.Status.CANCELLED)
+STATE_FIELDS = ("customer_id", "status", "issue_date", "total", "amount_paid")
+UNCHANGED = object()
+
+MONEY_FIELD = models.DecimalField(max_digits=14, decimal_places=2)
+
+
+class InvoiceState(NamedTuple):
+    """Ce qu'une facture enregistrée apporte au solde de son client"""
+    customer_id: object
+    status: str
+    issue_date: object
+    total: Decimal
+    amount_paid: Decimal
+
+    @classmethod
+    def of(cls, invoice):
+        state = cls(*(getattr(invoice, name) for name in STATE_FIELDS))
+        # issue_date vaut timezone.now() (datetime) tant que la facture n'est pas relue
+        return state._replace(issue_date=Invoice._meta.get_field("issue_date").to_python(state.issue_date))
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*(row[name] for name in STATE_FIELDS))
+
+    @property
+    def posted(self):
+        return self.status not in UNPOSTED
+
+
+def stored_state(invoice, update_fields=None):
+    """
+    État enregistré de la facture avant écriture ; UNCHANGED si les champs
+    écrits (update_fields) ne touchent pas au solde (pas de requête).
+    """
+    if update_fields is not None:
+        touched = {"customer" if name == "customer_id" else name for name in update_fields}
+        if not touched & {"customer", "status", "issue_date", "total", "amount_paid"}:
+            return UNCHANGED
+    row = Invoice.objects.filter(pk=invoice.pk).values_list(*STATE_FIELDS).first()
+    return InvoiceState(*row) if row is not None else None
+
+
+def invoice_changed(old, new):
+    """Reporte sur les clients le passage de la facture de l'état `old` à `new` (None = absente)"""
+    was = old if old is not None and old.posted else None
+    now = new if new is not None and new.posted else None
+
+    deltas = defaultdict(lambda: [ZERO, ZERO])
+    if was:
+        deltas[was.customer_id][0] -= was.total
+        deltas[was.customer_id][1] -= was.amount_paid
+    if now:
+        deltas[now.customer_id][0] += now.total
+        deltas[now.customer_id][1] += now.amount_paid
+    for customer_id, (invoiced, paid) in deltas.items():
+        if invoiced or paid:
+            Customer.objects.filter(pk=customer_id).update(
+                total_invoiced=F("total_invoiced") + invoiced,
+                total_paid=F("total_paid") + paid,
+                balance_due=F("balance_due") + (invoiced - paid),
+            )
+
+    moved = was and now and (was.customer_id, was.issue_date) != (now.customer_id, now.issue_date)
+    if was and (not now or moved):
+        # la dernière date a pu reculer : relue depuis les factures de ce client
+        Customer.objects.filter(pk=was.customer_id).update(last_invoice_date=_last_invoice_date())
+    if now and (not was or (moved and now.customer_id != was.customer_id)):
+        _advance(now.customer_id, "last_invoice_date", now.issue_date)
+
+
+def payment_received(customer_id, received_at):
+    _advance(customer_id, "last_payment_at", received_at)
+
+
+def _advance(customer_id, field, value):
+    """field = max(field, value) en un UPDATE conditionnel"""
+    if value is None:
+        return
+    Customer.objects.filter(Q(**{f"{field}__isnull": True}) | Q(**{f"{field}__lt": value}), pk=customer_id).update(
+        **{field: value}
+    )
+
+
+def _posted_invoices():
+    return Invoice.objects.filter(customer=OuterRef("pk")).exclude(status__in=UNPOSTED).order_by().values("customer")
+
+
+def _last_invoice_date():
+    return Subquery(_posted_invoices().annotate(m=Max("issue_date")).values("m"))
+
+
+def _sum(expression):
+    return Coalesce(
+        Subquery(_posted_invoices().annotate(s=Sum(expression)).values("s"), output_field=MONEY_FIELD),
+        Value(ZERO),
+        output_field=MONEY_FIELD,
+    )
+
+
+def rebuild(queryset=None):
+    """Recalcule les soldes (de tous les clients par défaut) depuis les factures ; retourne le nombre de clients"""
+    queryset = Customer.objects.all() if queryset is None else queryset
+    last_payment = (
+        Payment.objects.filter(invoice__customer=OuterRef("pk"))
+        .order_by().values("invoice__customer")
+        .annotate(m=Max("received_at")).values("m")
+    )
+    return queryset.update(
+        total_invoiced=_sum("total"),
+        total_paid=_sum("amount_paid"),
+        balance_due=_sum(F("total") - F("amount_paid")),
+        last_invoice_date=_last_invoice_date(),
+        last_payment_at=Subquery(last_payment),
+    )
@@ -0,0 +1,123 @@
+# sales/catalog.py
+"""
+Import en masse du catalogue produits, clé = sku.
+
+Par paquet, dans une transaction : lecture verrouillée des produits existants
+(sku__in, select_for_update), validation ligne à ligne par
+ProductImportSerializer (règles de ProductWriteSerializer, dont « un service
+ne suit pas de stock ») de la fiche existante complétée par la ligne, puis un
+seul INSERT ... ON CONFLICT (sku) DO UPDATE. Une ligne invalide est signalée
+dans le rapport sans bloquer le reste du paquet.
+
+Chaque écart de stock_qty (stock initial d'un nouveau produit, correction
+d'un produit existant) est journalisé dans ProductStockMovement ; les lignes
+étant verrouillées, le stock lu est celui qui est remplacé.
+"""
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from rest_framework import serializers
+
+from erp_api.importing import DEFAULT_BATCH_SIZE, ImportReport, batched, flatten_errors
+
+from .models import Product, ProductStockMovement
+from .serializers import ProductWriteSerializer
+
+IMPORT_FIELDS = ProductWriteSerializer.Meta.fields
+UPDATE_FIELDS = [f for f in IMPORT_FIELDS if f != "sku"] + ["updated_at"]
+
+
+class ProductImportSerializer(ProductWriteSerializer):
+    class Meta(ProductWriteSerializer.Meta):
+        # upsert : un sku déjà connu est une mise à jour, pas une erreur d'unicité
+        extra_kwargs = {"sku": {"validators": []}}
+
+
+def import_products(rows, *, batch_size=None, dry_run=False, created_by=""):
+    """rows : dicts (voir erp_api.importing.read_rows) ; retourne un ImportReport"""
+    batch_size = batch_size or getattr(settings, "IMPORT_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    report = ImportReport(dry_run=dry_run)
+    # champs construits une fois : ModelSerializer les reconstruit à chaque instance
+    serializer = ProductImportSerializer()
+    seen = set()
+    for batch in batched(enumerate(rows, 1), batch_size):
+        report.total += len(batch)
+        mark = report.mark()
+        added = set()
+        try:
+            with transaction.atomic():
+                valid = _validate(batch, serializer, report, seen, added, lock=not dry_run)
+                if valid and not dry_run:
+                    _write(valid, created_by)
+        except DatabaseError as exc:
+            # paquet annulé : toutes ses lignes en échec, ses sku non retenus
+            report.fail_batch(mark, batch, lambda row: _sku(row) or None, exc)
+            continue
+        seen |= added
+        created = sum(1 for _, _, current in valid if current is None)
+        report.created += created
+        report.updated += len(valid) - created
+    return report
+
+
+def _sku(row):
+    return str(row.get("sku") or "").strip()
+
+
+def _validate(batch, serializer, report, seen, added, lock):
+    """
+    Lignes valides du paquet : (numéro, données validées, fiche existante ou
+    None). Les sku retenus vont dans `added` (ajoutés à `seen` une fois le
+    paquet écrit).
+    """
+    skus = {_sku(row) for _, row in batch}
+    existing = Product.objects.filter(sku__in=skus)
+    if lock:
+        existing = existing.select_for_update()
+    existing = {values["sku"]: values for values in existing.values("pk", *IMPORT_FIELDS)}
+
+    valid = []
+    for number, row in batch:
+        sku = _sku(row)
+        if sku and (sku in seen or sku in added):
+            report.error(number, sku, {"sku": "SKU en double dans le fichier."})
+            continue
+        current = existing.get(sku)
+        data = {**{k: v for k, v in current.items() if k != "pk"}, **row} if current else row
+        try:
+            validated = serializer.run_validation(data)
+        except serializers.ValidationError as exc:
+            report.error(number, sku or None, flatten_errors(exc.detail))
+            continue
+        added.add(sku)
+        valid.append((number, validated, current))
+    return valid
+
+
+def _write(valid, created_by):
+    products = []
+    for _, data, current in valid:
+        data = dict(data)
+        if not data.get("track_stock", True):
+            data["stock_qty"] = current["stock_qty"] if current else 0  # stock non suivi : inchangé
+        products.append(Product(**data))
+    Product.objects.bulk_create(
+        products, update_conflicts=True, unique_fields=["sku"], update_fields=UPDATE_FIELDS,
+    )
+
+    pks = dict(Product.objects.filter(sku__in=[p.sku for p in products]).values_list("sku", "pk"))
+    movements = []
+    for product, (_, _, current) in zip(products, valid):
+        previous = current["stock_qty"] if current else 0
+        delta = product.stock_qty - previous
+        if not delta:
+            continue
+        movements.append(ProductStockMovement(
+            product_id=pks[product.sku],
+            movement_type=ProductStockMovement.Type.ADJUSTMENT if current else ProductStockMovement.Type.IN,
+            quantity=abs(delta),
+            previous_stock=previous,
+            new_stock=product.stock_qty,
+            notes="Import catalogue" if current else "Stock initial (import catalogue)",
+            created_by=created_by,
+        ))
+    ProductStockMovement.objects.bulk_create(movements)
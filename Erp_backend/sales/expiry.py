@@ -0,0 +1,96 @@
+# sales/expiry.py
+"""
+Expiration en lot des devis envoyés dont la validité est dépassée
+(status SENT, valid_until antérieure à la date du jour).
+
+Par lot : lecture des clés d'au plus QUOTE_EXPIRY_BATCH_SIZE devis expirés
+(index status / valid_until), verrouillées (select_for_update, les lignes
+déjà verrouillées par une autre transaction sont sautées), puis un UPDATE
+ensembliste sur ces clés, dans une transaction courte. Seules les lignes du
+lot sont verrouillées, jamais la table : les écritures concurrentes sur les
+devis attendent au plus un lot. L'UPDATE refiltre sur status : sans
+verrou de ligne (SQLite ignore select_for_update), un devis accepté entre
+la lecture des clés et l'UPDATE n'est pas expiré pour autant.
+
+Lancement : manage.py expire_quotes (cron), ou dans le process web toutes
+les QUOTE_EXPIRY_INTERVAL secondes (start_runner, démarré à la première
+requête).
+"""
+import logging
+import threading
+import time
+from typing import NamedTuple
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Quote
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+class ExpiryRun(NamedTuple):
+    expired: int
+    batches: int
+    seconds: float
+
+
+def stale_quotes(today=None):
+    return Quote.objects.filter(status=Quote.Status.SENT, valid_until__lt=today or timezone.localdate())
+
+
+def expire_quotes(today=None, batch_size=None):
+    """Passe en EXPIRED les devis envoyés échus au plus tard la veille de `today` ; retourne un ExpiryRun"""
+    today = today or timezone.localdate()
+    batch_size = batch_size or getattr(settings, "QUOTE_EXPIRY_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    started = time.monotonic()
+    stale = stale_quotes(today).select_for_update(skip_locked=True).order_by().values_list("pk", flat=True)
+    expired = batches = 0
+    while True:
+        with transaction.atomic():
+            pks = list(stale[:batch_size])
+            if not pks:
+                break
+            expired += Quote.objects.filter(pk__in=pks, status=Quote.Status.SENT).update(
+                status=Quote.Status.EXPIRED, updated_at=timezone.now(),
+            )
+        batches += 1
+    run = ExpiryRun(expired, batches, round(time.monotonic() - started, 3))
+    logger.info("Devis expirés : %d en %d lot(s), %.3f s", *run)
+    return run
+
+
+def _loop(interval, stop):
+    while not stop.wait(interval):
+        close_old_connections()
+        try:
+            expire_quotes()
+        except Exception:
+            logger.exception("Expiration des devis en échec")
+        finally:
+            close_old_connections()
+
+
+def start_runner(**kwargs):
+    """
+    Démarre (une fois par process) le passage périodique si
+    QUOTE_EXPIRY_INTERVAL > 0 ; branché sur request_started, donc jamais
+    pendant migrate, les tests ou les autres commandes.
+    """
+    global _runner
+    interval = getattr(settings, "QUOTE_EXPIRY_INTERVAL", 0)
+    if not interval or _runner is not None:
+        return None
+    with _runner_lock:
+        if _runner is None:
+            stop = threading.Event()
+            thread = threading.Thread(target=_loop, args=(interval, stop), name="quote-expiry", daemon=True)
+            thread.start()
+            _runner = (thread, stop)
+    return _runner
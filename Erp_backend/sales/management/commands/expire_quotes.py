@@ -0,0 +1,25 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from sales.expiry import expire_quotes
+
+
+class Command(BaseCommand):
+    help = "Expire sent quotes whose valid_until is past, in batched set-based updates (run daily)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Reference day, YYYY-MM-DD (default: today)")
+        parser.add_argument("--batch-size", type=int)
+
+    def handle(self, *args, **options):
+        today = None
+        if options["date"]:
+            try:
+                today = date.fromisoformat(options["date"])
+            except ValueError:
+                raise CommandError("--date must be YYYY-MM-DD")
+        run = expire_quotes(today=today, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(
+            f"{run.expired} quote(s) expired in {run.batches} batch(es), {run.seconds:.3f}s"
+        ))
@@ -0,0 +1,7 @@
+from erp_api.importing import ImportCommand
+from sales.statements import import_statement
+
+
+class Command(ImportCommand):
+    help = "Post the credits of a bank statement (CSV or JSON) as payments, matched to invoices by code."
+    importer = import_statement
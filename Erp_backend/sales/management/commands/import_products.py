@@ -0,0 +1,7 @@
+from erp_api.importing import ImportCommand
+from sales.catalog import import_products
+
+
+class Command(ImportCommand):
+    help = "Import a product catalog from a CSV or JSON file, upserting by SKU."
+    importer = import_products
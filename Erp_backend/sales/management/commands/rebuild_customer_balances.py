@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sales import balances
+
+
+class Command(BaseCommand):
+    help = "Recompute every customer's invoiced / paid / outstanding totals from the invoices (e.g. after a bulk load)."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = balances.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{count} customer balance(s) rebuilt"))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from sales import reservations
+
+
+class Command(BaseCommand):
+    help = "Recompute every product's reserved quantity from the confirmed, not yet delivered order lines."
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            count = reservations.rebuild()
+        self.stdout.write(self.style.SUCCESS(f"{count} product reservation(s) rebuilt"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from erp_api import search
+
+
+class Command(BaseCommand):
+    help = "Create missing search indexes and rebuild them from the tables (e.g. after restoring a dump)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default="default")
+
+    def handle(self, *args, **options):
+        for index in search.registered():
+            index.rebuild(options["database"])
+            state = "rebuilt" if index.is_available(options["database"]) else "unavailable (LIKE fallback)"
+            self.stdout.write(f"{index.model_label} ({', '.join(index.fields)}): {state}")
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:19
+
+from django.db import migrations, models
+
+SEQUENCES = {"ORD": "Order", "BL": "DeliveryNote", "INV": "Invoice", "QTE": "Quote"}
+
+
+def seed_sequences(apps, schema_editor):
+    DocumentSequence = apps.get_model("sales", "DocumentSequence")
+    for prefix, model_name in SEQUENCES.items():
+        Model = apps.get_model("sales", model_name)
+        last = Model.objects.aggregate(m=models.Max("seq"))["m"] or 0
+        DocumentSequence.objects.update_or_create(prefix=prefix, defaults={"last_value": last})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0004_alter_quote_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('prefix', models.CharField(max_length=10, unique=True)),
+                ('last_value', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(seed_sequences, migrations.RunPython.noop),
+    ]
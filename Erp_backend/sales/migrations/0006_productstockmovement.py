@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:22
+
+import django.db.models.deletion
+import uuid
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0005_documentsequence'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductStockMovement',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('movement_type', models.CharField(choices=[('IN', 'Entrée'), ('OUT', 'Sortie'), ('ADJUSTMENT', 'Ajustement')], max_length=12)),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('previous_stock', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('new_stock', models.DecimalField(decimal_places=3, max_digits=14)),
+                ('notes', models.TextField(blank=True)),
+                ('created_by', models.CharField(blank=True, max_length=200)),
+                ('delivery', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='sales.deliverynote')),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='stock_movements', to='sales.product')),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['product', 'created_at'], name='sales_produ_product_670100_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0006_productstockmovement'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deliverynote',
+            index=models.Index(fields=['created_at', 'id'], name='sales_deliv_created_1a0f76_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['created_at', 'id'], name='sales_invoi_created_c37c71_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['created_at', 'id'], name='sales_order_created_8f6a34_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['received_at', 'id'], name='sales_payme_receive_3ad097_idx'),
+        ),
+    ]
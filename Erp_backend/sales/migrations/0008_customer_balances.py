@@ -0,0 +1,77 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:06
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, Max, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+MONEY = models.DecimalField(max_digits=14, decimal_places=2)
+
+
+def compute_balances(apps, schema_editor):
+    # même calcul que sales.balances.rebuild(), sur les modèles historiques
+    Customer = apps.get_model("sales", "Customer")
+    Invoice = apps.get_model("sales", "Invoice")
+    Payment = apps.get_model("sales", "Payment")
+    posted = (
+        Invoice.objects.filter(customer=OuterRef("pk"))
+        .exclude(status__in=["DRAFT", "CANCELLED"])
+        .order_by().values("customer")
+    )
+
+    def total(expression):
+        return Coalesce(
+            Subquery(posted.annotate(s=Sum(expression)).values("s"), output_field=MONEY),
+            Value(Decimal("0.00")), output_field=MONEY,
+        )
+
+    Customer.objects.update(
+        total_invoiced=total("total"),
+        total_paid=total("amount_paid"),
+        balance_due=total(F("total") - F("amount_paid")),
+        last_invoice_date=Subquery(posted.annotate(m=Max("issue_date")).values("m")),
+        last_payment_at=Subquery(
+            Payment.objects.filter(invoice__customer=OuterRef("pk"))
+            .order_by().values("invoice__customer").annotate(m=Max("received_at")).values("m")
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0007_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customer',
+            name='balance_due',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='last_invoice_date',
+            field=models.DateField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='last_payment_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='total_invoiced',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='customer',
+            name='total_paid',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), editable=False, max_digits=14),
+        ),
+        migrations.AddIndex(
+            model_name='customer',
+            index=models.Index(fields=['balance_due', 'id'], name='sales_custo_balance_92e1b8_idx'),
+        ),
+        migrations.RunPython(compute_balances, migrations.RunPython.noop),
+    ]
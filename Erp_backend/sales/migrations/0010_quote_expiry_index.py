@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0009_invoice_aging_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='quote',
+            index=models.Index(fields=['status', 'valid_until'], name='sales_quote_status_7d2cb6_idx'),
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:28
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+QTY = models.DecimalField(max_digits=14, decimal_places=3)
+
+
+def compute_reservations(apps, schema_editor):
+    # même calcul que sales.reservations.rebuild(), sur les modèles historiques
+    Product = apps.get_model("sales", "Product")
+    OrderLine = apps.get_model("sales", "OrderLine")
+    open_lines = (
+        OrderLine.objects.filter(
+            product=OuterRef("pk"), product__type="GOOD", product__track_stock=True,
+            order__status__in=["CONFIRMED", "PART_DELIV"],
+        )
+        .order_by().values("product")
+        .annotate(s=Sum(F("quantity") - F("delivered_qty"))).values("s")
+    )
+    Product.objects.update(
+        reserved_qty=Coalesce(Subquery(open_lines, output_field=QTY), Value(Decimal("0.000")), output_field=QTY),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0010_quote_expiry_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='incoming_qty',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0.000'), max_digits=14),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='reserved_qty',
+            field=models.DecimalField(decimal_places=3, default=Decimal('0.000'), editable=False, max_digits=14),
+        ),
+        migrations.RunPython(compute_reservations, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,109 @@
+import threading
 import uuid
+from contextlib import contextmanager
 from decimal import Decimal
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
+from django.db.models import OuterRef, Subquery, Sum
 from django.utils import timezone
 from django.utils.text import slugify
 
+from .sequences import next_number
+
 # ---------- Helpers ----------
 def money(value) -> Decimal:
     return (Decimal(value) if value is not None else Decimal("0.00")).quantize(Decimal("0.01"))
 
-def next_code(prefix: str, last_number: int | None) -> str:
+def next_code(prefix: str, model) -> tuple[str, int]:
     """
-    Simple sequence helper. En prod, préférez un modèle Sequence ou une table dédiée
-    avec verrouillage (SELECT FOR UPDATE) pour éviter les collisions en concurrence.
+    Prochain code du préfixe (ex: ORD000042). Les numéros viennent de
+    DocumentSequence via sales.sequences, par blocs pré-alloués.
     """
-    n = (last_number or 0) + 1
+    n = next_number(prefix, model)
     return f"{prefix}{n:06d}", n
 
 
+def _sum_subquery(model, fk: str, field: str):
+    """SUM(field) des lignes de `model` rattachées au document courant (OuterRef pk)."""
+    qs = (
+        model.objects.filter(**{fk: OuterRef("pk")})
+        .order_by().values(fk)
+        .annotate(s=Sum(field))
+        .values("s")
+    )
+    return Subquery(qs, output_field=models.DecimalField(max_digits=14, decimal_places=2))
+
+
+# ---------- Recalcul des totaux ----------
+_totals_state = threading.local()
+
+
+@contextmanager
+def deferred_totals():
+    """
+    Diffère les recalculs de totaux : les lignes sauvegardées dans le bloc
+    marquent leur document, recalculé une seule fois à la sortie du bloc.
+    Si le bloc lève une exception, rien n'est recalculé.
+    """
+    if getattr(_totals_state, "pending", None) is not None:
+        # bloc imbriqué : le bloc le plus externe recalculera
+        yield
+        return
+    _totals_state.pending = {}
+    try:
+        yield
+        pending = _totals_state.pending
+    finally:
+        _totals_state.pending = None
+    for doc in pending.values():
+        doc.recompute_totals(save=True)
+
+
+def schedule_totals(doc):
+    """Recalcule les totaux de `doc` maintenant, ou en fin de deferred_totals()."""
+    pending = getattr(_totals_state, "pending", None)
+    if pending is None:
+        doc.recompute_totals(save=True)
+    else:
+        pending[(type(doc), doc.pk)] = doc
+
+
+def bulk_create_lines(line_model, document, rows):
+    """
+    Crée les lignes d'un document en un seul INSERT groupé.
+    `rows` : dicts de champs de ligne (product, description, quantity,
+    unit_price, tax_rate). Les montants sont calculés en mémoire comme dans
+    line.save(), puis les totaux du document sont recalculés une seule fois.
+    """
+    fk = next(
+        f.name for f in line_model._meta.concrete_fields
+        if f.is_relation and f.related_model is type(document)
+    )
+    lines = []
+    for row in rows:
+        line = line_model(**{fk: document}, **row)
+        if line.tax_rate is None:
+            line.tax_rate = line.product.tax_rate
+        if line.unit_price is None:
+            line.unit_price = line.product.unit_price
+        line.compute_amounts()
+        lines.append(line)
+    line_model.objects.bulk_create(lines)
+    schedule_totals(document)
+    return lines
+
+
+# ---------- Séquences ----------
+class DocumentSequence(models.Model):
+    """Dernier numéro réservé par préfixe de document (ORD, BL, INV, QTE)."""
+    prefix = models.CharField(max_length=10, unique=True)
+    last_value = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self) -> str:
+        return f"{self.prefix} · {self.last_value}"
+
+
 # ---------- Bases ----------
 class TimeStampedModel(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
@@ -40,6 +126,18 @@ class Customer(TimeStampedModel):
     billing_address = models.TextField(blank=True)
     shipping_address = models.TextField(blank=True)
 
+    # solde tenu à jour à chaque écriture de facture / paiement (voir sales.balances)
+    total_invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"), editable=False)
+    total_paid = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"), editable=False)
+    balance_due = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal("0.00"), editable=False)
+    last_invoice_date = models.DateField(blank=True, null=True, editable=False)
+    last_payment_at = models.DateTimeField(blank=True, null=True, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["balance_due", "id"]),  # tri par encours (recouvrement)
+        ]
+
     def __str__(self) -> str:
         return self.name
 
@@ -60,6 +158,9 @@ class Product(TimeStampedModel):
 
     track_stock = models.BooleanField(default=True)  # False pour services
     stock_qty = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal("0.000"))
+    # réservé par les commandes confirmées (tenu par sales.reservations) ; entrées attendues saisies
+    reserved_qty = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal("0.000"), editable=False)
+    incoming_qty = models.DecimalField(max_digits=14, decimal_places=3, default=Decimal("0.000"))
 
     tax_rate = models.DecimalField(  # TVA par défaut si non spécifiée sur la ligne
         max_digits=5, decimal_places=2, default=Decimal("0.00")
@@ -108,7 +209,10 @@ class Order(TimeStampedModel):
 
     class Meta:
         ordering = ["-created_at"]
-        indexes = [models.Index(fields=["status", "created_at"])]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["created_at", "id"]),  # pagination par curseur
+        ]
 
     def __str__(self) -> str:
         return self.code
@@ -118,24 +222,56 @@ class Order(TimeStampedModel):
             raise ValidationError("Impossible d'annuler : des BL non annulés existent.")
 
     def recompute_totals(self, save=True):
-        sub = Decimal("0.00")
-        tax = Decimal("0.00")
-        for line in self.lines.all():
-            sub += money(line.subtotal)
-            tax += money(line.tax_amount)
-        self.subtotal = money(sub)
-        self.tax_amount = money(tax)
+        agg = self.lines.aggregate(sub=Sum("subtotal"), tax=Sum("tax_amount"))
+        sub, tax = money(agg["sub"]), money(agg["tax"])
+        self.subtotal = sub
+        self.tax_amount = tax
         self.total = money(sub + tax)
         if save:
             super().save(update_fields=["subtotal", "tax_amount", "total", "updated_at"])
 
     def confirm(self):
+        from .reservations import reserve_order
+
         if self.status != self.Status.DRAFT:
             raise ValidationError("Seules les commandes brouillon peuvent être confirmées.")
         if self.lines.count() == 0:
             raise ValidationError("Impossible de confirmer une commande vide.")
-        self.status = self.Status.CONFIRMED
-        self.save(update_fields=["status", "updated_at"])
+        with transaction.atomic():
+            now = timezone.now()
+            # transition conditionnelle : une instance périmée (commande déjà
+            # confirmée ailleurs) ne réserve pas une seconde fois
+            claimed = (
+                Order.objects.filter(pk=self.pk, status=self.Status.DRAFT)
+                .update(status=self.Status.CONFIRMED, updated_at=now)
+            )
+            if not claimed:
+                self.refresh_from_db(fields=["status", "updated_at"])
+                raise ValidationError("Seules les commandes brouillon peuvent être confirmées.")
+            reserve_order(self)  # ValidationError si le stock disponible manque : transition annulée
+            self.status, self.updated_at = self.Status.CONFIRMED, now
+
+    def cancel(self):
+        from .reservations import RESERVING, release_order
+
+        self.status = self.Status.CANCELLED
+        self.clean()  # refuse si des BL non annulés existent
+        with transaction.atomic():
+            now = timezone.now()
+            # la réservation n'est libérée que par la requête qui fait passer la
+            # commande de réservante à annulée, pas selon le statut en mémoire
+            pending = Order.objects.filter(pk=self.pk).exclude(status=self.Status.CANCELLED)
+            if pending.filter(status__in=RESERVING).update(status=self.Status.CANCELLED, updated_at=now):
+                release_order(self)
+            else:
+                pending.update(status=self.Status.CANCELLED, updated_at=now)
+            self.refresh_from_db(fields=["status", "updated_at"])
+
+    def delete(self, *args, **kwargs):
+        # une commande confirmée tient du stock réservé : l'annuler plutôt (cancel libère)
+        if Order.objects.filter(pk=self.pk).exclude(status=self.Status.DRAFT).exists():
+            raise ValidationError("Seules les commandes brouillon peuvent être supprimées.")
+        return super().delete(*args, **kwargs)
 
     def _refresh_delivery_status(self):
         # met à jour le statut en fonction des quantités livrées
@@ -157,11 +293,7 @@ class Order(TimeStampedModel):
 
     def save(self, *args, **kwargs):
         if not self.code:
-            # ATTENTION: pour la concurrence, verrouillez via une table Sequence.
-            last_seq = Order.objects.aggregate(m=models.Max("seq"))["m"] or 0
-            code, n = next_code("ORD", last_seq)
-            self.code = code
-            self.seq = n
+            self.code, self.seq = next_code("ORD", Order)
         super().save(*args, **kwargs)
 
 
@@ -210,7 +342,7 @@ class OrderLine(TimeStampedModel):
         self.compute_amounts()
         super().save(*args, **kwargs)
         # Recalcule les totaux de la commande
-        self.order.recompute_totals(save=True)
+        schedule_totals(self.order)
 
 
 # ---------- Bons de livraison ----------
@@ -231,6 +363,7 @@ class DeliveryNote(TimeStampedModel):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [models.Index(fields=["created_at", "id"])]  # pagination par curseur
 
     def __str__(self) -> str:
         return self.code
@@ -246,34 +379,63 @@ class DeliveryNote(TimeStampedModel):
                 raise ValidationError("Quantités de livraison invalides.")
 
     def mark_delivered(self):
+        from .reservations import RESERVING, release
+        from .stock import apply_stock_changes
+
         if self.status == self.Status.DELIVERED:
             return
-        if self.lines.count() == 0:
-            raise ValidationError("Aucune ligne à livrer.")
+        if self.order.status in (Order.Status.DRAFT, Order.Status.CANCELLED):
+            # commande brouillon : rien de réservé ; annulée : réservation déjà libérée
+            raise ValidationError("Seules les commandes confirmées peuvent être livrées.")
         with transaction.atomic():
-            for dl in self.lines.select_for_update():
+            lines = list(self.lines.select_related("order_line__product"))
+            if not lines:
+                raise ValidationError("Aucune ligne à livrer.")
+            now = timezone.now()
+            # transition conditionnelle : un BL ne peut être livré qu'une fois,
+            # même si deux terminaux valident en même temps
+            claimed = (
+                DeliveryNote.objects.filter(pk=self.pk)
+                .exclude(status=self.Status.DELIVERED)
+                .update(status=self.Status.DELIVERED, delivered_at=now, updated_at=now)
+            )
+            if not claimed:
+                self.refresh_from_db(fields=["status", "delivered_at", "updated_at"])
+                return
+            tracked = []  # (produit, quantité livrée, quantité réservée couverte par ce BL)
+            for dl in lines:
                 ol = dl.order_line
-                # maj delivered_qty côté commande
-                ol.delivered_qty = money(ol.delivered_qty + dl.quantity)
-                ol.save(update_fields=["delivered_qty", "updated_at"])
-                # décrément stock si applicable
-                p = ol.product
-                if p.track_stock and p.type == Product.ProductType.GOOD:
-                    if p.stock_qty < dl.quantity:
-                        raise ValidationError(f"Stock insuffisant pour {p.sku}.")
-                    p.stock_qty = p.stock_qty - dl.quantity
-                    p.save(update_fields=["stock_qty", "updated_at"])
+                if ol.product.track_stock and ol.product.type == Product.ProductType.GOOD:
+                    # la ligne ne tient que son restant à livrer d'avant ce BL
+                    reserved = max(min(dl.quantity, ol.quantity - ol.delivered_qty), Decimal("0"))
+                    tracked.append((ol.product_id, dl.quantity, reserved))
+            # maj delivered_qty côté commande, en un seul UPDATE
+            OrderLine.objects.filter(pk__in=[dl.order_line_id for dl in lines]).update(
+                delivered_qty=models.F("delivered_qty") + models.Case(
+                    *[models.When(pk=dl.order_line_id, then=models.Value(dl.quantity)) for dl in lines],
+                    output_field=models.DecimalField(max_digits=14, decimal_places=3),
+                ),
+                updated_at=now,
+            )
+            if self.order.status in RESERVING:
+                # livré : sort de la réservation comme du stock, sans libérer plus que la commande ne tient
+                release([(pk, reserved) for pk, _, reserved in tracked])
+            # décrément stock si applicable
+            apply_stock_changes(
+                [(pk, -qty) for pk, qty, _ in tracked],
+                ProductStockMovement.Type.OUT,
+                delivery=self,
+                notes=f"Livraison {self.code}",
+            )
             self.status = self.Status.DELIVERED
-            self.delivered_at = timezone.now()
-            super().save(update_fields=["status", "delivered_at", "updated_at"])
+            self.delivered_at = now
+            self.updated_at = now
             # rafraîchir le statut de la commande
             self.order._refresh_delivery_status()
 
     def save(self, *args, **kwargs):
         if not self.code:
-            last_seq = DeliveryNote.objects.aggregate(m=models.Max("seq"))["m"] or 0
-            code, n = next_code("BL", last_seq)
-            self.code, self.seq = code, n
+            self.code, self.seq = next_code("BL", DeliveryNote)
         super().save(*args, **kwargs)
 
 
@@ -328,24 +490,35 @@ class Invoice(TimeStampedModel):
 
     class Meta:
         ordering = ["-created_at"]
-        indexes = [models.Index(fields=["status", "issue_date"])]
+        indexes = [
+            models.Index(fields=["status", "issue_date"]),
+            models.Index(fields=["created_at", "id"]),  # pagination par curseur
+            models.Index(fields=["status", "due_date"]),  # balance âgée (sales.aging)
+        ]
 
     def __str__(self) -> str:
         return self.code
 
     def recompute_totals(self, save=True):
-        sub = Decimal("0.00")
-        tax = Decimal("0.00")
-        for line in self.lines.all():
-            sub += money(line.subtotal)
-            tax += money(line.tax_amount)
+        from . import balances
+
+        # lignes et paiements en une seule requête, avec l'état enregistré (solde client)
+        row = (
+            Invoice.objects.filter(pk=self.pk)
+            .annotate(
+                sub=_sum_subquery(InvoiceLine, "invoice", "subtotal"),
+                tax=_sum_subquery(InvoiceLine, "invoice", "tax_amount"),
+                paid=_sum_subquery(Payment, "invoice", "amount"),
+            )
+            .values("sub", "tax", "paid", *balances.STATE_FIELDS)
+            .get()
+        )
+        sub, tax = money(row["sub"]), money(row["tax"])
         total = money(sub + tax)
-        self.subtotal = money(sub)
-        self.tax_amount = money(tax)
+        self.subtotal = sub
+        self.tax_amount = tax
         self.total = total
-        self.amount_paid = money(
-            self.payments.aggregate(s=models.Sum("amount"))["s"] or Decimal("0.00")
-        )
+        self.amount_paid = money(row["paid"])
         self.balance_due = money(total - self.amount_paid)
         # maj statut
         if self.status not in (self.Status.CANCELLED, self.Status.DRAFT):
@@ -359,6 +532,7 @@ class Invoice(TimeStampedModel):
             super().save(update_fields=[
                 "subtotal", "tax_amount", "total", "amount_paid", "balance_due", "status", "updated_at"
             ])
+            balances.invoice_changed(balances.InvoiceState.from_row(row), balances.InvoiceState.of(self))
 
     def issue(self):
         if self.status != self.Status.DRAFT:
@@ -367,11 +541,22 @@ class Invoice(TimeStampedModel):
         self.save(update_fields=["status", "updated_at"])
 
     def save(self, *args, **kwargs):
+        from . import balances
+
         if not self.code:
-            last_seq = Invoice.objects.aggregate(m=models.Max("seq"))["m"] or 0
-            code, n = next_code("INV", last_seq)
-            self.code, self.seq = code, n
+            self.code, self.seq = next_code("INV", Invoice)
+        old = None if self._state.adding else balances.stored_state(self, kwargs.get("update_fields"))
         super().save(*args, **kwargs)
+        if old is not balances.UNCHANGED:
+            balances.invoice_changed(old, balances.InvoiceState.of(self))
+
+    def delete(self, *args, **kwargs):
+        from . import balances
+
+        old = balances.stored_state(self)
+        result = super().delete(*args, **kwargs)
+        balances.invoice_changed(old, None)
+        return result
 
 
 class InvoiceLine(TimeStampedModel):
@@ -407,7 +592,34 @@ class InvoiceLine(TimeStampedModel):
             self.tax_rate = self.product.tax_rate
         self.compute_amounts()
         super().save(*args, **kwargs)
-        self.invoice.recompute_totals(save=True)
+        schedule_totals(self.invoice)
+
+
+# ---------- Mouvements de stock produits ----------
+class ProductStockMovement(TimeStampedModel):
+    """Journal append-only des variations de Product.stock_qty (voir sales.stock)."""
+    class Type(models.TextChoices):
+        IN = "IN", "Entrée"
+        OUT = "OUT", "Sortie"
+        ADJUSTMENT = "ADJUSTMENT", "Ajustement"
+
+    product = models.ForeignKey(Product, on_delete=models.PROTECT, related_name="stock_movements")
+    movement_type = models.CharField(max_length=12, choices=Type.choices)
+    quantity = models.DecimalField(max_digits=14, decimal_places=3)
+    previous_stock = models.DecimalField(max_digits=14, decimal_places=3)
+    new_stock = models.DecimalField(max_digits=14, decimal_places=3)
+    delivery = models.ForeignKey(
+        DeliveryNote, on_delete=models.SET_NULL, null=True, blank=True, related_name="stock_movements"
+    )
+    notes = models.TextField(blank=True)
+    created_by = models.CharField(max_length=200, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["product", "created_at"])]
+
+    def __str__(self) -> str:
+        return f"{self.get_movement_type_display()} · {self.product.sku} · {self.quantity}"
 
 
 # ---------- Paiements ----------
@@ -428,7 +640,10 @@ class Payment(TimeStampedModel):
 
     class Meta:
         ordering = ["-received_at"]
-        indexes = [models.Index(fields=["method", "received_at"])]
+        indexes = [
+            models.Index(fields=["method", "received_at"]),
+            models.Index(fields=["received_at", "id"]),  # pagination par curseur
+        ]
 
     def __str__(self) -> str:
         return f"{self.invoice.code} · {self.amount} {self.invoice.currency}"
@@ -438,9 +653,12 @@ class Payment(TimeStampedModel):
             raise ValidationError("Montant de paiement invalide.")
 
     def save(self, *args, **kwargs):
+        from . import balances
+
         super().save(*args, **kwargs)
-        # Recalcule les totaux et le statut de la facture
+        # Recalcule les totaux et le statut de la facture (et le solde du client)
         self.invoice.recompute_totals(save=True)
+        balances.payment_received(self.invoice.customer_id, self.received_at)
 
 # ---------- Points de vente ----------
 
@@ -504,22 +722,21 @@ class Quote(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
-        indexes = [models.Index(fields=["status", "created_at"])]
+        indexes = [
+            models.Index(fields=["status", "created_at"]),
+            models.Index(fields=["status", "valid_until"]),  # expiration en lot (sales.expiry)
+        ]
 
     def save(self, *args, **kwargs):
         if not self.code:
-            last_seq = Quote.objects.aggregate(m=models.Max("seq"))["m"] or 0
-            code, n = next_code("QTE", last_seq)
-            self.code, self.seq = code, n
+            self.code, self.seq = next_code("QTE", Quote)
         super().save(*args, **kwargs)
 
     def recompute_totals(self, save=True):
-        sub = tax = Decimal("0.00")
-        for line in self.lines.all():
-            sub += money(line.subtotal)
-            tax += money(line.tax_amount)
-        self.subtotal = money(sub)
-        self.tax_amount = money(tax)
+        agg = self.lines.aggregate(sub=Sum("subtotal"), tax=Sum("tax_amount"))
+        sub, tax = money(agg["sub"]), money(agg["tax"])
+        self.subtotal = sub
+        self.tax_amount = tax
         self.total = money(sub + tax)
         if save:
             super().save(update_fields=["subtotal", "tax_amount", "total", "updated_at"])
@@ -581,4 +798,4 @@ class QuoteLine(models.Model):
             self.unit_price = self.product.unit_price
         self.compute_amounts()
         super().save(*args, **kwargs)
-        self.quote.recompute_totals(save=True)
\ No newline at end of file
+        schedule_totals(self.quote)
\ No newline at end of file
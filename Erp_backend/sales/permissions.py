@@ -1,11 +1,11 @@
 from rest_framework import permissions
 
+from rbac.cache import granted
+
 def has_any(user, codes: list[str]):
     # accept both app_label.codename and raw codename coming from rbac.Feature
-    for code in codes:
-        if user.has_perm(f"rbac.{code}") or user.has_perm(f"sales.{code}"):
-            return True
-    return False
+    # (ensemble des permissions de l'utilisateur en cache : rbac.cache)
+    return granted(user, [f"{app}.{code}" for code in codes for app in ("rbac", "sales")])
 
 class SalesPermission(permissions.BasePermission):
     def has_permission(self, request, view):
@@ -27,10 +27,12 @@ class ProductsPermission(permissions.BasePermission):
         "destroy": ["stock_manage"],
         # custom actions
         "set_price": ["stock_manage"],
+        "bulk_import": ["stock_manage"],
         "adjust_stock": ["stock_manage"],
         "activate": ["stock_manage"],
         "deactivate": ["stock_manage"],
         # read
+        "atp": ["stock_view", "sales_view"],  # contrôle à la saisie des lignes (POS)
         "list": ["stock_view"],
         "retrieve": ["stock_view"],
     }
@@ -0,0 +1,152 @@
+# sales/reservations.py
+"""
+Réservations de stock des commandes clients et disponible à promettre.
+
+Product.reserved_qty = somme des quantités restant à livrer (quantity -
+delivered_qty) des lignes des commandes confirmées ou partiellement
+livrées, pour les produits suivis en stock (GOOD, track_stock). Comme
+Product.stock_qty (voir sales.stock), elle n'est jamais lue-modifiée-écrite
+en Python : chaque opération passe un seul UPDATE relatif pour tous ses
+produits.
+
+- Order.confirm : reserve_order(), UPDATE conditionnel (disponible >=
+  quantité), tout ou rien ; ValidationError si un produit manque : deux
+  points de vente ne peuvent plus promettre les mêmes dernières unités.
+- DeliveryNote.mark_delivered : release() des quantités livrées, bornées au
+  restant à livrer de chaque ligne (le stock baisse d'autant : le disponible
+  ne bouge pas). Une commande brouillon ou annulée ne se livre pas : elle ne
+  tient aucune réservation.
+- Order.cancel : release_order() du restant à livrer.
+
+Disponible à promettre = stock_qty - reserved_qty + incoming_qty (entrées
+attendues, saisies sur la fiche produit) : trois colonnes de la fiche,
+lues pour une liste de produits en une requête par available_to_promise().
+
+rebuild() (manage.py rebuild_reservations) recalcule reserved_qty depuis
+les commandes, après une écriture qui contourne les modèles.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Order, OrderLine, Product
+from .stock import QTY_FIELD, _per_product
+
+RESERVING = (Order.Status.CONFIRMED, Order.Status.PARTIALLY_DELIVERED)
+ZERO = Decimal("0.000")
+
+
+class _Shortage(Exception):
+    pass
+
+
+def available():
+    """Expression SQL du disponible à promettre d'un produit"""
+    return F("stock_qty") - F("reserved_qty") + F("incoming_qty")
+
+
+def _tracked_lines():
+    return OrderLine.objects.filter(product__type=Product.ProductType.GOOD, product__track_stock=True)
+
+
+def _totals(pairs):
+    totals = defaultdict(Decimal)
+    for pk, qty in pairs:
+        totals[pk] += Decimal(qty)
+    return {pk: qty for pk, qty in totals.items() if qty > 0}
+
+
+def order_quantities(order):
+    """Restant à livrer de la commande par produit suivi en stock (une requête)"""
+    return _totals(
+        _tracked_lines().filter(order=order)
+        .values_list("product_id", F("quantity") - F("delivered_qty"))
+    )
+
+
+def reserve(pairs):
+    """
+    Réserve des paires (product_id, quantité) ; tout ou rien, ValidationError
+    si le disponible d'un produit ne suffit pas.
+    """
+    totals = _totals(pairs)
+    if not totals:
+        return
+    need = _per_product(totals)
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                updated = (
+                    Product.objects.annotate(available=available())
+                    .filter(pk__in=totals.keys(), available__gte=need)
+                    .update(reserved_qty=F("reserved_qty") + need, updated_at=timezone.now())
+                )
+                if updated != len(totals):
+                    raise _Shortage
+        except _Shortage:
+            short = (
+                Product.objects.annotate(available=available())
+                .filter(pk__in=totals.keys(), available__lt=need)
+                .values_list("sku", flat=True)
+            )
+            raise ValidationError(f"Stock disponible insuffisant pour {', '.join(short)}.")
+
+
+def release(pairs):
+    """Libère des paires (product_id, quantité) ; la réservation ne descend pas sous zéro"""
+    totals = _totals(pairs)
+    if not totals:
+        return
+    Product.objects.filter(pk__in=totals.keys()).update(
+        reserved_qty=Greatest(F("reserved_qty") - _per_product(totals), Value(ZERO), output_field=QTY_FIELD),
+        updated_at=timezone.now(),
+    )
+
+
+def reserve_order(order):
+    reserve(order_quantities(order).items())
+
+
+def release_order(order):
+    release(order_quantities(order).items())
+
+
+def available_to_promise(product_ids):
+    """
+    {pk: {sku, stock, reserved, incoming, available, tracked}} pour les
+    produits demandés, en une requête sur la clé primaire. Un produit non
+    suivi en stock (service...) est toujours disponible (available None).
+    """
+    rows = Product.objects.filter(pk__in=product_ids).values_list(
+        "pk", "sku", "type", "track_stock", "stock_qty", "reserved_qty", "incoming_qty",
+    )
+    result = {}
+    for pk, sku, type_, track_stock, stock, reserved, incoming in rows:
+        tracked = track_stock and type_ == Product.ProductType.GOOD
+        result[pk] = {
+            "sku": sku,
+            "tracked": tracked,
+            "stock": stock,
+            "reserved": reserved,
+            "incoming": incoming,
+            "available": stock - reserved + incoming if tracked else None,
+        }
+    return result
+
+
+def rebuild(queryset=None):
+    """Recalcule reserved_qty (de tous les produits par défaut) depuis les commandes ; retourne le nombre de produits"""
+    queryset = Product.objects.all() if queryset is None else queryset
+    open_lines = (
+        _tracked_lines().filter(product=OuterRef("pk"), order__status__in=RESERVING)
+        .order_by().values("product")
+        .annotate(s=Sum(F("quantity") - F("delivered_qty"))).values("s")
+    )
+    return queryset.update(
+        reserved_qty=Coalesce(Subquery(open_lines, output_field=QTY_FIELD), Value(ZERO), output_field=QTY_FIELD),
+    )
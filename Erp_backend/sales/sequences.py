@@ -0,0 +1,107 @@
+# sales/sequences.py
+"""
+Numérotation des documents (ORD, BL, INV, QTE).
+
+Chaque préfixe a une ligne dans DocumentSequence. Un worker réserve un bloc de
+numéros d'un coup (UPDATE last_value = last_value + n) puis les distribue
+depuis la mémoire sans toucher la base.
+
+Le verrou de la ligne est pris par cet UPDATE et tenu jusqu'à la fin de la
+transaction de l'appelant (les serializers écrivent sous transaction.atomic :
+l'atomic interne n'est qu'un savepoint). Les blocs servent à ce que seul un
+document sur n prenne ce verrou.
+
+Les blocs non consommés au redémarrage d'un process laissent des trous dans la
+numérotation ; les factures (INV) sont donc réservées une par une par défaut
+(DOCUMENT_SEQUENCE_BLOCK_SIZES), ce qui sérialise leurs créations.
+"""
+import threading
+
+from django.conf import settings
+from django.db import IntegrityError, models, transaction
+
+DEFAULT_BLOCK_SIZE = 50
+
+_lock = threading.Lock()
+_pool: dict[str, list[list[int]]] = {}  # prefix -> blocs [next, end) déjà validés en base, par ordre croissant
+
+
+def block_size(prefix: str) -> int:
+    sizes = getattr(settings, "DOCUMENT_SEQUENCE_BLOCK_SIZES", {})
+    if prefix in sizes:
+        return max(1, int(sizes[prefix]))
+    return max(1, int(getattr(settings, "DOCUMENT_SEQUENCE_BLOCK_SIZE", DEFAULT_BLOCK_SIZE)))
+
+
+def reset_pool():
+    """Oublie les blocs en mémoire (tests, changement de base)."""
+    with _lock:
+        _pool.clear()
+
+
+def _take_from_pool(prefix: str) -> int | None:
+    with _lock:
+        blocks = _pool.get(prefix)
+        while blocks:
+            block = blocks[0]
+            if block[0] < block[1]:
+                n = block[0]
+                block[0] += 1
+                return n
+            blocks.pop(0)
+        return None
+
+
+def _publish(prefix: str, start: int, end: int):
+    if start >= end:
+        return
+    with _lock:
+        # plusieurs threads peuvent réserver en même temps : tous les blocs
+        # sont gardés, les plus petits numéros servis d'abord
+        blocks = _pool.setdefault(prefix, [])
+        blocks.append([start, end])
+        blocks.sort()
+
+
+def _reserve_block(prefix: str, size: int, model) -> int:
+    """
+    Réserve [first, first + size) en base et retourne first.
+    La ligne est créée au premier appel à partir du Max(seq) existant.
+    """
+    from .models import DocumentSequence
+
+    with transaction.atomic():
+        updated = DocumentSequence.objects.filter(prefix=prefix).update(
+            last_value=models.F("last_value") + size
+        )
+        if not updated:
+            seed = 0
+            if model is not None:
+                seed = model.objects.aggregate(m=models.Max("seq"))["m"] or 0
+            try:
+                with transaction.atomic():
+                    DocumentSequence.objects.create(prefix=prefix, last_value=seed + size)
+            except IntegrityError:
+                # créée en parallèle par un autre worker
+                DocumentSequence.objects.filter(prefix=prefix).update(
+                    last_value=models.F("last_value") + size
+                )
+        last = DocumentSequence.objects.filter(prefix=prefix).values_list("last_value", flat=True).get()
+    return last - size + 1
+
+
+def next_number(prefix: str, model=None) -> int:
+    n = _take_from_pool(prefix)
+    if n is not None:
+        return n
+
+    size = block_size(prefix)
+    first = _reserve_block(prefix, size, model)
+    end = first + size
+    if transaction.get_connection().in_atomic_block:
+        # Le bloc n'existe en base qu'après le commit : si la transaction est
+        # annulée, les numéros restants ne doivent pas être redistribués.
+        transaction.on_commit(lambda: _publish(prefix, first + 1, end))
+    else:
+        _publish(prefix, first + 1, end)
+    return first
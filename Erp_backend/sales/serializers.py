@@ -1,11 +1,15 @@
 # sales/serializers.py 
 from rest_framework import serializers
+
+from erp_api.expand import ExpandableFieldsMixin
 from .models import (
     Customer, Product, Order, OrderLine,
     DeliveryNote, DeliveryLine,
-    Invoice, InvoiceLine, Payment ,SalesPoint ,Quote, QuoteLine
+    Invoice, InvoiceLine, Payment ,SalesPoint ,Quote, QuoteLine, ProductStockMovement,
+    bulk_create_lines, deferred_totals,
 )
 
+import uuid
 from decimal import Decimal
 from django.db import transaction
 from django.utils import timezone
@@ -16,10 +20,41 @@ class SalesPointSerializer(serializers.ModelSerializer):
         model = SalesPoint
         fields = "__all__"
 
+
+# ---------- Lignes : résolution groupée des produits ----------
+class LineProductField(serializers.PrimaryKeyRelatedField):
+    """Lit le produit dans le cache rempli par LineListSerializer avant de requêter."""
+    def to_internal_value(self, data):
+        cache = getattr(self.parent, "_products", None)
+        if cache is not None:
+            product = cache.get(str(data))
+            if product is not None:
+                return product
+        return super().to_internal_value(data)
+
+
+class LineListSerializer(serializers.ListSerializer):
+    """Charge tous les produits des lignes en une requête au lieu d'une par ligne."""
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            ids = set()
+            for item in data:
+                try:
+                    ids.add(uuid.UUID(str(item["product"])))
+                except (TypeError, KeyError, ValueError):
+                    continue
+            products = Product.objects.in_bulk(ids) if ids else {}
+            self.child._products = {str(pk): p for pk, p in products.items()}
+        return super().to_internal_value(data)
+
+
 class OrderLineWriteSerializer(serializers.ModelSerializer):
+    product = LineProductField(queryset=Product.objects.all())
+
     class Meta:
         model = OrderLine
         fields = ("product", "description", "quantity", "unit_price", "tax_rate")
+        list_serializer_class = LineListSerializer
 
     def validate(self, attrs):
         product = attrs["product"]
@@ -59,9 +94,7 @@ class OrderWriteSerializer(serializers.ModelSerializer):
     def create(self, data):
         lines = data.pop("lines", [])
         order = Order.objects.create(**data)
-        for ln in lines:
-            OrderLine.objects.create(order=order, **ln)
-        order.recompute_totals(save=True)
+        bulk_create_lines(OrderLine, order, lines)
         return order
 
 
@@ -90,9 +123,7 @@ class OrderUpdateSerializer(serializers.ModelSerializer):
         instance.save()
         if lines is not None:
             instance.lines.all().delete()
-            for ln in lines:
-                OrderLine.objects.create(order=instance, **ln)
-            instance.recompute_totals(save=True)
+            bulk_create_lines(OrderLine, instance, lines)
         return instance
 
 
@@ -113,7 +144,7 @@ class ProductWriteSerializer(serializers.ModelSerializer):
         fields = (
             "sku", "name", "description", "type",
             "unit", "unit_price",
-            "track_stock", "stock_qty",
+            "track_stock", "stock_qty", "incoming_qty",
             "tax_rate", "is_active",
         )
 
@@ -124,15 +155,26 @@ class ProductWriteSerializer(serializers.ModelSerializer):
         return attrs
 
 
-class OrderLineSerializer(serializers.ModelSerializer):
+class ProductStockMovementSerializer(serializers.ModelSerializer):
+    product_sku = serializers.CharField(source="product.sku", read_only=True)
+    product_name = serializers.CharField(source="product.name", read_only=True)
+    delivery_code = serializers.CharField(source="delivery.code", read_only=True, default=None)
+
+    class Meta:
+        model = ProductStockMovement
+        fields = "__all__"
+
+
+class OrderLineSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     product_detail = ProductSerializer(source="product", read_only=True)
 
     class Meta:
         model = OrderLine
         fields = "__all__"
         read_only_fields = ("subtotal", "tax_amount", "total", "delivered_qty")
+        expandable_fields = ("product_detail",)
 
-class OrderSerializer(serializers.ModelSerializer):
+class OrderSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     lines = OrderLineSerializer(many=True, read_only=True)
     customer_detail = CustomerSerializer(source="customer", read_only=True)
     sales_point_detail = SalesPointSerializer(source="sales_point", read_only=True)
@@ -141,13 +183,14 @@ class OrderSerializer(serializers.ModelSerializer):
         model = Order
         fields = "__all__"
         read_only_fields = ("code", "seq", "subtotal", "tax_amount", "total", "status")
+        expandable_fields = ("lines", "customer_detail", "sales_point_detail")
 
 class ProductLiteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Product
         fields = ("id", "sku", "name")
 
-class OrderLineLiteSerializer(serializers.ModelSerializer):
+class OrderLineLiteSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     product_detail = ProductLiteSerializer(source="product", read_only=True)
 
     class Meta:
@@ -159,34 +202,37 @@ class OrderLineLiteSerializer(serializers.ModelSerializer):
             "quantity",
             "delivered_qty",
         )
+        expandable_fields = ("product_detail",)
 
 class CustomerLiteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Customer
         fields = ("id", "name", "email", "phone")
 
-class OrderLiteSerializer(serializers.ModelSerializer):
+class OrderLiteSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     customer_detail = CustomerLiteSerializer(source="customer", read_only=True)
     lines = OrderLineLiteSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
         fields = ("id", "code", "customer", "customer_detail", "currency", "lines")
+        expandable_fields = ("customer_detail", "lines")
 
 
 # =========================
 # Delivery Notes (READ)
 # =========================
 
-class DeliveryLineReadSerializer(serializers.ModelSerializer):
+class DeliveryLineReadSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     # Include rich details for the referenced order line (with product detail)
     order_line_detail = OrderLineLiteSerializer(source="order_line", read_only=True)
 
     class Meta:
         model = DeliveryLine
         fields = "__all__"
+        expandable_fields = ("order_line_detail",)
 
-class DeliveryNoteSerializer(serializers.ModelSerializer):
+class DeliveryNoteSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     lines = DeliveryLineReadSerializer(many=True, read_only=True)
     order_detail = OrderLiteSerializer(source="order", read_only=True)
 
@@ -194,6 +240,7 @@ class DeliveryNoteSerializer(serializers.ModelSerializer):
         model = DeliveryNote
         fields = "__all__"
         read_only_fields = ("code", "seq", "status", "delivered_at")
+        expandable_fields = ("lines", "order_detail")
 
 
 # =========================
@@ -235,6 +282,8 @@ class DeliveryNoteWriteSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError({"order": "This field is required."})
         if not isinstance(lines, list) or len(lines) == 0:
             raise serializers.ValidationError({"lines": "Provide at least one line."})
+        if order.status in (Order.Status.DRAFT, Order.Status.CANCELLED):
+            raise serializers.ValidationError({"order": "Only confirmed orders can be delivered."})
 
         # For updates, ensure we're still in DRAFT status
         if self.instance and self.instance.status != DeliveryNote.Status.DRAFT:
@@ -298,24 +347,28 @@ class DeliveryNoteWriteSerializer(serializers.ModelSerializer):
 
         return instance
 
-class InvoiceLineSerializer(serializers.ModelSerializer):
+class InvoiceLineSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = InvoiceLine
         fields = "__all__"
         read_only_fields = ("subtotal", "tax_amount", "total")
 
-class InvoiceSerializer(serializers.ModelSerializer):
+class InvoiceSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     lines = InvoiceLineSerializer(many=True, read_only=True)
 
     class Meta:
         model = Invoice
         fields = "__all__"
         read_only_fields = ("code", "seq", "subtotal", "tax_amount", "total", "amount_paid", "balance_due", "status")
+        expandable_fields = ("lines",)
 
 class InvoiceLineWriteSerializer(serializers.ModelSerializer):
+    product = LineProductField(queryset=Product.objects.all())
+
     class Meta:
         model = InvoiceLine
         fields = ("product", "description", "quantity", "unit_price", "tax_rate")
+        list_serializer_class = LineListSerializer
 
     def validate(self, attrs):
         p = attrs["product"]
@@ -354,9 +407,9 @@ class InvoiceWriteSerializer(serializers.ModelSerializer):
     def create(self, validated_data):
         lines = validated_data.pop("lines", [])
         inv = Invoice.objects.create(**validated_data)
-        for ln in lines:
-            InvoiceLine.objects.create(invoice=inv, **ln)
-        inv.recompute_totals(save=True)
+        with deferred_totals():
+            for ln in lines:
+                InvoiceLine.objects.create(invoice=inv, **ln)
         return inv
     
 # Optional: generate an invoice directly from an Order (copy lines)
@@ -367,16 +420,16 @@ class InvoiceFromOrderSerializer(serializers.Serializer):
     def create(self, data):
         order = Order.objects.select_related("customer").prefetch_related("lines__product").get(pk=data["order_id"])
         inv = Invoice.objects.create(order=order, customer=order.customer, currency=order.currency, notes=order.notes)
-        for ol in order.lines.all():
-            InvoiceLine.objects.create(
-                invoice=inv,
+        bulk_create_lines(InvoiceLine, inv, [
+            dict(
                 product=ol.product,
                 description=ol.description,
                 quantity=ol.quantity,
                 unit_price=ol.unit_price,
                 tax_rate=ol.tax_rate,
             )
-        inv.recompute_totals(save=True)
+            for ol in order.lines.all()
+        ])
         return inv
 
 
@@ -400,9 +453,12 @@ class PaymentSerializer(serializers.ModelSerializer):
 
 # ---------- Devis ----------
 class QuoteLineWriteSerializer(serializers.ModelSerializer):
+    product = LineProductField(queryset=Product.objects.all())
+
     class Meta:
         model = QuoteLine
         fields = ("product", "description", "quantity")  # unit_price/tax_rate come from Product
+        list_serializer_class = LineListSerializer
 
 class QuoteWriteSerializer(serializers.ModelSerializer):
     lines = QuoteLineWriteSerializer(many=True)
@@ -415,26 +471,27 @@ class QuoteWriteSerializer(serializers.ModelSerializer):
     def create(self, data):
         lines = data.pop("lines", [])
         quote = Quote.objects.create(**data)
-        for ln in lines:
-            product = ln["product"] if isinstance(ln["product"], Product) else Product.objects.get(pk=ln["product"])
-            QuoteLine.objects.create(
-                quote=quote,
-                product=product,
-                description=ln.get("description",""),
-                quantity=ln["quantity"],
-                unit_price=product.unit_price,
-                tax_rate=product.tax_rate,
-            )
-        quote.recompute_totals(save=True)
+        with deferred_totals():
+            for ln in lines:
+                product = ln["product"] if isinstance(ln["product"], Product) else Product.objects.get(pk=ln["product"])
+                QuoteLine.objects.create(
+                    quote=quote,
+                    product=product,
+                    description=ln.get("description",""),
+                    quantity=ln["quantity"],
+                    unit_price=product.unit_price,
+                    tax_rate=product.tax_rate,
+                )
         return quote
 
-class QuoteLineSerializer(serializers.ModelSerializer):
+class QuoteLineSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     product_detail = ProductSerializer(source="product", read_only=True)
     class Meta:
         model = QuoteLine
         fields = "__all__"
+        expandable_fields = ("product_detail",)
 
-class QuoteSerializer(serializers.ModelSerializer):
+class QuoteSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
     lines = QuoteLineSerializer(many=True, read_only=True)
     customer_detail = CustomerSerializer(source="customer", read_only=True)
     sales_point_detail = SalesPointSerializer(source="sales_point", read_only=True)
@@ -442,4 +499,5 @@ class QuoteSerializer(serializers.ModelSerializer):
     class Meta:
         model = Quote
         fields = "__all__"
-        read_only_fields = ("code","seq","subtotal","tax_amount","total","status","sent_at","decided_at")
\ No newline at end of file
+        read_only_fields = ("code","seq","subtotal","tax_amount","total","status","sent_at","decided_at")
+        expandable_fields = ("lines", "customer_detail", "sales_point_detail")
\ No newline at end of file
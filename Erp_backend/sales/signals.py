@@ -0,0 +1,13 @@
+"""Invalidation du cache de la balance âgée (sales.aging)"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import aging
+from .models import Invoice, Payment
+
+
+@receiver([post_save, post_delete], sender=Invoice)
+@receiver([post_save, post_delete], sender=Payment)
+def invalidate_aging(sender, **kwargs):
+    # recompute_totals() passe aussi par save() : chaque paiement invalide
+    aging.invalidate()
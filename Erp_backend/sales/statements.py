@@ -0,0 +1,229 @@
+# sales/statements.py
+"""
+Import des relevés bancaires : un paiement par virement reçu.
+
+Colonnes : date (YYYY-MM-DD, JJ/MM/AAAA ou date-heure ISO), amount (point
+ou virgule décimale), reference (libellé du virement, gardé comme
+Payment.reference), label (optionnel), invoice (optionnel : code facture
+explicite, sinon cherché dans reference puis label), method (défaut
+TRANSFER).
+
+Par paquet, dans une transaction :
+- les codes facture du paquet sont lus en une requête (verrouillée) dans un
+  index code -> facture, les paiements déjà importés (même référence sur la
+  même facture ; sans référence : même date et même montant sur la même
+  facture) en une autre ;
+- chaque ligne est rapprochée en mémoire ; sont rejetées : facture
+  introuvable, ambiguë, non émise ou annulée, montant supérieur au restant
+  dû (en tenant compte des lignes précédentes du fichier), doublon ;
+- le restant dû part du balance_due lu sous verrou ; en simulation (rien
+  n'est écrit) il part des restants dus des paquets précédents ;
+- les paiements sont créés par un seul bulk_create, puis les factures
+  touchées recalculées une fois chacune par un UPDATE ensembliste
+  (amount_paid, balance_due, statut) et les soldes de leurs clients
+  recalculés (sales.balances.rebuild) : Payment.save() n'est pas appelé.
+"""
+import datetime
+import re
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import GreaterThanOrEqual, LessThanOrEqual
+from django.utils import timezone
+
+from erp_api.importing import DEFAULT_BATCH_SIZE, ImportReport, batched
+
+from . import aging, balances
+from .models import Customer, Invoice, Payment, _sum_subquery
+
+CODE_RE = re.compile(r"\bINV\d{6}\b", re.IGNORECASE)
+OPEN_STATUSES = (Invoice.Status.ISSUED, Invoice.Status.PARTIALLY_PAID)
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y")
+
+
+class LineError(ValueError):
+    pass
+
+
+def _parse_amount(value):
+    text = str(value or "").replace(" ", "").replace("\u00a0", "")
+    if "," in text and "." in text:
+        # le dernier séparateur est le décimal : 1.234,56 ou 1,234.56
+        text = text.replace("." if text.rfind(",") > text.rfind(".") else ",", "")
+    text = text.replace(",", ".")
+    try:
+        amount = Decimal(text).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise LineError({"amount": "Montant invalide."})
+    if amount <= 0:
+        raise LineError({"amount": "Montant invalide (crédits uniquement)."})
+    return amount
+
+
+def _parse_date(value):
+    text = str(value or "").strip()
+    for fmt in DATE_FORMATS:
+        try:
+            day = datetime.datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+        return timezone.make_aware(day)
+    try:
+        moment = datetime.datetime.fromisoformat(text)
+    except ValueError:
+        raise LineError({"date": "Date invalide (YYYY-MM-DD ou JJ/MM/AAAA attendu)."})
+    return moment if timezone.is_aware(moment) else timezone.make_aware(moment)
+
+
+def _codes(row):
+    explicit = str(row.get("invoice") or "").strip()
+    if explicit:
+        return {explicit.upper()}
+    for column in ("reference", "label"):
+        codes = {code.upper() for code in CODE_RE.findall(str(row.get(column) or ""))}
+        if codes:
+            return codes
+    return set()
+
+
+def _parse(row):
+    method = str(row.get("method") or Payment.Method.TRANSFER).strip().upper()
+    if method not in Payment.Method.values:
+        raise LineError({"method": f"Mode de paiement inconnu : {method}."})
+    codes = _codes(row)
+    if not codes:
+        raise LineError({"invoice": "Aucun code facture dans la ligne."})
+    if len(codes) > 1:
+        raise LineError({"invoice": f"Plusieurs factures citées : {', '.join(sorted(codes))}."})
+    return {
+        "code": codes.pop(),
+        "amount": _parse_amount(row.get("amount")),
+        "received_at": _parse_date(row.get("date")),
+        "reference": str(row.get("reference") or "").strip()[:64],
+        "notes": str(row.get("label") or "").strip(),
+        "method": method,
+    }
+
+
+def recompute_paid_totals(invoice_ids):
+    """
+    amount_paid, balance_due et statut des factures depuis leurs paiements,
+    en un UPDATE (même règle de statut que Invoice.recompute_totals).
+    """
+    paid = Coalesce(_sum_subquery(Payment, "invoice", "amount"), Value(Decimal("0.00")))
+    return Invoice.objects.filter(pk__in=invoice_ids).update(
+        amount_paid=paid,
+        balance_due=F("total") - paid,
+        status=Case(
+            When(status__in=(Invoice.Status.CANCELLED, Invoice.Status.DRAFT), then=F("status")),
+            When(LessThanOrEqual(paid, Value(0)), then=Value(Invoice.Status.ISSUED)),
+            When(GreaterThanOrEqual(paid, F("total")), then=Value(Invoice.Status.PAID)),
+            default=Value(Invoice.Status.PARTIALLY_PAID),
+        ),
+        updated_at=timezone.now(),
+    )
+
+
+def import_statement(rows, *, batch_size=None, dry_run=False, created_by=""):
+    """
+    rows : dicts (voir erp_api.importing.read_rows) ; retourne un ImportReport
+    (created = paiements). created_by : signature commune des imports, Payment n'a pas d'auteur.
+    """
+    batch_size = batch_size or getattr(settings, "IMPORT_BATCH_SIZE", DEFAULT_BATCH_SIZE)
+    report = ImportReport(dry_run=dry_run)
+    remaining = {}  # code -> restant dû, lignes des paquets écrits déduites
+    for batch in batched(enumerate(rows, 1), batch_size):
+        report.total += len(batch)
+        mark = report.mark()
+        deducted = {}  # restants dus modifiés par ce paquet, reportés dans remaining une fois écrit
+        try:
+            with transaction.atomic():
+                payments = _match(batch, report, remaining, deducted, lock=not dry_run)
+                if payments and not dry_run:
+                    invoice_ids = {p.invoice_id for p in payments}
+                    Payment.objects.bulk_create(payments)
+                    recompute_paid_totals(invoice_ids)
+                    balances.rebuild(Customer.objects.filter(invoices__in=invoice_ids).distinct())
+        except DatabaseError as exc:
+            # paquet annulé : toutes ses lignes en échec, restants dus inchangés
+            report.fail_batch(mark, batch, lambda row: str(row.get("reference") or "") or None, exc)
+            continue
+        remaining.update(deducted)
+        report.created += len(payments)
+    if report.created and not dry_run:
+        aging.invalidate()  # bulk_create n'émet pas de signaux
+    return report
+
+
+def _key(line):
+    """Clé de doublon : référence, à défaut date et montant, sur la facture"""
+    if line["reference"]:
+        return (line["reference"], line["code"])
+    return (line["received_at"], line["amount"], line["code"])
+
+
+def _imported(parsed, codes):
+    """Clés (_key) des paiements déjà enregistrés pour les lignes du paquet"""
+    references = {line["reference"] for _, line in parsed if line["reference"]}
+    keys = set(
+        Payment.objects.filter(reference__in=references, invoice__code__in=codes)
+        .values_list("reference", "invoice__code")
+    )
+    blank = {line["code"] for _, line in parsed if not line["reference"]}
+    if blank:
+        keys.update(
+            Payment.objects.filter(reference="", invoice__code__in=blank)
+            .values_list("received_at", "amount", "invoice__code")
+        )
+    return keys
+
+
+def _match(batch, report, remaining, deducted, lock):
+    parsed = []
+    for number, row in batch:
+        try:
+            parsed.append((number, _parse(row)))
+        except LineError as exc:
+            report.error(number, str(row.get("reference") or "") or None, exc.args[0])
+
+    codes = {line["code"] for _, line in parsed}
+    invoices = Invoice.objects.filter(code__in=codes)
+    if lock:
+        invoices = invoices.select_for_update()
+    index = {values["code"]: values for values in invoices.values("pk", "code", "status", "balance_due")}
+    imported = _imported(parsed, codes)
+
+    payments = []
+    for number, line in parsed:
+        code, label = line["code"], line["reference"] or line["code"]
+        invoice = index.get(code)
+        if invoice is None:
+            report.error(number, label, {"invoice": f"Facture introuvable : {code}."})
+            continue
+        if invoice["status"] not in OPEN_STATUSES:
+            report.error(number, label, {"invoice": f"Facture {code} non payable (statut {invoice['status']})."})
+            continue
+        if _key(line) in imported:
+            report.error(number, label, {"reference": "Virement déjà importé pour cette facture."})
+            continue
+        # écriture : balance_due verrouillé fait foi (paquets précédents déjà recalculés,
+        # paiements saisis entre-temps compris) ; simulation : rien n'a été écrit
+        left = invoice["balance_due"] if lock else remaining.get(code, invoice["balance_due"])
+        left = deducted.get(code, left)
+        if line["amount"] > left:
+            report.error(number, label, {"amount": f"Montant supérieur au restant dû ({left})."})
+            continue
+        deducted[code] = left - line["amount"]
+        imported.add(_key(line))
+        payments.append(Payment(
+            invoice_id=invoice["pk"],
+            amount=line["amount"],
+            method=line["method"],
+            reference=line["reference"],
+            received_at=line["received_at"],
+            notes=line["notes"] or "Import relevé bancaire",
+        ))
+    return payments
@@ -0,0 +1,84 @@
+# sales/stock.py
+"""
+Registre de stock des produits finis.
+
+Product.stock_qty n'est jamais lu-modifié-écrit en Python : chaque variation
+passe par un UPDATE conditionnel (stock_qty = stock_qty + delta WHERE
+stock_qty >= -delta), un seul pour tous les produits d'une opération, puis
+les mouvements correspondants sont insérés en bloc dans ProductStockMovement.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.core.exceptions import ValidationError
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
+from django.utils import timezone
+
+from .models import Product, ProductStockMovement
+
+QTY_FIELD = models.DecimalField(max_digits=14, decimal_places=3)
+
+
+class _Shortage(Exception):
+    pass
+
+
+def _per_product(changes: dict) -> models.Expression:
+    return Case(
+        *[When(pk=pk, then=Value(qty)) for pk, qty in changes.items()],
+        output_field=QTY_FIELD,
+    )
+
+
+def apply_stock_changes(changes, movement_type, *, delivery=None, notes="", created_by=""):
+    """
+    Applique des paires (product_id, delta) (delta < 0 = sortie ; un même
+    produit peut apparaître plusieurs fois) et journalise un mouvement par
+    produit. Tout ou rien : ValidationError si un produit
+    n'a pas assez de stock.
+    """
+    totals = defaultdict(Decimal)
+    for pk, delta in changes:
+        totals[pk] += Decimal(delta)
+    totals = {pk: qty for pk, qty in totals.items() if qty}
+    if not totals:
+        return []
+
+    need = _per_product({pk: -qty for pk, qty in totals.items()})
+    now = timezone.now()
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                updated = (
+                    Product.objects
+                    .filter(pk__in=totals.keys(), stock_qty__gte=need)
+                    .update(stock_qty=F("stock_qty") + _per_product(totals), updated_at=now)
+                )
+                if updated != len(totals):
+                    raise _Shortage
+        except _Shortage:
+            # savepoint annulé : on relit les stocks d'avant pour nommer les produits
+            short = (
+                Product.objects.filter(pk__in=totals.keys(), stock_qty__lt=need)
+                .values_list("sku", flat=True)
+            )
+            raise ValidationError(f"Stock insuffisant pour {', '.join(short)}.")
+
+        # les lignes sont verrouillées par l'UPDATE : la valeur lue est la nôtre
+        new_stock = dict(Product.objects.filter(pk__in=totals.keys()).values_list("pk", "stock_qty"))
+        movements = [
+            ProductStockMovement(
+                product_id=pk,
+                movement_type=movement_type,
+                quantity=abs(qty),
+                previous_stock=new_stock[pk] - qty,
+                new_stock=new_stock[pk],
+                delivery=delivery,
+                notes=notes,
+                created_by=created_by,
+            )
+            for pk, qty in totals.items()
+        ]
+        ProductStockMovement.objects.bulk_create(movements)
+    return movements
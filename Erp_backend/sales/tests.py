@@ -1,3 +1,718 @@
-from django.test import TestCase
+import csv
+import datetime
+import io
+import json
+from decimal import Decimal
+from unittest import mock
+from urllib.parse import urlencode
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from erp_api import caching, search
+
+from . import aging, balances, expiry, reservations, sequences
+from .catalog import import_products
+from .models import (
+    Customer, DeliveryLine, DeliveryNote, DocumentSequence, Invoice, InvoiceLine, Order, OrderLine, Payment, Product,
+    ProductStockMovement, Quote, bulk_create_lines,
+)
+from .statements import import_statement
+from .stock import apply_stock_changes
+
+
+class SalesAPITestCase(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        cls.customer = Customer.objects.create(name='Client')
+        cls.product = Product.objects.create(
+            sku='SKU-1', name='Produit', unit_price=Decimal('10.00'), stock_qty=Decimal('100'),
+        )
+        cls.order = Order.objects.create(customer=cls.customer)
+        bulk_create_lines(OrderLine, cls.order, [
+            dict(product=cls.product, quantity=Decimal('2'), unit_price=None, tax_rate=None)
+            for _ in range(3)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+@override_settings(DOCUMENT_SEQUENCE_BLOCK_SIZES={'ORD': 5})
+class DocumentSequenceTests(SalesAPITestCase):
+
+    def setUp(self):
+        super().setUp()
+        sequences.reset_pool()
+        self.addCleanup(sequences.reset_pool)
+
+    def last_value(self):
+        return DocumentSequence.objects.get(prefix='ORD').last_value
+
+    def test_seeded_from_existing_documents(self):
+        DocumentSequence.objects.filter(prefix='ORD').delete()
+        Order.objects.filter(pk=self.order.pk).update(seq=41)
+        self.assertEqual(sequences.next_number('ORD', Order), 42)
+        self.assertEqual(self.last_value(), 46)
+
+    def test_block_served_from_memory_after_commit(self):
+        start = self.last_value()
+        with self.captureOnCommitCallbacks(execute=True):
+            first = sequences.next_number('ORD', Order)
+        with CaptureQueriesContext(connection) as ctx:
+            rest = [sequences.next_number('ORD', Order) for _ in range(4)]
+        self.assertEqual([first, *rest], list(range(start + 1, start + 6)))
+        self.assertEqual(len(ctx), 0)
+        self.assertEqual(sequences.next_number('ORD', Order), start + 6)  # bloc suivant
+        self.assertEqual(self.last_value(), start + 10)
+
+    def test_rolled_back_block_not_reissued(self):
+        start = self.last_value()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    first = sequences.next_number('ORD', Order)
+                    raise RuntimeError
+            except RuntimeError:
+                pass
+        self.assertEqual(self.last_value(), start)
+        self.assertEqual(sequences.next_number('ORD', Order), first)  # redonné par la base, pas par la mémoire
+        self.assertEqual(self.last_value(), start + 5)
+
+    def test_concurrent_blocks_all_kept(self):
+        sequences._publish('ORD', 11, 15)
+        sequences._publish('ORD', 6, 10)
+        self.assertEqual([sequences.next_number('ORD', Order) for _ in range(8)], [6, 7, 8, 9, 11, 12, 13, 14])
+
+
+class DocumentTotalsTests(SalesAPITestCase):
+
+    def create_invoice(self, n):
+        payload = {
+            'customer': str(self.customer.pk),
+            'issue_date': '2026-01-15',
+            'lines': [
+                {'product': str(self.product.pk), 'quantity': '1', 'unit_price': '10.00', 'tax_rate': '0.00'}
+                for _ in range(n)
+            ],
+        }
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.post('/api/sales/invoices/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        totals = sum('SUM(' in q['sql'] and 'sales_invoiceline' in q['sql'] for q in ctx.captured_queries)
+        return len(ctx), totals
+
+    def test_invoice_totals_computed_once(self):
+        one_line, totals = self.create_invoice(1)
+        self.assertEqual(totals, 1)
+        ten_lines, totals = self.create_invoice(10)
+        self.assertEqual(totals, 1)
+        self.assertEqual(ten_lines - one_line, 9)  # un INSERT par ligne, rien d'autre
+        self.assertEqual(Invoice.objects.latest('created_at').subtotal, Decimal('100.00'))
+
+
+class StockLedgerTests(SalesAPITestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.other = Product.objects.create(sku='SKU-2', name='Autre', unit_price=Decimal('5.00'), stock_qty=Decimal('3'))
+
+    def stock(self, product):
+        return Product.objects.values_list('stock_qty', flat=True).get(pk=product.pk)
+
+    def test_shortage_rolls_everything_back(self):
+        with self.assertRaisesMessage(ValidationError, 'SKU-2'):
+            apply_stock_changes(
+                [(self.product.pk, Decimal('-5')), (self.other.pk, Decimal('-4'))], ProductStockMovement.Type.OUT,
+            )
+        self.assertEqual((self.stock(self.product), self.stock(self.other)), (Decimal('100'), Decimal('3')))
+        self.assertFalse(ProductStockMovement.objects.exists())
+
+    def test_repeated_products_aggregate_in_one_update(self):
+        changes = [(self.product.pk, Decimal('-2')), (self.other.pk, Decimal('-1')), (self.product.pk, Decimal('-3'))]
+        with CaptureQueriesContext(connection) as ctx:
+            movements = apply_stock_changes(changes, ProductStockMovement.Type.OUT)
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(len(movements), 2)
+        self.assertEqual((self.stock(self.product), self.stock(self.other)), (Decimal('95'), Decimal('2')))
+
+    def test_ledger_matches_stock(self):
+        apply_stock_changes([(self.product.pk, Decimal('-7'))], ProductStockMovement.Type.OUT)
+        apply_stock_changes([(self.product.pk, Decimal('12.5'))], ProductStockMovement.Type.IN)
+        apply_stock_changes([(self.product.pk, Decimal('-0.5'))], ProductStockMovement.Type.ADJUSTMENT)
+        rows = list(ProductStockMovement.objects.filter(product=self.product).order_by('created_at'))
+        self.assertEqual([(m.previous_stock, m.new_stock) for m in rows], [
+            (Decimal('100'), Decimal('93')), (Decimal('93'), Decimal('105.5')), (Decimal('105.5'), Decimal('105')),
+        ])
+        self.assertEqual(rows[-1].new_stock, self.stock(self.product))
+
+
+class ExpandableFieldsTests(SalesAPITestCase):
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(ctx)
+
+    def test_full_representation_by_default(self):
+        rows, _ = self.get('/api/sales/orders/')
+        self.assertIn('customer_detail', rows[0])
+        self.assertEqual(len(rows[0]['lines']), 3)
+        self.assertIn('product_detail', rows[0]['lines'][0])
+
+    def test_sparse_fields_skip_prefetch(self):
+        rows, queries = self.get('/api/sales/orders/?fields=id,code,total')
+        self.assertEqual(set(rows[0]), {'id', 'code', 'total'})
+        self.assertEqual(queries, 1)
+
+    def test_expand_adds_only_requested_nested(self):
+        rows, queries = self.get('/api/sales/orders/?expand=customer_detail')
+        self.assertIn('customer_detail', rows[0])
+        self.assertNotIn('lines', rows[0])
+        self.assertNotIn('sales_point_detail', rows[0])
+        self.assertIn('total', rows[0])
+        self.assertEqual(queries, 1)
+
+    def test_dotted_paths(self):
+        rows, queries = self.get('/api/sales/orders/?fields=id,lines.quantity&expand=lines.product_detail')
+        self.assertEqual(set(rows[0]), {'id', 'lines'})
+        self.assertEqual(set(rows[0]['lines'][0]), {'quantity', 'product_detail'})
+        self.assertEqual(queries, 3)
+
+
+class IndexedSearchTests(SalesAPITestCase):
+
+    def search(self, term):
+        response = self.client.get('/api/sales/products/', {'search': term})
+        self.assertEqual(response.status_code, 200)
+        return [row['sku'] for row in response.json()]
+
+    def test_index_installed_by_migrate(self):
+        index = search.index_for(Product, ('sku', 'name', 'description'))
+        self.assertTrue(index.is_available('default'))
+
+    def test_index_follows_writes(self):
+        product = Product.objects.create(sku='PERC-18V', name='Perceuse sans fil', unit_price=Decimal('99'))
+        Product.objects.bulk_create([Product(sku='VIS-4x40', name='Vis inox 4x40', description='boîte de 200')])
+        self.assertEqual(self.search('perceuse'), ['PERC-18V'])
+        self.assertEqual(self.search('inox 4x40'), ['VIS-4x40'])
+
+        product.name = 'Visseuse sans fil'
+        product.save()
+        self.assertEqual(self.search('perceuse'), [])
+        self.assertEqual(self.search('visseuse'), ['PERC-18V'])
+
+        product.delete()
+        self.assertEqual(self.search('visseuse'), [])
+
+    def test_same_rows_as_like_search(self):
+        Product.objects.bulk_create([
+            Product(sku=f'B-{i}', name=f'Boulon M{i}', description='acier' if i % 2 else 'inox')
+            for i in range(8)
+        ])
+        for term in ('boulon inox', 'M3', 'oulo', 'B-5 acier', 'absent'):
+            indexed = sorted(self.search(term))
+            with mock.patch.object(search, 'index_for', return_value=None):
+                self.assertEqual(indexed, sorted(self.search(term)), term)
+
+    @override_settings(SEARCH_RANK_LIMIT=2)
+    def test_frequent_terms_fall_back_to_like(self):
+        Product.objects.bulk_create([Product(sku=f'C-{i}', name=f'Clou {i}') for i in range(5)])
+        with CaptureQueriesContext(connection) as ctx:
+            self.assertEqual(len(self.search('clou')), 5)
+        self.assertNotIn('MATCH', ctx.captured_queries[-1]['sql'])
+
+
+class ExportTests(SalesAPITestCase):
+
+    def export(self, url, **params):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url, params)
+            body = b''.join(response.streaming_content).decode()
+        return response, body, len(ctx)
+
+    def test_csv_honours_list_filters(self):
+        Order.objects.create(customer=self.customer, status=Order.Status.CONFIRMED)
+        response, body, _ = self.export('/api/sales/orders/export/', status='CONFIRMED')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/csv'))
+        self.assertIn('attachment; filename="order-', response['Content-Disposition'])
+        rows = list(csv.DictReader(io.StringIO(body)))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(rows[0]['customer'], 'Client')
+        self.assertEqual(rows[0]['status'], 'CONFIRMED')
+
+    def test_ndjson_single_query_whatever_the_volume(self):
+        _, _, queries = self.export('/api/sales/orders/export/', **{'as': 'ndjson'})
+        for _ in range(5):
+            Order.objects.create(customer=self.customer)
+        response, body, more_queries = self.export('/api/sales/orders/export/', **{'as': 'ndjson'})
+        rows = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual(len(rows), 6)
+        self.assertEqual(rows[-1]['total'], str(self.order.total))
+        self.assertEqual(queries, more_queries)
+
+    def test_unknown_format(self):
+        response = self.client.get('/api/sales/payments/export/', {'as': 'xlsx'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogImportTests(SalesAPITestCase):
+
+    def post_csv(self, content, **params):
+        upload = io.BytesIO(content.encode())
+        upload.name = 'catalogue.csv'
+        url = '/api/sales/products/import/' + (f'?{urlencode(params)}' if params else '')
+        response = self.client.post(url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_upsert_by_sku_with_row_errors(self):
+        report = self.post_csv(
+            'sku,name,type,track_stock,unit_price,stock_qty\n'
+            'SKU-1,Produit renommé,GOOD,true,12.00,\n'
+            'NEW-1,Nouveau,GOOD,true,5.00,8\n'
+            'SRV-1,Installation,SERVICE,true,50.00,\n'
+            'NEW-1,Doublon,GOOD,true,1.00,\n'
+            ',Sans sku,GOOD,true,1.00,\n'
+        )
+        self.assertEqual((report['created'], report['updated'], report['failed']), (1, 1, 3))
+        self.assertEqual([e['row'] for e in report['errors']], [3, 4, 5])
+
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.name, 'Produit renommé')
+        self.assertEqual(self.product.unit_price, Decimal('12.00'))
+        self.assertEqual(self.product.stock_qty, Decimal('100'))  # absent du fichier : inchangé
+        new = Product.objects.get(sku='NEW-1')
+        self.assertEqual(new.stock_qty, Decimal('8'))
+        self.assertEqual(
+            list(new.stock_movements.values_list('movement_type', 'quantity')),
+            [(ProductStockMovement.Type.IN, Decimal('8'))],
+        )
+
+    def test_stock_correction_is_journaled(self):
+        self.post_csv('sku,stock_qty\nSKU-1,90\n')
+        movement = self.product.stock_movements.get()
+        self.assertEqual(
+            (movement.movement_type, movement.previous_stock, movement.new_stock),
+            (ProductStockMovement.Type.ADJUSTMENT, Decimal('100'), Decimal('90')),
+        )
+
+    def test_dry_run_writes_nothing(self):
+        report = self.post_csv('sku,name\nDRY-1,Essai\n', dry_run=1)
+        self.assertEqual(report['created'], 1)
+        self.assertFalse(Product.objects.filter(sku='DRY-1').exists())
+
+    def test_queries_per_batch_not_per_row(self):
+        rows = [{'sku': f'B-{i}', 'name': f'Produit {i}'} for i in range(40)]
+        with CaptureQueriesContext(connection) as small:
+            import_products(rows[:4], batch_size=50)
+        with CaptureQueriesContext(connection) as large:
+            import_products(rows[4:], batch_size=50)
+        self.assertEqual(len(small), len(large))
+
+    def test_non_object_items_are_row_errors(self):
+        response = self.client.post('/api/sales/products/import/?dry_run=1',
+                                    [1, 'x', {'sku': 'MIX-1', 'name': 'Mixte'}], format='json')
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual((report['total'], report['failed'], report['created']), (3, 2, 1))
+        self.assertEqual([(e['row'], e['key']) for e in report['errors']], [(1, None), (2, None)])
+
+    def test_failed_batch_reports_every_row(self):
+        rows = [
+            {'sku': 'LOCK-1', 'name': 'Premier'}, {'sku': 'LOCK-2', 'name': ''},
+            {'sku': 'LOCK-1', 'name': 'Reprise'},
+        ]
+        with mock.patch('sales.catalog._write', side_effect=[DatabaseError('database is locked'), None]):
+            report = import_products(rows, batch_size=2)
+        self.assertEqual((report.total, report.failed), (3, 2))
+        self.assertEqual(
+            [(e['row'], e['key'], e['errors']) for e in report.errors],
+            [(1, 'LOCK-1', {'non_field_errors': 'database is locked'}),
+             (2, 'LOCK-2', {'non_field_errors': 'database is locked'})],
+        )
+        self.assertEqual(report.created, 1)  # LOCK-1 n'est plus vu comme un doublon
+
+
+class CustomerBalanceTests(SalesAPITestCase):
+
+    def invoice(self, customer=None, amount='100.00'):
+        invoice = Invoice.objects.create(customer=customer or self.customer)
+        bulk_create_lines(InvoiceLine, invoice, [
+            dict(product=self.product, quantity=Decimal('1'), unit_price=Decimal(amount), tax_rate=Decimal('0')),
+        ])
+        return invoice
+
+    def balance(self, customer=None):
+        customer = customer or self.customer
+        customer.refresh_from_db()
+        return customer.total_invoiced, customer.total_paid, customer.balance_due
+
+    def test_follows_invoice_lifecycle(self):
+        invoice = self.invoice()
+        self.assertEqual(self.balance(), (0, 0, 0))  # brouillon
+        invoice.issue()
+        self.assertEqual(self.balance(), (100, 0, 100))
+        Payment.objects.create(invoice=invoice, amount=Decimal('40.00'))
+        self.assertEqual(self.balance(), (100, 40, 60))
+        self.assertIsNotNone(self.customer.last_payment_at)
+        self.assertEqual(self.customer.last_invoice_date, invoice.issue_date.date())
+
+        other = Customer.objects.create(name='Autre')
+        invoice.customer = other
+        invoice.save()
+        self.assertEqual(self.balance(), (0, 0, 0))
+        self.assertIsNone(self.customer.last_invoice_date)
+        self.assertEqual(self.balance(other), (100, 40, 60))
+
+        invoice.status = Invoice.Status.CANCELLED
+        invoice.save(update_fields=['status', 'updated_at'])
+        self.assertEqual(self.balance(other), (0, 0, 0))
+
+    def test_payment_updates_balance_in_constant_queries(self):
+        invoice = self.invoice()
+        invoice.issue()
+        with CaptureQueriesContext(connection) as ctx:
+            Payment.objects.create(invoice=invoice, amount=Decimal('10.00'))
+        # paiement, relecture des totaux, facture, solde, dernier paiement
+        self.assertEqual(len(ctx), 5)
+
+    def test_rebuild_matches_incremental(self):
+        for amount in ('100.00', '250.00'):
+            self.invoice(amount=amount).issue()
+        expected = self.balance()
+        Customer.objects.update(total_invoiced=0, total_paid=0, balance_due=0)
+        balances.rebuild()
+        self.assertEqual(self.balance(), expected)
+
+    def test_sort_and_filter_by_balance(self):
+        debtor = Customer.objects.create(name='Débiteur')
+        self.invoice(debtor, '500.00').issue()
+        self.invoice(amount='50.00').issue()
+        rows = self.client.get('/api/sales/customers/?ordering=-balance_due&balance_due__gt=0').json()
+        self.assertEqual([(r['name'], r['balance_due']) for r in rows], [('Débiteur', '500.00'), ('Client', '50.00')])
+
+
+class AgingReportTests(SalesAPITestCase):
+
+    def invoice(self, amount, days_overdue, customer=None):
+        today = timezone.localdate()
+        invoice = Invoice.objects.create(
+            customer=customer or self.customer,
+            issue_date=today - datetime.timedelta(days=days_overdue + 30),
+            due_date=today - datetime.timedelta(days=days_overdue),
+        )
+        bulk_create_lines(InvoiceLine, invoice, [
+            dict(product=self.product, quantity=Decimal('1'), unit_price=Decimal(amount), tax_rate=Decimal('0')),
+        ])
+        invoice.issue()
+        return invoice
+
+    def test_buckets_per_customer(self):
+        other = Customer.objects.create(name='Autre')
+        for amount, days in (('10', -5), ('20', 0), ('30', 1), ('40', 45), ('50', 90), ('60', 91)):
+            self.invoice(amount, days)
+        self.invoice('5', 200, customer=other)
+        Invoice.objects.create(customer=self.customer)  # brouillon : ignoré
+
+        report = aging.compute(timezone.localdate())
+        first, second = report['customers']
+        self.assertEqual(first['customer_name'], 'Client')
+        self.assertEqual(
+            [first[key] for key in report['buckets']],
+            [Decimal('30'), Decimal('30'), Decimal('40'), Decimal('50'), Decimal('60')],
+        )
+        self.assertEqual((second['customer_name'], second['90_plus']), ('Autre', Decimal('5')))
+        self.assertEqual(report['totals']['total'], Decimal('215'))
+
+    def test_as_of_adds_back_later_payments(self):
+        invoice = self.invoice('100', 10)
+        Payment.objects.create(invoice=invoice, amount=Decimal('100'))
+        today = timezone.localdate()
+        self.assertEqual(aging.compute(today)['customers'], [])
+        past = aging.compute(today - datetime.timedelta(days=5))
+        self.assertEqual(past['customers'][0]['1_30'], Decimal('100'))
+
+    def test_endpoint_cached_until_next_write(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            aging.invalidate()  # aucune entrée laissée par un autre test
+        invoice = self.invoice('100', 10)
+        url = '/api/sales/invoices/aging/'
+        self.assertEqual(self.client.get(url).json()['totals']['total'], 100)
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(url)
+        self.assertEqual(len(ctx), 0)
+        with self.captureOnCommitCallbacks(execute=True):
+            Payment.objects.create(invoice=invoice, amount=Decimal('40'))
+        self.assertEqual(self.client.get(url).json()['totals']['total'], 60)
+        self.assertEqual(self.client.get(url + '?as_of=bad').status_code, 400)
+
+    def test_long_ttl_only_with_shared_cache(self):
+        self.assertEqual(caching.ttl_for(aging.CACHE_NAMESPACE), 30)  # LocMemCache : invalidations locales au worker
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://cache'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(caching.ttl_for(aging.CACHE_NAMESPACE), 24 * 3600)
+
+
+class BankStatementImportTests(SalesAPITestCase):
+
+    def invoice(self, amount):
+        invoice = Invoice.objects.create(customer=self.customer)
+        bulk_create_lines(InvoiceLine, invoice, [
+            dict(product=self.product, quantity=Decimal('1'), unit_price=Decimal(amount), tax_rate=Decimal('0')),
+        ])
+        invoice.issue()
+        return invoice
+
+    def post_csv(self, content, **params):
+        upload = io.BytesIO(content.encode())
+        upload.name = 'releve.csv'
+        url = '/api/sales/payments/import/' + (f'?{urlencode(params)}' if params else '')
+        response = self.client.post(url, {'file': upload}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_matches_invoice_code_and_updates_balances(self):
+        first, second = self.invoice('100'), self.invoice('50')
+        report = self.post_csv(
+            'date,amount,reference,label\n'
+            f'05/10/2026,"60,00",VIR {first.code} CLIENT,\n'
+            f'2026-10-06,40,VIR2,Règlement {first.code}\n'
+            f'2026-10-06,10,VIR3 {second.code},\n'
+            '2026-10-06,10,VIR4 INV999999,\n'
+            f'2026-10-06,50,VIR5 {first.code},\n'
+            f'2026-10-06,60,VIR6 {second.code},\n'
+            '2026-10-06,10,SANS CODE,\n'
+        )
+        self.assertEqual((report['created'], report['failed']), (3, 4))
+        self.assertEqual(sorted(e['row'] for e in report['errors']), [4, 5, 6, 7])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.status, first.amount_paid), (Invoice.Status.PAID, Decimal('100')))
+        self.assertEqual((second.status, second.balance_due), (Invoice.Status.PARTIALLY_PAID, Decimal('40')))
+        self.customer.refresh_from_db()
+        self.assertEqual((self.customer.total_paid, self.customer.balance_due), (Decimal('110'), Decimal('40')))
+        self.assertEqual(self.customer.last_payment_at.date(), datetime.date(2026, 10, 6))
+
+    def test_same_transfer_is_not_imported_twice(self):
+        invoice = self.invoice('100')
+        content = f'date,amount,reference\n2026-10-06,30,VIR {invoice.code}\n'
+        self.assertEqual(self.post_csv(content)['created'], 1)
+        self.assertEqual(self.post_csv(content)['failed'], 1)
+        self.assertEqual(invoice.payments.count(), 1)
+
+    def test_same_blank_reference_transfer_is_not_imported_twice(self):
+        invoice = self.invoice('100')
+        content = f'date,amount,reference,invoice\n2026-10-06,30,,{invoice.code}\n'
+        self.assertEqual(self.post_csv(content)['created'], 1)
+        report = self.post_csv(content + f'2026-10-07,30,,{invoice.code}\n')
+        self.assertEqual((report['created'], report['failed']), (1, 1))
+        self.assertEqual(invoice.payments.count(), 2)
+
+    def test_payment_posted_between_batches_counts(self):
+        invoice = self.invoice('100')
+
+        def rows():
+            yield {'date': '2026-10-06', 'amount': '40', 'reference': f'VIR1 {invoice.code}'}
+            # paquet 1 écrit : paiement saisi à la main avant la lecture du paquet 2
+            Payment.objects.create(invoice=invoice, amount=Decimal('50'))
+            yield {'date': '2026-10-06', 'amount': '40', 'reference': f'VIR2 {invoice.code}'}
+
+        report = import_statement(rows(), batch_size=1)
+        self.assertEqual((report.created, report.failed), (1, 1))
+        invoice.refresh_from_db()
+        self.assertEqual(invoice.balance_due, Decimal('10'))
+
+    def test_dry_run_writes_nothing(self):
+        invoice = self.invoice('100')
+        report = self.post_csv(f'date,amount,reference\n2026-10-06,30,VIR {invoice.code}\n', dry_run=1)
+        self.assertEqual(report['created'], 1)
+        self.assertFalse(invoice.payments.exists())
+
+    def test_queries_per_batch_not_per_row(self):
+        invoices = [self.invoice('10') for _ in range(8)]
+        rows = [{'date': '2026-10-06', 'amount': '10', 'reference': f'VIR {i.code}'} for i in invoices]
+        with CaptureQueriesContext(connection) as small:
+            import_statement(rows[:2], batch_size=50)
+        with CaptureQueriesContext(connection) as large:
+            import_statement(rows[2:], batch_size=50)
+        self.assertEqual(len(small), len(large))
+
+    def test_failed_batch_restores_remaining_and_reports_rows(self):
+        invoice = self.invoice('100')
+        rows = [{'date': '2026-10-06', 'amount': '60', 'reference': f'VIR{n} {invoice.code}'} for n in (1, 2)]
+        with mock.patch.object(Payment.objects, 'bulk_create', side_effect=[DatabaseError('deadlock'), []]):
+            report = import_statement(rows, batch_size=1)
+        self.assertEqual((report.failed, report.created), (1, 1))  # 60 restent payables après l'échec
+        self.assertEqual(
+            (report.errors[0]['row'], report.errors[0]['key']), (1, f'VIR1 {invoice.code}'),
+        )
+
+
+class QuoteExpiryTests(SalesAPITestCase):
+
+    def quote(self, status, days_left):
+        return Quote.objects.create(
+            customer=self.customer, status=status,
+            valid_until=timezone.localdate() + datetime.timedelta(days=days_left),
+        )
+
+    def test_expires_only_sent_quotes_past_validity(self):
+        stale = [self.quote(Quote.Status.SENT, -1) for _ in range(5)]
+        today = self.quote(Quote.Status.SENT, 0)  # valable jusqu'à ce soir
+        accepted = self.quote(Quote.Status.ACCEPTED, -3)
+        undated = Quote.objects.create(customer=self.customer, status=Quote.Status.SENT)
+
+        run = expiry.expire_quotes(batch_size=2)
+        self.assertEqual((run.expired, run.batches), (5, 3))
+        self.assertEqual(
+            set(Quote.objects.filter(status=Quote.Status.EXPIRED).values_list('pk', flat=True)),
+            {q.pk for q in stale},
+        )
+        for quote in (today, accepted, undated):
+            status = quote.status
+            quote.refresh_from_db()
+            self.assertEqual(quote.status, status)
+        self.assertEqual(expiry.expire_quotes().expired, 0)
+
+    def test_queries_per_batch_not_per_quote(self):
+        for _ in range(6):
+            self.quote(Quote.Status.SENT, -1)
+        with CaptureQueriesContext(connection) as ctx:
+            expiry.expire_quotes(batch_size=10)
+        self.assertEqual(sum(q['sql'].startswith('UPDATE') for q in ctx.captured_queries), 1)
+
+    def test_quote_accepted_after_selection_is_not_expired(self):
+        raced, other = self.quote(Quote.Status.SENT, -1), self.quote(Quote.Status.SENT, -1)
+
+        def select_then_accept(pks):
+            pks = list(pks)
+            # acceptation concurrente entre la lecture des clés et l'UPDATE
+            Quote.objects.filter(pk=raced.pk).update(status=Quote.Status.ACCEPTED)
+            return pks
+
+        with mock.patch('sales.expiry.list', create=True, side_effect=select_then_accept):
+            self.assertEqual(expiry.expire_quotes().expired, 1)
+        self.assertEqual(
+            dict(Quote.objects.filter(pk__in=[raced.pk, other.pk]).values_list('pk', 'status')),
+            {raced.pk: Quote.Status.ACCEPTED, other.pk: Quote.Status.EXPIRED},
+        )
+
+    def test_runner_off_by_default(self):
+        self.assertIsNone(expiry.start_runner())
+
+
+class ReservationTests(SalesAPITestCase):
+
+    def new_order(self, quantity):
+        order = Order.objects.create(customer=self.customer)
+        bulk_create_lines(OrderLine, order, [
+            dict(product=self.product, quantity=Decimal(quantity), unit_price=None, tax_rate=None),
+        ])
+        return order
+
+    def atp(self):
+        response = self.client.get(f'/api/sales/products/atp/?ids={self.product.pk}')
+        self.assertEqual(response.status_code, 200)
+        return Decimal(str(response.json()[0]['available']))
+
+    def test_confirm_reserves_and_refuses_oversell(self):
+        Product.objects.filter(pk=self.product.pk).update(incoming_qty=Decimal('10'))
+        self.assertEqual(self.client.post(f'/api/sales/orders/{self.order.pk}/confirm/').status_code, 200)
+        self.assertEqual(self.atp(), Decimal('104'))  # 100 - 6 + 10
+
+        late = self.new_order('105')
+        self.assertEqual(self.client.post(f'/api/sales/orders/{late.pk}/confirm/').status_code, 400)
+        late.refresh_from_db()
+        self.assertEqual(late.status, Order.Status.DRAFT)
+        self.assertEqual(self.atp(), Decimal('104'))
+
+    def test_delivery_and_cancel_release(self):
+        self.order.confirm()
+        other = self.new_order('4')
+        other.confirm()
+        note = DeliveryNote.objects.create(order=self.order)
+        DeliveryLine.objects.create(delivery=note, order_line=self.order.lines.first(), quantity=Decimal('2'))
+        note.mark_delivered()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_qty, self.product.reserved_qty), (Decimal('98'), Decimal('8')))
+        self.assertEqual(self.atp(), Decimal('90'))  # livrer ne change pas le disponible
+
+        other.cancel()
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_qty, Decimal('4'))
+        Product.objects.filter(pk=self.product.pk).update(reserved_qty=0)
+        self.assertEqual(reservations.rebuild(), Product.objects.count())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_qty, Decimal('4'))
+
+    def test_stale_instances_reserve_and_release_once(self):
+        first, second = self.order, Order.objects.get(pk=self.order.pk)
+        first.confirm()
+        with self.assertRaises(ValidationError):
+            second.confirm()  # encore DRAFT en mémoire
+        self.assertEqual(second.status, Order.Status.CONFIRMED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_qty, Decimal('6'))
+
+        self.new_order('4').confirm()
+        stale = Order.objects.get(pk=self.order.pk)
+        first.cancel()
+        stale.cancel()  # CONFIRMED en mémoire, déjà annulée en base
+        self.assertEqual(stale.status, Order.Status.CANCELLED)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_qty, Decimal('4'))
+
+    def test_only_draft_orders_can_be_deleted(self):
+        self.order.confirm()
+        self.assertEqual(self.client.delete(f'/api/sales/orders/{self.order.pk}/').status_code, 400)
+        self.assertTrue(Order.objects.filter(pk=self.order.pk).exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved_qty, Decimal('6'))
+
+        draft = self.new_order('4')
+        self.assertEqual(self.client.delete(f'/api/sales/orders/{draft.pk}/').status_code, 204)
+
+    def test_delivery_releases_only_what_the_order_holds(self):
+        Product.objects.filter(pk=self.product.pk).update(stock_qty=Decimal('8'))
+        confirmed = self.new_order('8')
+        confirmed.confirm()
+        draft = self.new_order('2')
+        response = self.client.post('/api/sales/delivery-notes/', {
+            'order': str(draft.pk), 'lines': [{'order_line': str(draft.lines.get().pk), 'quantity': '1'}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        note = DeliveryNote.objects.create(order=draft)  # BL créé avant la règle
+        DeliveryLine.objects.create(delivery=note, order_line=draft.lines.get(), quantity=Decimal('1'))
+        with self.assertRaises(ValidationError):
+            note.mark_delivered()
+
+        # BL dépassant le restant à livrer : ne libère que ce que la ligne tenait
+        line = confirmed.lines.get()
+        OrderLine.objects.filter(pk=line.pk).update(delivered_qty=Decimal('7'))
+        Product.objects.filter(pk=self.product.pk).update(reserved_qty=Decimal('6'))  # 1 pour la ligne, 5 pour d'autres
+        note = DeliveryNote.objects.create(order=confirmed)
+        DeliveryLine.objects.create(delivery=note, order_line=line, quantity=Decimal('3'))
+        note.mark_delivered()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_qty, self.product.reserved_qty), (Decimal('5'), Decimal('5')))
+
+    def test_atp_single_query_for_the_list(self):
+        products = Product.objects.bulk_create([Product(sku=f'ATP-{i}', name=f'Produit {i}') for i in range(20)])
+        with CaptureQueriesContext(connection) as ctx:
+            result = reservations.available_to_promise([p.pk for p in products] + [self.product.pk])
+        self.assertEqual((len(ctx), len(result)), (1, 21))
+        self.assertEqual(self.client.get('/api/sales/products/atp/?ids=bad').status_code, 400)
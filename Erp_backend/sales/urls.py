@@ -5,7 +5,8 @@ from .views import (
     OrderViewSet, DeliveryNoteViewSet,
     InvoiceViewSet, PaymentViewSet,
     SalesPointViewSet,
-    QuoteViewSet
+    QuoteViewSet,
+    ProductStockMovementViewSet,
 )
 
 router = DefaultRouter()
@@ -17,6 +18,7 @@ router.register("invoices", InvoiceViewSet, basename="invoice")
 router.register("payments", PaymentViewSet, basename="payment")
 router.register("sales-points", SalesPointViewSet, basename="salespoint")
 router.register("quotes", QuoteViewSet, basename="quote")
+router.register("product-stock-movements", ProductStockMovementViewSet, basename="productstockmovement")
 
 
 # keep your existing routes (orders/products/...)
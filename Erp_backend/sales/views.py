@@ -1,3 +1,7 @@
+import datetime
+import uuid
+from decimal import Decimal, InvalidOperation
+
 from django.db import transaction
 from django.forms import ValidationError
 from rest_framework import viewsets, decorators, status, filters
@@ -5,8 +9,21 @@ from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
 
+from erp_api.expand import ExpandableQuerysetMixin
+from erp_api.export import ExportMixin
+from erp_api.fastlist import FastListMixin
+from erp_api.importing import ImportFormatError, is_dry_run, request_rows
+from erp_api.pagination import KeysetPagination
+from erp_api.search import IndexedSearchFilter
+
 
 from .models import DeliveryLine, Order, DeliveryNote, Invoice, Payment, Product, Customer ,SalesPoint ,Quote,OrderLine
+from .models import ProductStockMovement, bulk_create_lines
+from .stock import apply_stock_changes
+from .reservations import available_to_promise
+from .aging import aging_report
+from .catalog import import_products
+from .statements import import_statement
 from .serializers import (
     # Orders
     OrderSerializer, OrderWriteSerializer, OrderUpdateSerializer,
@@ -22,16 +39,19 @@ from .serializers import (
     # Quotes
     QuoteSerializer, QuoteWriteSerializer, QuoteLineSerializer, QuoteLineWriteSerializer,
     # Products
-    ProductSerializer, ProductWriteSerializer
+    ProductSerializer, ProductWriteSerializer, ProductStockMovementSerializer,
 )
 from .permissions import SalesPermission, InvoicesPermission , ProductsPermission
 
+ATP_MAX_IDS = 500
+
 
 # --------- Read-only “reference” sets ----------
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all().order_by("-created_at")
     permission_classes = [IsAuthenticated, ProductsPermission]
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
+    pagination_class = KeysetPagination
+    filter_backends = [DjangoFilterBackend, IndexedSearchFilter, filters.OrderingFilter]
     filterset_fields = ("type", "track_stock", "is_active")
     search_fields = ("sku", "name", "description")
     ordering_fields = ("created_at", "updated_at", "sku", "name", "unit_price", "stock_qty", "tax_rate")
@@ -55,6 +75,21 @@ class ProductViewSet(viewsets.ModelViewSet):
         p.save(update_fields=["unit_price", "updated_at"])
         return Response(ProductSerializer(p, context=self.get_serializer_context()).data)
 
+    @decorators.action(detail=False, methods=["post"], url_path="import")
+    def bulk_import(self, request):
+        """
+        Import en masse, upsert par sku (voir sales.catalog).
+        Body: fichier CSV/JSON en multipart ("file") ou liste JSON de produits.
+        ?dry_run=1 : validation seule, rien n'est écrit.
+        """
+        try:
+            report = import_products(
+                request_rows(request), dry_run=is_dry_run(request), created_by=request.user.get_username(),
+            )
+        except ImportFormatError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        return Response(report.as_dict())
+
     @decorators.action(detail=True, methods=["post"])
     @transaction.atomic
     def adjust_stock(self, request, pk=None):
@@ -66,17 +101,38 @@ class ProductViewSet(viewsets.ModelViewSet):
         if not p.track_stock or p.type != Product.ProductType.GOOD:
             return Response({"detail": "Stock not tracked for this product."}, status=400)
         try:
-            delta = request.data.get("delta")
-            delta = float(delta)
-        except Exception:
+            delta = Decimal(str(request.data.get("delta")))
+        except (InvalidOperation, ValueError):
+            return Response({"detail": "delta must be a number."}, status=400)
+        if not delta.is_finite():
             return Response({"detail": "delta must be a number."}, status=400)
-        new_qty = p.stock_qty + delta
-        if new_qty < 0:
+        try:
+            apply_stock_changes(
+                [(p.pk, delta)],
+                ProductStockMovement.Type.ADJUSTMENT,
+                notes=request.data.get("reason", ""),
+                created_by=request.user.get_username(),
+            )
+        except ValidationError:
             return Response({"detail": "Resulting stock would be negative."}, status=400)
-        p.stock_qty = new_qty
-        p.save(update_fields=["stock_qty", "updated_at"])
+        p.refresh_from_db(fields=["stock_qty", "updated_at"])
         return Response(ProductSerializer(p, context=self.get_serializer_context()).data)
 
+    @decorators.action(detail=False, methods=["get"])
+    def atp(self, request):
+        """
+        Disponible à promettre (stock - réservé + entrées attendues), une requête pour toute la liste.
+        ?ids=<uuid>,<uuid>,... (au plus ATP_MAX_IDS produits)
+        """
+        try:
+            ids = [uuid.UUID(v) for v in request.query_params.get("ids", "").split(",") if v.strip()]
+        except ValueError:
+            return Response({"detail": "ids must be a comma-separated list of product UUIDs."}, status=400)
+        if not ids or len(ids) > ATP_MAX_IDS:
+            return Response({"detail": f"ids: 1 to {ATP_MAX_IDS} products."}, status=400)
+        found = available_to_promise(ids)
+        return Response([{"product": pk, **found[pk]} for pk in dict.fromkeys(ids) if pk in found])
+
     @decorators.action(detail=True, methods=["post"])
     def activate(self, request, pk=None):
         p = self.get_object()
@@ -92,12 +148,29 @@ class ProductViewSet(viewsets.ModelViewSet):
         return Response({"ok": True})
 
 
+class ProductStockMovementViewSet(viewsets.ReadOnlyModelViewSet):
+    queryset = ProductStockMovement.objects.select_related("product", "delivery").all()
+    serializer_class = ProductStockMovementSerializer
+    permission_classes = [IsAuthenticated, ProductsPermission]
+    filterset_fields = ("product", "movement_type", "delivery")
+    search_fields = ("product__sku", "product__name", "notes")
+    ordering_fields = ("created_at",)
+
+
 class CustomerViewSet(viewsets.ModelViewSet):
     queryset = Customer.objects.all().order_by("name")
     serializer_class = CustomerSerializer
     permission_classes = [IsAuthenticated, SalesPermission]
+    pagination_class = KeysetPagination
+    # soldes tenus à jour par sales.balances : tri / filtre sur des colonnes (indexée pour balance_due)
+    filterset_fields = {
+        "is_active": ["exact"],
+        "balance_due": ["gt", "gte", "lte"],
+        "last_invoice_date": ["lt", "gte"],
+        "last_payment_at": ["lt", "gte", "isnull"],
+    }
     search_fields = ("name", "email", "phone")
-    ordering_fields = ("name", "created_at")
+    ordering_fields = ("name", "created_at", "balance_due", "total_invoiced", "last_invoice_date", "last_payment_at")
 
 class SalesPointViewSet(viewsets.ModelViewSet):
     queryset = SalesPoint.objects.all().order_by("name")
@@ -107,16 +180,21 @@ class SalesPointViewSet(viewsets.ModelViewSet):
 
 
 # --------- Orders ----------
-class OrderViewSet(viewsets.ModelViewSet):
-    queryset = (
-        Order.objects.select_related("customer", "sales_point")
-        .prefetch_related("lines__product")
-        .all()
-    )
+class OrderViewSet(ExpandableQuerysetMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = Order.objects.all()
+    expand_select_related = {"customer_detail": "customer", "sales_point_detail": "sales_point"}
+    expand_prefetch_related = {"lines": "lines", "lines.product_detail": "lines__product"}
     permission_classes = [IsAuthenticated, SalesPermission]
+    pagination_class = KeysetPagination
     filterset_fields = ("status", "customer", "currency")
     search_fields = ("code", "customer__name", "customer__email", "notes")
     ordering_fields = ("created_at", "total", "status", "code")
+    export_fields = (
+        ("code", "code"), ("created_at", "created_at"), ("status", "status"),
+        ("customer", "customer__name"), ("sales_point", "sales_point__name"),
+        ("currency", "currency"), ("subtotal", "subtotal"), ("tax_amount", "tax_amount"),
+        ("total", "total"), ("expected_delivery_date", "expected_delivery_date"),
+    )
 
     def get_serializer_class(self):
         if self.action == "create":
@@ -125,11 +203,20 @@ class OrderViewSet(viewsets.ModelViewSet):
             return OrderUpdateSerializer
         return OrderSerializer
 
+    def destroy(self, request, *args, **kwargs):
+        try:
+            return super().destroy(request, *args, **kwargs)
+        except ValidationError as e:  # commande non brouillon (Order.delete)
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
     @decorators.action(detail=True, methods=["post"])
     @transaction.atomic
     def confirm(self, request, pk=None):
         order = self.get_object()
-        order.confirm()
+        try:
+            order.confirm()  # réserve le stock (sales.reservations)
+        except ValidationError as e:
+            return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
         return Response({"ok": True, "status": order.status})
 
     @decorators.action(detail=True, methods=["post"])
@@ -139,21 +226,26 @@ class OrderViewSet(viewsets.ModelViewSet):
         Simple cancel: allowed only when no active non-cancelled BL exist (guard is in model.clean()).
         """
         order = self.get_object()
-        order.status = Order.Status.CANCELLED
-        order.full_clean()  # will raise if BL exist
-        order.save(update_fields=["status", "updated_at"])
+        order.cancel()  # will raise if BL exist ; libère les réservations
         return Response({"ok": True, "status": order.status})
 
 
 # --------- Delivery Notes ----------
-class DeliveryNoteViewSet(viewsets.ModelViewSet):
-    queryset = (
-        DeliveryNote.objects
-        .select_related("order", "order__customer")
-        .prefetch_related("lines__order_line__product")
-        .all()
-    )
+class DeliveryNoteViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
+    queryset = DeliveryNote.objects.all()
+    expand_select_related = {
+        "order_detail": "order",
+        "order_detail.customer_detail": "order__customer",
+    }
+    expand_prefetch_related = {
+        "lines": "lines",
+        "lines.order_line_detail": "lines__order_line",
+        "lines.order_line_detail.product_detail": "lines__order_line__product",
+        "order_detail.lines": "order__lines",
+        "order_detail.lines.product_detail": "order__lines__product",
+    }
     permission_classes = [IsAuthenticated, SalesPermission]
+    pagination_class = KeysetPagination
     filterset_fields = ("status", "order")
     search_fields = ("code", "order__code", "notes")
     ordering_fields = ("created_at", "delivered_at", "status", "code")
@@ -288,16 +380,21 @@ class DeliveryNoteViewSet(viewsets.ModelViewSet):
 
 
 # --------- Invoices & Payments ----------
-class InvoiceViewSet(viewsets.ModelViewSet):
-    queryset = (
-        Invoice.objects.select_related("order", "customer")
-        .prefetch_related("lines__product", "payments")
-        .all()
-    )
+class InvoiceViewSet(ExpandableQuerysetMixin, ExportMixin, viewsets.ModelViewSet):
+    queryset = Invoice.objects.all()
+    expand_prefetch_related = {"lines": "lines"}
     permission_classes = [IsAuthenticated, InvoicesPermission]
+    pagination_class = KeysetPagination
     filterset_fields = ("status", "customer", "currency")
     search_fields = ("code", "customer__name", "customer__email", "notes")
     ordering_fields = ("issue_date", "total", "amount_paid", "balance_due", "status", "code")
+    export_fields = (
+        ("code", "code"), ("issue_date", "issue_date"), ("due_date", "due_date"),
+        ("status", "status"), ("customer", "customer__name"), ("customer_tax_id", "customer__tax_id"),
+        ("order", "order__code"), ("currency", "currency"), ("subtotal", "subtotal"),
+        ("tax_amount", "tax_amount"), ("total", "total"), ("amount_paid", "amount_paid"),
+        ("balance_due", "balance_due"),
+    )
 
     def get_serializer_class(self):
         if self.action in ("create", "update", "partial_update"):
@@ -312,6 +409,21 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         inv = s.save()
         return Response({"ok": True, "invoice_id": str(inv.id)}, status=status.HTTP_201_CREATED)
 
+    @decorators.action(detail=False, methods=["get"])
+    def aging(self, request):
+        """
+        Balance âgée par client (voir sales.aging), mise en cache pour la journée.
+        ?as_of=YYYY-MM-DD (défaut aujourd'hui), ?customer=<uuid>
+        """
+        try:
+            as_of = request.query_params.get("as_of")
+            as_of = datetime.date.fromisoformat(as_of) if as_of else None
+            customer = request.query_params.get("customer")
+            customer = uuid.UUID(customer) if customer else None
+        except ValueError:
+            return Response({"detail": "as_of must be YYYY-MM-DD and customer a UUID."}, status=400)
+        return Response(aging_report(as_of, customer))
+
     @decorators.action(detail=True, methods=["post"])
     @transaction.atomic
     def issue(self, request, pk=None):
@@ -330,17 +442,40 @@ class InvoiceViewSet(viewsets.ModelViewSet):
         return Response({"ok": True, "status": inv.status})
 
 
-class PaymentViewSet(viewsets.ModelViewSet):
+class PaymentViewSet(ExportMixin, viewsets.ModelViewSet):
     queryset = Payment.objects.select_related("invoice").all()
     serializer_class = PaymentSerializer
     permission_classes = [IsAuthenticated, InvoicesPermission]
+    pagination_class = KeysetPagination
     filterset_fields = ("method", "invoice")
     search_fields = ("invoice__code", "reference",)
     ordering_fields = ("received_at", "amount")
+    export_fields = (
+        ("received_at", "received_at"), ("invoice", "invoice__code"),
+        ("customer", "invoice__customer__name"), ("method", "method"),
+        ("amount", "amount"), ("reference", "reference"),
+    )
+
+    @decorators.action(detail=False, methods=["post"], url_path="import")
+    def bulk_import(self, request):
+        """
+        Relevé bancaire CSV/JSON : un paiement par ligne rapprochée d'une facture (voir sales.statements).
+        Colonnes : date, amount, reference, label, invoice (optionnel), method.
+        ?dry_run=1 : rapprochement seul, rien n'est écrit.
+        """
+        try:
+            report = import_statement(
+                request_rows(request), dry_run=is_dry_run(request), created_by=request.user.get_username(),
+            )
+        except ImportFormatError as exc:
+            return Response({"detail": str(exc)}, status=400)
+        return Response(report.as_dict())
 
 # ---------- Devis ----------
-class QuoteViewSet(viewsets.ModelViewSet):
-    queryset = Quote.objects.select_related("customer","sales_point").prefetch_related("lines__product").all()
+class QuoteViewSet(ExpandableQuerysetMixin, viewsets.ModelViewSet):
+    queryset = Quote.objects.all()
+    expand_select_related = {"customer_detail": "customer", "sales_point_detail": "sales_point"}
+    expand_prefetch_related = {"lines": "lines", "lines.product_detail": "lines__product"}
     permission_classes = [SalesPermission]
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter, filters.SearchFilter]
     search_fields = ["code","customer__name"]
@@ -396,16 +531,16 @@ class QuoteViewSet(viewsets.ModelViewSet):
             currency=q.currency,
             notes=f"From quote {q.code}: {q.notes or ''}".strip(),
         )
-        for l in q.lines.all():
-            OrderLine.objects.create(
-                order=order,
+        bulk_create_lines(OrderLine, order, [
+            dict(
                 product=l.product,
                 description=l.description,
                 quantity=l.quantity,
                 unit_price=l.unit_price,
                 tax_rate=l.tax_rate,
             )
-        order.recompute_totals(save=True)
+            for l in q.lines.all()
+        ])
         return Response({"ok": True, "order_id": order.id}, status=status.HTTP_201_CREATED)
     
     def create(self, request, *args, **kwargs):
@@ -1,7 +1,8 @@
 from django.contrib import admin
+from django.db.models import Count
 from django.utils.html import format_html
 from warehouse import models
-from warehouse.models import Category, Supplier, Material, StockMovement, PurchaseOrder, PurchaseOrderItem
+from warehouse.models import Category, Supplier, Material, StockMovement, StockSnapshot, PurchaseOrder, PurchaseOrderItem
 
 
 @admin.register(Category)
@@ -10,9 +11,13 @@ class CategoryAdmin(admin.ModelAdmin):
     search_fields = ['name']
     readonly_fields = ['created_at', 'updated_at']
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(materials_count=Count('materials'))
+
     def materials_count(self, obj):
-        return obj.materials.count()
+        return obj.materials_count
     materials_count.short_description = "Nombre de matières"
+    materials_count.admin_order_field = 'materials_count'
 
 
 @admin.register(Supplier)
@@ -38,9 +43,13 @@ class SupplierAdmin(admin.ModelAdmin):
         }),
     )
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(materials_count=Count('materials'))
+
     def materials_count(self, obj):
-        return obj.materials.count()
+        return obj.materials_count
     materials_count.short_description = "Nombre de matières"
+    materials_count.admin_order_field = 'materials_count'
 
 
 @admin.register(Material)
@@ -178,6 +187,16 @@ class PurchaseOrderItemInline(admin.TabularInline):
     readonly_fields = []
 
 
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ['date', 'material', 'stock', 'unit_price', 'movement_id']
+    list_filter = ['date']
+    search_fields = ['material__name', 'material__reference']
+    list_select_related = ['material']
+    date_hierarchy = 'date'
+    readonly_fields = ['material', 'date', 'stock', 'unit_price', 'movement_id', 'created_at']
+
+
 @admin.register(PurchaseOrder)
 class PurchaseOrderAdmin(admin.ModelAdmin):
     list_display = [
@@ -232,9 +251,13 @@ class PurchaseOrderAdmin(admin.ModelAdmin):
         return f"{obj.total_amount:.2f} €"
     total_amount_display.short_description = "Montant total"
 
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('supplier').annotate(items_count=Count('items'))
+
     def items_count(self, obj):
-        return obj.items.count()
+        return obj.items_count
     items_count.short_description = "Nombre d'articles"
+    items_count.admin_order_field = 'items_count'
 
     actions = ['mark_as_received']
 
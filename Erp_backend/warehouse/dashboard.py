@@ -0,0 +1,168 @@
+"""Indicateurs du stock matières (tableau de bord, statistiques), mis en cache"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db.models import Count, DecimalField, Exists, ExpressionWrapper, F, OuterRef, Q, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from erp_api import caching
+
+from .models import Category, Material, PurchaseOrder, StockMovement, Supplier
+
+CACHE_NAMESPACE = 'warehouse.stock'
+PURCHASING_NAMESPACE = 'warehouse.purchasing'
+caching.register(CACHE_NAMESPACE, PURCHASING_NAMESPACE)
+
+MONTHS_FR = ['Jan', 'Fév', 'Mar', 'Avr', 'Mai', 'Juin', 'Juil', 'Août', 'Sept', 'Oct', 'Nov', 'Déc']
+
+VALUE = ExpressionWrapper(F('stock') * F('price'), output_field=DecimalField(max_digits=20, decimal_places=4))
+
+
+def invalidate():
+    caching.invalidate(CACHE_NAMESPACE)
+
+
+def invalidate_purchasing():
+    caching.invalidate(PURCHASING_NAMESPACE)
+
+
+def material_rollup():
+    """
+    Une seule requête groupée par (catégorie, fournisseur) ; totaux, cumul
+    par catégorie et par fournisseur sont dérivés en Python.
+    """
+    rows = (
+        Material.objects
+        .values('category__name', 'supplier__name')
+        .annotate(
+            count=Count('id'),
+            low_stock=Count('id', filter=Q(stock__lt=F('min_stock'))),
+            value=Sum(VALUE),
+        )
+        .order_by()
+    )
+
+    total_count = low_stock_count = 0
+    total_value = Decimal('0')
+    by_category = defaultdict(lambda: {'count': 0, 'total_value': Decimal('0')})
+    by_supplier = defaultdict(int)
+    for row in rows:
+        value = row['value'] or Decimal('0')
+        total_count += row['count']
+        low_stock_count += row['low_stock']
+        total_value += value
+        category = by_category[row['category__name']]
+        category['count'] += row['count']
+        category['total_value'] += value
+        by_supplier[row['supplier__name']] += row['count']
+
+    return {
+        'total_count': total_count,
+        'low_stock_count': low_stock_count,
+        'total_value': total_value,
+        'by_category': sorted(
+            ({'category__name': name, **values} for name, values in by_category.items()),
+            key=lambda c: -c['count'],
+        ),
+        'by_supplier': sorted(
+            ({'supplier__name': name, 'count': count} for name, count in by_supplier.items()),
+            key=lambda s: -s['count'],
+        ),
+    }
+
+
+def material_statistics():
+    return caching.get_or_compute(CACHE_NAMESPACE, 'material_statistics', material_rollup)
+
+
+def dashboard_stats():
+    """Données brutes de DashboardStatsSerializer (4 requêtes au total)"""
+    rollup = material_rollup()
+    return {
+        'total_materials': rollup['total_count'],
+        'low_stock_count': rollup['low_stock_count'],
+        'total_value': rollup['total_value'],
+        'categories_count': Category.objects.count(),
+        'recent_movements': StockMovement.objects.select_related('material')[:10],
+        'low_stock_materials': (
+            Material.objects.select_related('category', 'supplier')
+            .filter(stock__lt=F('min_stock'))[:10]
+        ),
+    }
+
+
+def _month_series(months, today):
+    """Premiers jours des `months` derniers mois calendaires, mois courant inclus"""
+    year, month = today.year, today.month
+    series = []
+    for _ in range(months):
+        series.append(today.replace(year=year, month=month, day=1))
+        month -= 1
+        if not month:
+            year, month = year - 1, 12
+    return series[::-1]
+
+
+def supplier_rollup(months=9, supplier_id=None):
+    """
+    Achats par mois calendaire (une requête groupée, mois sans commande à 0)
+    et compteurs de fournisseurs (une requête). Les commandes annulées ne
+    comptent pas comme achats.
+    """
+    series = _month_series(months, timezone.localdate())
+    orders = PurchaseOrder.objects.filter(order_date__gte=series[0]).exclude(status='cancelled')
+    if supplier_id is not None:
+        orders = orders.filter(supplier_id=supplier_id)
+    purchases = {
+        row['month']: row['total'] or Decimal('0')
+        for row in orders.annotate(month=TruncMonth('order_date'))
+        .values('month').annotate(total=Sum('total_amount')).order_by()
+    }
+    # Pas encore de registre des paiements fournisseurs : rien à cumuler
+    payments = {}
+
+    monthly_data = [
+        {
+            'month': MONTHS_FR[first_day.month - 1],
+            'period': first_day.strftime('%Y-%m'),
+            'achats': float(purchases.get(first_day, 0)),
+            'paiements': float(payments.get(first_day, 0)),
+        }
+        for first_day in series
+    ]
+
+    counts = (
+        Supplier.objects
+        .annotate(
+            has_materials=Exists(Material.objects.filter(supplier=OuterRef('pk'))),
+            has_pending=Exists(PurchaseOrder.objects.filter(
+                supplier=OuterRef('pk'), status__in=['sent', 'confirmed']
+            )),
+        )
+        .aggregate(
+            total=Count('id'),
+            active=Count('id', filter=Q(has_materials=True)),
+            pending=Count('id', filter=Q(has_pending=True)),
+        )
+    )
+
+    total_achats = sum(item['achats'] for item in monthly_data)
+    total_paiements = sum(item['paiements'] for item in monthly_data)
+    return {
+        'total_suppliers': counts['total'],
+        'active_suppliers': counts['active'],
+        'inactive_suppliers': counts['total'] - counts['active'],
+        # Fournisseurs avec commandes en attente (approximation pour "avec dette")
+        'suppliers_with_debt': counts['pending'],
+        'monthly_data': monthly_data,
+        'total_achats': total_achats,
+        'total_paiements': total_paiements,
+        'solde': total_achats - total_paiements,
+    }
+
+
+def supplier_statistics(months=9, supplier_id=None):
+    # la fenêtre dépend du mois courant : il fait partie de la clé
+    key = f"supplier_statistics:{timezone.localdate():%Y-%m}:{months}:{supplier_id or 'all'}"
+    return caching.get_or_compute(PURCHASING_NAMESPACE, key, lambda: supplier_rollup(months, supplier_id))
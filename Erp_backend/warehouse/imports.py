@@ -0,0 +1,278 @@
+"""
+Import en masse des fournisseurs et des matières premières (reprise de
+données, ouverture d'un nouveau site).
+
+- Fournisseurs : clé = nif s'il est renseigné, sinon le nom. Les fiches
+  reconnues sont mises à jour, les autres créées, en un
+  INSERT ... ON CONFLICT (id) DO UPDATE par paquet.
+- Matières : clé = reference. Les colonnes category et supplier donnent un
+  nom (ou un nif pour le fournisseur) résolu par des tables en mémoire
+  chargées une fois : pas de requête par ligne. Une catégorie inconnue est
+  créée, un fournisseur inconnu est une erreur de la ligne (importer les
+  fournisseurs d'abord). Upsert par paquet sur reference, lignes existantes
+  verrouillées (select_for_update) ; le stock initial d'une nouvelle matière
+  est journalisé par un mouvement « in », une correction du stock d'une
+  matière existante par un mouvement « adjustment », écrits en bloc.
+
+Les écritures en bloc n'émettent pas de signaux : le cache des indicateurs
+(warehouse.dashboard) est invalidé à la fin de l'import.
+"""
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from rest_framework import serializers
+
+from erp_api.importing import DEFAULT_BATCH_SIZE, ImportReport, batched, flatten_errors
+
+from . import dashboard
+from .models import Category, Material, StockMovement, Supplier
+from .serializers import MaterialCreateUpdateSerializer, SupplierSerializer
+
+SUPPLIER_FIELDS = [
+    'name', 'contact_name', 'email', 'phone', 'address', 'nif', 'rc', 'iban',
+    'payment_mode', 'payment_delay', 'notes',
+]
+MATERIAL_FIELDS = ['name', 'reference', 'stock', 'min_stock', 'unit', 'price', 'description']
+
+
+class SupplierImportSerializer(SupplierSerializer):
+    class Meta(SupplierSerializer.Meta):
+        fields = SUPPLIER_FIELDS
+        # upsert : un nom déjà connu est une mise à jour, pas une erreur d'unicité
+        extra_kwargs = {'name': {'validators': []}}
+
+
+class MaterialImportSerializer(MaterialCreateUpdateSerializer):
+    """Sans category / supplier : résolus par nom par l'import, pas une requête par ligne"""
+
+    class Meta(MaterialCreateUpdateSerializer.Meta):
+        fields = MATERIAL_FIELDS
+        extra_kwargs = {'reference': {'validators': []}}
+
+
+def _key(value):
+    return str(value or '').strip()
+
+
+def _fold(value):
+    return _key(value).casefold()
+
+
+def _batch_size(batch_size):
+    return batch_size or getattr(settings, 'IMPORT_BATCH_SIZE', DEFAULT_BATCH_SIZE)
+
+
+def _run(rows, batch_size, dry_run, process):
+    """Découpe en paquets ; process(batch, report) écrit un paquet dans sa transaction"""
+    report = ImportReport(dry_run=dry_run)
+    for batch in batched(enumerate(rows, 1), _batch_size(batch_size)):
+        report.total += len(batch)
+        process(batch, report)
+    if not dry_run and (report.created or report.updated):
+        dashboard.invalidate()
+        dashboard.invalidate_purchasing()
+    return report
+
+
+def _count(report, valid):
+    created = sum(1 for _, _, current in valid if current is None)
+    report.created += created
+    report.updated += len(valid) - created
+
+
+# -------- fournisseurs --------
+
+def import_suppliers(rows, *, batch_size=None, dry_run=False, created_by=''):
+    """rows : dicts (voir erp_api.importing.read_rows) ; retourne un ImportReport"""
+    serializer = SupplierImportSerializer()
+    seen = set()
+
+    def process(batch, report):
+        mark = report.mark()
+        added = set()
+        try:
+            with transaction.atomic():
+                valid = _validate_suppliers(batch, serializer, report, seen, added, lock=not dry_run)
+                if valid and not dry_run:
+                    Supplier.objects.bulk_create(
+                        [Supplier(pk=current['pk'] if current else None, **data) for _, data, current in valid],
+                        update_conflicts=True, unique_fields=['id'], update_fields=SUPPLIER_FIELDS + ['updated_at'],
+                    )
+        except DatabaseError as exc:
+            # paquet annulé : toutes ses lignes en échec, ses clés non retenues
+            report.fail_batch(mark, batch, lambda row: _key(row.get('nif')) or _key(row.get('name')) or None, exc)
+            return
+        seen.update(added)
+        _count(report, valid)
+
+    return _run(rows, batch_size, dry_run, process)
+
+
+def _validate_suppliers(batch, serializer, report, seen, added, lock):
+    """Clés retenues dans `added`, ajoutées à `seen` une fois le paquet écrit"""
+    names = {_key(row.get('name')) for _, row in batch} - {''}
+    nifs = {_key(row.get('nif')) for _, row in batch} - {''}
+    existing = Supplier.objects.filter(name__in=names) | Supplier.objects.filter(nif__in=nifs)
+    if lock:
+        existing = existing.select_for_update()
+    by_name, by_nif = {}, {}
+    for values in existing.order_by('pk').values('pk', *SUPPLIER_FIELDS):
+        by_name[values['name']] = values
+        if values['nif']:
+            by_nif.setdefault(values['nif'], values)
+
+    valid = []
+    for number, row in batch:
+        nif = _key(row.get('nif'))
+        label = nif or _key(row.get('name')) or None
+        current = (by_nif.get(nif) if nif else None) or by_name.get(_key(row.get('name')))
+        data = {**{k: v for k, v in current.items() if k != 'pk'}, **row} if current else row
+        try:
+            validated = serializer.run_validation(data)
+        except serializers.ValidationError as exc:
+            report.error(number, label, flatten_errors(exc.detail))
+            continue
+        other = by_name.get(validated['name'])
+        if other is not None and other is not current:
+            # renommage (fiche trouvée par nif) vers le nom d'un autre fournisseur
+            report.error(number, label, {'name': 'Un autre fournisseur porte déjà ce nom.'})
+            continue
+        keys = {('name', validated['name'])}
+        if nif:
+            keys.add(('nif', nif))
+        if current:
+            keys.add(('pk', current['pk']))
+        if keys & seen or keys & added:
+            report.error(number, label, {'non_field_errors': 'Fournisseur en double dans le fichier.'})
+            continue
+        added.update(keys)
+        valid.append((number, validated, current))
+    return valid
+
+
+# -------- matières --------
+
+class _References:
+    """Catégories et fournisseurs par nom (insensible à la casse) ; fournisseurs aussi par nif"""
+
+    def __init__(self):
+        self.reload()
+
+    def reload(self):
+        self.categories = {_fold(name): pk for pk, name in Category.objects.values_list('pk', 'name')}
+        self.suppliers = {}
+        for pk, name, nif in Supplier.objects.order_by('pk').values_list('pk', 'name', 'nif'):
+            self.suppliers[_fold(name)] = pk
+            if nif:
+                self.suppliers.setdefault(_fold(nif), pk)
+
+    def create_categories(self, names):
+        """Crée les catégories manquantes (une requête d'insertion, une de relecture)"""
+        missing = {_key(n) for n in names if _fold(n) not in self.categories}
+        if not missing:
+            return
+        Category.objects.bulk_create([Category(name=n) for n in missing], ignore_conflicts=True)
+        for pk, name in Category.objects.filter(name__in=missing).values_list('pk', 'name'):
+            self.categories[_fold(name)] = pk
+
+
+def import_materials(rows, *, batch_size=None, dry_run=False, created_by=''):
+    """rows : dicts (voir erp_api.importing.read_rows) ; retourne un ImportReport"""
+    serializer = MaterialImportSerializer()
+    references = _References()
+    seen = set()
+
+    def process(batch, report):
+        mark = report.mark()
+        added = set()
+        try:
+            with transaction.atomic():
+                valid = _validate_materials(batch, serializer, references, report, seen, added, lock=not dry_run)
+                if valid and not dry_run:
+                    _write_materials(valid, references, created_by)
+        except DatabaseError as exc:
+            references.reload()  # catégories créées par le paquet annulé
+            report.fail_batch(mark, batch, lambda row: _key(row.get('reference')) or None, exc)
+            return
+        seen.update(added)
+        _count(report, valid)
+
+    return _run(rows, batch_size, dry_run, process)
+
+
+def _validate_materials(batch, serializer, references, report, seen, added, lock):
+    """Références retenues dans `added`, ajoutées à `seen` une fois le paquet écrit"""
+    existing = Material.objects.filter(reference__in={_key(row.get('reference')) for _, row in batch})
+    if lock:
+        existing = existing.select_for_update()
+    existing = {
+        values['reference']: values
+        for values in existing.values('pk', 'category_id', 'supplier_id', *MATERIAL_FIELDS)
+    }
+
+    valid = []
+    for number, row in batch:
+        reference = _key(row.get('reference'))
+        if reference and (reference in seen or reference in added):
+            report.error(number, reference, {'reference': 'Référence en double dans le fichier.'})
+            continue
+        current = existing.get(reference)
+        base = {k: v for k, v in current.items() if k in MATERIAL_FIELDS} if current else {}
+        try:
+            validated = serializer.run_validation({**base, **row})
+        except serializers.ValidationError as exc:
+            report.error(number, reference or None, flatten_errors(exc.detail))
+            continue
+
+        # colonne absente : relation inchangée ; valeur vide (JSON null / "") : aucune.
+        # Catégorie : nom gardé sous 'category', résolu (ou créé) à l'écriture
+        if 'category' in row:
+            validated['category'] = _key(row['category'])
+        else:
+            validated['category_id'] = (current or {}).get('category_id')
+        if 'supplier' in row:
+            supplier = _key(row['supplier'])
+            if supplier and _fold(supplier) not in references.suppliers:
+                report.error(number, reference, {'supplier': f'Fournisseur inconnu : {supplier}.'})
+                continue
+            validated['supplier_id'] = references.suppliers.get(_fold(supplier))
+        else:
+            validated['supplier_id'] = (current or {}).get('supplier_id')
+        added.add(reference)
+        valid.append((number, validated, current))
+    return valid
+
+
+def _write_materials(valid, references, created_by):
+    references.create_categories(data['category'] for _, data, _ in valid if data.get('category'))
+    materials = []
+    for _, data, _ in valid:
+        data = dict(data)
+        if 'category' in data:
+            data['category_id'] = references.categories.get(_fold(data.pop('category')))
+        materials.append(Material(**data))
+    Material.objects.bulk_create(
+        materials, update_conflicts=True, unique_fields=['reference'],
+        update_fields=[f for f in MATERIAL_FIELDS if f != 'reference'] + ['category', 'supplier', 'updated_at'],
+    )
+    if any(m.pk is None for m in materials):
+        # base sans RETURNING sur un upsert : relecture des clés
+        pks = dict(Material.objects.filter(reference__in=[m.reference for m in materials])
+                   .values_list('reference', 'pk'))
+        for material in materials:
+            material.pk = pks[material.reference]
+
+    movements = []
+    for material, (_, _, current) in zip(materials, valid):
+        previous = current['stock'] if current else 0
+        if material.stock == previous:
+            continue
+        movements.append(StockMovement(
+            material_id=material.pk,
+            movement_type='adjustment' if current else 'in',
+            quantity=material.stock,  # ajustement : quantité = nouveau stock (cf. StockMovementCreateSerializer)
+            previous_stock=previous,
+            new_stock=material.stock,
+            notes='Import matières' if current else 'Stock initial (import matières)',
+            created_by=created_by,
+        ))
+    StockMovement.objects.bulk_create(movements)
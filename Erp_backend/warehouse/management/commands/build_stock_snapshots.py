@@ -0,0 +1,23 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.snapshots import build_snapshots
+
+
+class Command(BaseCommand):
+    help = "Build daily stock snapshots for closed days (run nightly)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--until", help="Last day to snapshot, YYYY-MM-DD (default: yesterday)")
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        until = None
+        if options["until"]:
+            try:
+                until = date.fromisoformat(options["until"])
+            except ValueError:
+                raise CommandError("--until must be YYYY-MM-DD")
+        written = build_snapshots(until=until, batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{written} snapshot(s) written."))
@@ -0,0 +1,7 @@
+from erp_api.importing import ImportCommand
+from warehouse.imports import import_materials
+
+
+class Command(ImportCommand):
+    help = "Import raw materials from a CSV or JSON file, upserting by reference."
+    importer = import_materials
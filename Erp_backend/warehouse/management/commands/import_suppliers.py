@@ -0,0 +1,7 @@
+from erp_api.importing import ImportCommand
+from warehouse.imports import import_suppliers
+
+
+class Command(ImportCommand):
+    help = "Import suppliers from a CSV or JSON file, upserting by NIF or name."
+    importer = import_suppliers
@@ -0,0 +1,30 @@
+from decimal import Decimal, InvalidOperation
+
+from django.core.management.base import BaseCommand, CommandError
+
+from warehouse.replenishment import plan_replenishment
+
+
+class Command(BaseCommand):
+    help = "Create one draft purchase order per supplier for low-stock materials, net of open orders."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--factor", help="Order up to min_stock x factor (default: REPLENISHMENT_TARGET_FACTOR)")
+        parser.add_argument("--supplier", type=int, action="append", dest="suppliers", help="Limit to a supplier id (repeatable)")
+        parser.add_argument("--dry-run", action="store_true", help="Compute the proposals, write nothing")
+
+    def handle(self, *args, **options):
+        factor = None
+        if options["factor"]:
+            try:
+                factor = Decimal(options["factor"])
+            except InvalidOperation:
+                raise CommandError("--factor must be a number")
+            if factor < 1:
+                raise CommandError("--factor must be at least 1")
+        result = plan_replenishment(target_factor=factor, suppliers=options["suppliers"], dry_run=options["dry_run"])
+        prefix = "[dry run] " if result["dry_run"] else ""
+        self.stdout.write(self.style.SUCCESS(
+            f"{prefix}{result['orders']} purchase order(s), {result['items']} item(s), "
+            f"total {result['total_amount']}; {result['materials_without_supplier']} low-stock material(s) without supplier"
+        ))
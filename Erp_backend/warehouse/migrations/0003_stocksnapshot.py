@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('warehouse', '0002_supplier_iban_supplier_nif_supplier_payment_delay_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('stock', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Stock')),
+                ('unit_price', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Prix unitaire')),
+                ('movement_id', models.BigIntegerField(verbose_name='Dernier mouvement inclus')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Point de contrôle de stock',
+                'verbose_name_plural': 'Points de contrôle de stock',
+                'ordering': ['-date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='stockmovement',
+            index=models.Index(fields=['material', 'created_at'], name='warehouse_s_materia_0bad0b_idx'),
+        ),
+        migrations.AddField(
+            model_name='stocksnapshot',
+            name='material',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='warehouse.material', verbose_name='Matière première'),
+        ),
+        migrations.AddConstraint(
+            model_name='stocksnapshot',
+            constraint=models.UniqueConstraint(fields=('material', 'date'), name='uniq_stocksnapshot_material_date'),
+        ),
+    ]
@@ -127,6 +127,7 @@ class Material(models.Model):
         verbose_name = "Matière première"
         verbose_name_plural = "Matières premières"
         ordering = ['name']
+        indexes = [models.Index(fields=['name', 'id'])]  # pagination par curseur
 
     def __str__(self):
         return f"{self.name} ({self.reference})"
@@ -202,11 +203,41 @@ class StockMovement(models.Model):
         verbose_name = "Mouvement de stock"
         verbose_name_plural = "Mouvements de stock"
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['material', 'created_at']),
+            models.Index(fields=['created_at', 'id']),  # pagination par curseur
+        ]
 
     def __str__(self):
         return f"{self.get_movement_type_display()} - {self.material.name} - {self.quantity} {self.material.unit}"
 
 
+class StockSnapshot(models.Model):
+    """Point de contrôle : stock d'une matière en fin de journée (voir warehouse.snapshots)"""
+    material = models.ForeignKey(
+        Material,
+        on_delete=models.CASCADE,
+        related_name='snapshots',
+        verbose_name="Matière première"
+    )
+    date = models.DateField(verbose_name="Date")
+    stock = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Stock")
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Prix unitaire")
+    movement_id = models.BigIntegerField(verbose_name="Dernier mouvement inclus")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Point de contrôle de stock"
+        verbose_name_plural = "Points de contrôle de stock"
+        ordering = ['-date']
+        constraints = [
+            models.UniqueConstraint(fields=['material', 'date'], name='uniq_stocksnapshot_material_date'),
+        ]
+
+    def __str__(self):
+        return f"{self.material.name} - {self.date} - {self.stock}"
+
+
 class PurchaseOrder(models.Model):
     """Bon de commande"""
     STATUS_CHOICES = [
@@ -1,15 +1,15 @@
 from rest_framework import permissions
 
+from rbac.cache import granted
+
 
 def has_any(user, codes: list[str]):
     """
     Vérifie si l'utilisateur a au moins une des permissions spécifiées
     Accepte à la fois app_label.codename et codename brut venant de rbac.Feature
+    (ensemble des permissions de l'utilisateur en cache : rbac.cache)
     """
-    for code in codes:
-        if user.has_perm(f"rbac.{code}") or user.has_perm(f"warehouse.{code}"):
-            return True
-    return False
+    return granted(user, [f"{app}.{code}" for code in codes for app in ("rbac", "warehouse")])
 
 
 class WarehousePermission(permissions.BasePermission):
@@ -31,6 +31,7 @@ class MaterialsPermission(permissions.BasePermission):
         "destroy": ["materials_manage"],
         # Actions personnalisées
         "adjust_stock": ["stock_manage"],
+        "bulk_import": ["materials_manage"],
         "low_stock": ["materials_view"],
         "statistics": ["materials_view"],
         # Lecture
@@ -82,6 +83,7 @@ class SuppliersPermission(permissions.BasePermission):
         "destroy": ["suppliers_manage"],
         # Actions personnalisées
         "materials": ["suppliers_view", "materials_view"],
+        "bulk_import": ["suppliers_manage"],
         # Lecture
         "list": ["suppliers_view"],
         "retrieve": ["suppliers_view"],
@@ -117,6 +119,8 @@ class StockMovementsPermission(permissions.BasePermission):
         # Actions personnalisées
         "by_material": ["stock_view"],
         "statistics": ["stock_view"],
+        "balance_at": ["stock_view"],
+        "export": ["stock_view"],
         # Lecture
         "list": ["stock_view"],
         "retrieve": ["stock_view"],
@@ -154,6 +158,7 @@ class PurchaseOrdersPermission(permissions.BasePermission):
         "destroy": ["purchase_orders_manage"],
         # Actions personnalisées
         "receive": ["purchase_orders_receive", "stock_manage"],
+        "replenish": ["purchase_orders_manage"],
         "statistics": ["purchase_orders_view"],
         # Lecture
         "list": ["purchase_orders_view"],
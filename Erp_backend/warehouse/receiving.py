@@ -0,0 +1,90 @@
+"""Réception des bons de commande fournisseurs"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.utils import timezone
+
+from . import dashboard
+from .models import Material, PurchaseOrder, PurchaseOrderItem, StockMovement
+
+
+class ReceptionError(Exception):
+    """Réception impossible (statut de la commande, article inconnu...)"""
+
+
+def receive_purchase_order(purchase_order_id, quantities=None, *, notes='', created_by='System', delivery_date=None):
+    """
+    Réceptionne un bon de commande en un nombre constant de requêtes.
+
+    `quantities` : {item_id: quantité}. None = tout le restant à recevoir.
+    Les quantités sont bornées au restant de chaque ligne. Les matières
+    concernées sont verrouillées (select_for_update) avant la mise à jour,
+    puis stock, mouvements et quantités reçues sont écrits en bloc.
+    Retourne le bon de commande mis à jour.
+    """
+    with transaction.atomic():
+        purchase_order = PurchaseOrder.objects.select_for_update().get(pk=purchase_order_id)
+        if purchase_order.status == 'received':
+            raise ReceptionError('Cette commande a déjà été reçue')
+        if purchase_order.status == 'cancelled':
+            raise ReceptionError('Impossible de recevoir une commande annulée')
+
+        items = list(purchase_order.items.select_for_update().order_by('pk'))
+        if quantities is None:
+            quantities = {item.pk: item.quantity - item.received_quantity for item in items}
+        else:
+            known = {item.pk for item in items}
+            unknown = [item_id for item_id in quantities if item_id not in known]
+            if unknown:
+                raise ReceptionError(f'Articles introuvables sur cette commande : {unknown}')
+
+        # Verrouille toutes les matières concernées en une requête (ordre stable)
+        materials = {
+            m.pk: m
+            for m in Material.objects.select_for_update()
+            .filter(pk__in={item.material_id for item in items if item.pk in quantities})
+            .order_by('pk')
+        }
+
+        now = timezone.now()
+        movements, touched_items, touched_materials = [], [], {}
+        for item in items:
+            quantity = quantities.get(item.pk)
+            if quantity is None or quantity <= 0:
+                continue
+            # Ne pas recevoir plus que commandé
+            quantity = min(Decimal(quantity), item.quantity - item.received_quantity)
+            if quantity <= 0:
+                continue
+
+            material = materials[item.material_id]
+            movements.append(StockMovement(
+                material=material,
+                movement_type='in',
+                quantity=quantity,
+                previous_stock=material.stock,
+                new_stock=material.stock + quantity,
+                notes=notes,
+                created_by=created_by,
+            ))
+            material.stock += quantity
+            material.updated_at = now
+            touched_materials[material.pk] = material
+
+            item.received_quantity += quantity
+            touched_items.append(item)
+
+        Material.objects.bulk_update(touched_materials.values(), ['stock', 'updated_at'])
+        StockMovement.objects.bulk_create(movements)
+        PurchaseOrderItem.objects.bulk_update(touched_items, ['received_quantity'])
+        if movements:
+            dashboard.invalidate()
+
+        # Vérifier si tout est reçu
+        if items and all(item.is_fully_received for item in items):
+            purchase_order.status = 'received'
+            if not purchase_order.actual_delivery_date:
+                purchase_order.actual_delivery_date = delivery_date
+            purchase_order.save()
+
+    return purchase_order
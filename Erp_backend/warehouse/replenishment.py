@@ -0,0 +1,178 @@
+"""
+Réapprovisionnement automatique : bons de commande brouillons pour les
+matières en stock bas.
+
+Une matière est à commander si stock < min_stock et que les quantités déjà
+commandées (lignes des commandes brouillon, envoyées ou confirmées, moins
+les quantités reçues) ne suffisent pas à repasser au-dessus du minimum. La
+quantité proposée complète jusqu'au niveau cible
+min_stock × REPLENISHMENT_TARGET_FACTOR :
+
+    quantité = cible - stock - en commande
+
+Une seule requête lit les matières en stock bas avec leur quantité en
+commande (sous-requête agrégée, évaluée une fois par matière retenue) : pas
+de requête par matière. Quantités nettes et regroupement par fournisseur
+sont faits en Python sur ces lignes, puis, dans la même transaction (matières
+verrouillées), un bulk_create des bons de commande et un des lignes. Les
+matières sans fournisseur sont comptées à part, sans commande.
+
+Les commandes brouillons comptent comme « en commande » : relancer le
+planificateur ne commande pas deux fois la même chose.
+
+Les numéros REA-AAAAMMJJ-NNNN suivent ceux du jour lus en base, sans verrou :
+si un passage concurrent (autres fournisseurs) a pris les mêmes entre-temps,
+l'insertion viole l'unicité de order_number et est rejouée sous savepoint
+avec des numéros relus, au plus NUMBERING_ATTEMPTS fois.
+"""
+from collections import defaultdict
+from decimal import ROUND_UP, Decimal
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import dashboard
+from .models import Material, PurchaseOrder, PurchaseOrderItem
+
+OPEN_STATUSES = ('draft', 'sent', 'confirmed')
+ORDER_PREFIX = 'REA'
+NOTES = 'Réapprovisionnement automatique (stock bas)'
+DEFAULT_TARGET_FACTOR = 2
+ITEM_BATCH_SIZE = 2000
+NUMBERING_ATTEMPTS = 5
+
+QUANTITY = DecimalField(max_digits=14, decimal_places=2)
+CENT = Decimal('0.01')
+
+
+def _on_order():
+    """Quantité restant à recevoir sur les commandes ouvertes, par matière"""
+    return Coalesce(
+        Subquery(
+            PurchaseOrderItem.objects
+            .filter(material=OuterRef('pk'), purchase_order__status__in=OPEN_STATUSES)
+            .order_by().values('material')
+            .annotate(s=Sum(F('quantity') - F('received_quantity'))).values('s'),
+            output_field=QUANTITY,
+        ),
+        Value(Decimal('0')),
+        output_field=QUANTITY,
+    )
+
+
+def proposals(target_factor=None, suppliers=None, lock=False):
+    """
+    Matières à commander : (pk, supplier_id, prix, quantité), supplier_id
+    None pour une matière sans fournisseur.
+    """
+    factor = Decimal(str(target_factor or getattr(settings, 'REPLENISHMENT_TARGET_FACTOR', DEFAULT_TARGET_FACTOR)))
+    materials = Material.objects.filter(stock__lt=F('min_stock'))
+    if suppliers:
+        materials = materials.filter(supplier__in=suppliers)
+    if lock:
+        materials = materials.select_for_update()
+    rows = (
+        materials.annotate(on_order=_on_order())
+        .order_by('supplier_id', 'pk')
+        .values_list('pk', 'supplier_id', 'price', 'stock', 'min_stock', 'on_order')
+    )
+    for pk, supplier_id, price, stock, min_stock, on_order in rows:
+        if stock + on_order >= min_stock:
+            continue  # déjà couvert par les commandes en cours
+        quantity = (min_stock * factor - stock - on_order).quantize(CENT, rounding=ROUND_UP)
+        yield pk, supplier_id, price, quantity
+
+
+def _next_numbers(count, day):
+    """Numéros REA-AAAAMMJJ-NNNN à la suite de ceux du jour"""
+    prefix = f'{ORDER_PREFIX}-{day:%Y%m%d}-'
+    last = 0
+    for number in PurchaseOrder.objects.filter(order_number__startswith=prefix).values_list('order_number', flat=True):
+        suffix = number[len(prefix):]
+        if suffix.isdigit():
+            last = max(last, int(suffix))
+    return [f'{prefix}{last + i:04d}' for i in range(1, count + 1)]
+
+
+def plan_replenishment(*, target_factor=None, suppliers=None, dry_run=False):
+    """
+    Calcule les propositions et, sauf dry_run, crée un bon de commande
+    brouillon par fournisseur. Retourne un résumé (commandes, lignes,
+    montant, matières sans fournisseur, détail par fournisseur).
+    """
+    with transaction.atomic():
+        by_supplier = defaultdict(list)
+        without_supplier = 0
+        for pk, supplier_id, price, quantity in proposals(target_factor, suppliers, lock=not dry_run):
+            if supplier_id is None:
+                without_supplier += 1
+            else:
+                by_supplier[supplier_id].append((pk, quantity, price))
+
+        today = timezone.localdate()
+        numbers = _next_numbers(len(by_supplier), today)
+        orders = [
+            PurchaseOrder(
+                order_number=number, supplier_id=supplier_id, status='draft', order_date=today, notes=NOTES,
+                total_amount=sum((quantity * price for _, quantity, price in lines), Decimal('0')).quantize(CENT),
+            )
+            for number, (supplier_id, lines) in zip(numbers, by_supplier.items())
+        ]
+        if orders and not dry_run:
+            _write_numbered(orders, by_supplier, today)
+
+    if orders and not dry_run:
+        dashboard.invalidate_purchasing()  # bulk_create n'émet pas de signaux
+    return {
+        'dry_run': dry_run,
+        'orders': len(orders),
+        'items': sum(len(lines) for lines in by_supplier.values()),
+        'total_amount': sum((order.total_amount for order in orders), Decimal('0.00')),
+        'materials_without_supplier': without_supplier,
+        'purchase_orders': [
+            {
+                'id': order.pk,
+                'order_number': order.order_number,
+                'supplier': order.supplier_id,
+                'items': len(by_supplier[order.supplier_id]),
+                'total_amount': order.total_amount,
+            }
+            for order in orders
+        ],
+    }
+
+
+def _write_numbered(orders, by_supplier, day):
+    """_write, renuméroté et rejoué si un passage concurrent a pris les mêmes numéros"""
+    for attempt in range(1, NUMBERING_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                _write(orders, by_supplier)
+            return
+        except IntegrityError:
+            numbers = [order.order_number for order in orders]
+            if attempt == NUMBERING_ATTEMPTS or not PurchaseOrder.objects.filter(order_number__in=numbers).exists():
+                raise
+            for order, number in zip(orders, _next_numbers(len(orders), day)):
+                order.pk, order.order_number = None, number
+
+
+def _write(orders, by_supplier):
+    PurchaseOrder.objects.bulk_create(orders)
+    if any(order.pk is None for order in orders):
+        # base sans RETURNING sur bulk_create : relecture des clés
+        pks = dict(PurchaseOrder.objects.filter(order_number__in=[o.order_number for o in orders])
+                   .values_list('order_number', 'pk'))
+        for order in orders:
+            order.pk = pks[order.order_number]
+    PurchaseOrderItem.objects.bulk_create(
+        [
+            PurchaseOrderItem(purchase_order_id=order.pk, material_id=material_id, quantity=quantity, unit_price=price)
+            for order in orders
+            for material_id, quantity, price in by_supplier[order.supplier_id]
+        ],
+        batch_size=ITEM_BATCH_SIZE,
+    )
@@ -11,7 +11,9 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
     def get_materials_count(self, obj):
-        return obj.materials.count()
+        # annoté par le viewset (Count) ; sinon une requête
+        count = getattr(obj, 'materials_count', None)
+        return obj.materials.count() if count is None else count
 
 
 class SupplierSerializer(serializers.ModelSerializer):
@@ -28,7 +30,9 @@ class SupplierSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
     def get_materials_count(self, obj):
-        return obj.materials.count()
+        # annoté par le viewset (Count) ; sinon une requête
+        count = getattr(obj, 'materials_count', None)
+        return obj.materials.count() if count is None else count
 
 
 class MaterialListSerializer(serializers.ModelSerializer):
@@ -36,7 +40,7 @@ class MaterialListSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     supplier_name = serializers.CharField(source='supplier.name', read_only=True)
     is_low_stock = serializers.BooleanField(read_only=True)
-    stock_percentage = serializers.DecimalField(max_digits=5, decimal_places=2, read_only=True)
+    stock_percentage = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
     stock_status = serializers.CharField(read_only=True)
     total_value = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
 
@@ -56,7 +60,7 @@ class MaterialDetailSerializer(serializers.ModelSerializer):
     category_name = serializers.CharField(source='category.name', read_only=True)
     supplier_name = serializers.CharField(source='supplier.name', read_only=True)
     is_low_stock = serializers.BooleanField(read_only=True)
-    stock_percentage = serializers.DecimalField(max_digits=5, decimal_places=2, read_only=True)
+    stock_percentage = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
     stock_status = serializers.CharField(read_only=True)
     total_value = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
     recent_movements = serializers.SerializerMethodField()
@@ -202,7 +206,8 @@ class PurchaseOrderListSerializer(serializers.ModelSerializer):
         read_only_fields = ['created_at', 'updated_at']
 
     def get_items_count(self, obj):
-        return obj.items.count()
+        count = getattr(obj, 'items_count', None)
+        return obj.items.count() if count is None else count
 
 
 class PurchaseOrderDetailSerializer(serializers.ModelSerializer):
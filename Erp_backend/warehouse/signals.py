@@ -0,0 +1,23 @@
+"""Invalidation du cache des indicateurs de stock (warehouse.dashboard)"""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import dashboard
+from .models import Category, Material, PurchaseOrder, StockMovement, Supplier
+
+
+@receiver([post_save, post_delete], sender=Material)
+@receiver([post_save, post_delete], sender=StockMovement)
+@receiver([post_save, post_delete], sender=Category)
+@receiver([post_save, post_delete], sender=Supplier)
+def invalidate_stock_indicators(sender, **kwargs):
+    # Les écritures en bloc (bulk_create/bulk_update/update) n'émettent pas
+    # de signaux : les appelants invalident eux-mêmes (voir receiving.py).
+    dashboard.invalidate()
+
+
+@receiver([post_save, post_delete], sender=PurchaseOrder)
+@receiver([post_save, post_delete], sender=Material)
+@receiver([post_save, post_delete], sender=Supplier)
+def invalidate_purchasing_indicators(sender, **kwargs):
+    dashboard.invalidate_purchasing()
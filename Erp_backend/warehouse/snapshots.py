@@ -0,0 +1,139 @@
+"""Points de contrôle journaliers du stock des matières"""
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Material, StockMovement, StockSnapshot
+
+
+def _end_of_day(day):
+    """Premier instant du lendemain de `day`, dans le fuseau courant"""
+    return timezone.make_aware(datetime.combine(day + timedelta(days=1), time.min))
+
+
+def _flush(latest):
+    prices = dict(
+        Material.objects.filter(pk__in={material_id for material_id, _ in latest})
+        .values_list('pk', 'price')
+    )
+    StockSnapshot.objects.bulk_create(
+        [
+            StockSnapshot(
+                material_id=material_id,
+                date=day,
+                stock=stock,
+                unit_price=prices.get(material_id, Decimal('0')),
+                movement_id=movement_id,
+            )
+            for (material_id, day), (movement_id, stock) in latest.items()
+        ],
+        update_conflicts=True,
+        unique_fields=['material', 'date'],
+        update_fields=['stock', 'unit_price', 'movement_id'],
+    )
+
+
+def build_snapshots(until=None, batch_size=2000):
+    """
+    Ajoute les points de contrôle des journées closes jusqu'à `until`
+    (inclus, par défaut hier). Seuls les mouvements postérieurs au dernier
+    point de contrôle sont relus : un point par matière et par jour où elle
+    a bougé, avec le stock après le dernier mouvement de la journée.
+    Retourne le nombre de points écrits.
+    """
+    until = until or timezone.localdate() - timedelta(days=1)
+    last_id = StockSnapshot.objects.aggregate(m=Max('movement_id'))['m'] or 0
+    movements = (
+        StockMovement.objects
+        .filter(pk__gt=last_id, created_at__lt=_end_of_day(until))
+        .order_by('pk')
+        .values_list('pk', 'material_id', 'created_at', 'new_stock')
+    )
+
+    written = 0
+    latest = {}
+    with transaction.atomic():
+        for movement_id, material_id, created_at, new_stock in movements.iterator(chunk_size=batch_size):
+            day = timezone.localdate(created_at)
+            if len(latest) >= batch_size and (material_id, day) not in latest:
+                _flush(latest)
+                written += len(latest)
+                latest = {}
+            latest[(material_id, day)] = (movement_id, new_stock)
+        if latest:
+            _flush(latest)
+            written += len(latest)
+    return written
+
+
+def stock_at(day):
+    """
+    Stock et valorisation de chaque matière à la fin de `day`.
+
+    Part du point de contrôle le plus proche (<= day) et ne rejoue que les
+    mouvements qui le suivent. Sans point ni mouvement avant la date, le
+    stock est celui d'avant le premier mouvement suivant, ou le stock actuel
+    si la matière n'a jamais bougé depuis.
+    """
+    end = _end_of_day(day)
+    snapshot = StockSnapshot.objects.filter(material=OuterRef('pk'), date__lte=day).order_by('-date')
+    rows = (
+        Material.objects
+        .filter(created_at__lt=end)
+        .annotate(
+            snap_stock=Subquery(snapshot.values('stock')[:1]),
+            snap_price=Subquery(snapshot.values('unit_price')[:1]),
+            snap_movement=Subquery(snapshot.values('movement_id')[:1]),
+        )
+        .annotate(
+            replayed_stock=Subquery(
+                StockMovement.objects
+                .filter(
+                    material=OuterRef('pk'),
+                    created_at__lt=end,
+                    pk__gt=Coalesce(OuterRef('snap_movement'), 0),
+                )
+                .order_by('-created_at', '-pk')
+                .values('new_stock')[:1]
+            ),
+            next_previous_stock=Subquery(
+                StockMovement.objects
+                .filter(material=OuterRef('pk'), created_at__gte=end)
+                .order_by('created_at', 'pk')
+                .values('previous_stock')[:1]
+            ),
+        )
+        .order_by('name')
+        .values(
+            'id', 'reference', 'name', 'unit', 'stock', 'price',
+            'snap_stock', 'snap_price', 'replayed_stock', 'next_previous_stock',
+        )
+    )
+
+    materials = []
+    total_value = Decimal('0')
+    for row in rows:
+        if row['replayed_stock'] is not None:
+            stock, price = row['replayed_stock'], row['price']
+        elif row['snap_stock'] is not None:
+            stock, price = row['snap_stock'], row['snap_price']
+        elif row['next_previous_stock'] is not None:
+            stock, price = row['next_previous_stock'], row['price']
+        else:
+            stock, price = row['stock'], row['price']
+        value = stock * price
+        total_value += value
+        materials.append({
+            'material': row['id'],
+            'reference': row['reference'],
+            'name': row['name'],
+            'unit': row['unit'],
+            'stock': stock,
+            'unit_price': price,
+            'value': value,
+        })
+    return {'date': day, 'total_value': total_value, 'materials': materials}
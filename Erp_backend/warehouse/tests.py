@@ -1,3 +1,418 @@
+import datetime
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import DatabaseError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from . import replenishment
+from .imports import import_materials, import_suppliers
+from .models import Category, Material, PurchaseOrder, PurchaseOrderItem, StockMovement, StockSnapshot, Supplier
+from .receiving import ReceptionError, receive_purchase_order
+from .replenishment import plan_replenishment
+from .snapshots import build_snapshots, stock_at
+
+
+class ListQueryCountTests(TestCase):
+    """Le nombre de requêtes d'une liste ne doit pas dépendre du nombre de lignes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_rows(self, n):
+        start = Supplier.objects.count()
+        for i in range(start, start + n):
+            category = Category.objects.create(name=f'Catégorie {i}')
+            supplier = Supplier.objects.create(name=f'Fournisseur {i}')
+            material = Material.objects.create(
+                name=f'Matière {i}', reference=f'MAT-{i}', category=category,
+                supplier=supplier, stock=5, min_stock=1, unit='kg', price=5,
+            )
+            StockMovement.objects.create(
+                material=material, movement_type='in', quantity=5, previous_stock=0, new_stock=5,
+            )
+            order = PurchaseOrder.objects.create(order_number=f'PO-{i}', supplier=supplier)
+            for _ in range(2):
+                PurchaseOrderItem.objects.create(
+                    purchase_order=order, material=material, quantity=3, unit_price=5,
+                )
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx), response
+
+    def assertQueriesConstant(self, url):
+        self.add_rows(2)
+        small, _ = self.count_queries(url)
+        self.add_rows(10)
+        large, response = self.count_queries(url)
+        self.assertEqual(
+            small, large,
+            f'{url}: {small} requêtes pour 2 lignes, {large} pour 12 (N+1 ?)',
+        )
+        return response
+
+    def test_categories_list(self):
+        response = self.assertQueriesConstant('/api/warehouse/categories/')
+        self.assertTrue(all(row['materials_count'] == 1 for row in response.json()))
+
+    def test_suppliers_list(self):
+        response = self.assertQueriesConstant('/api/warehouse/suppliers/')
+        self.assertTrue(all(row['materials_count'] == 1 for row in response.json()))
+
+    def test_purchase_orders_list(self):
+        response = self.assertQueriesConstant('/api/warehouse/purchase-orders/')
+        self.assertTrue(all(row['items_count'] == 2 for row in response.json()))
+
+    def test_materials_list(self):
+        self.assertQueriesConstant('/api/warehouse/materials/')
+
+    def test_stock_movements_list(self):
+        self.assertQueriesConstant('/api/warehouse/stock-movements/')
+
+
+class KeysetPaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        category = Category.objects.create(name='Catégorie')
+        # noms en double pour vérifier le départage par id
+        Material.objects.bulk_create([
+            Material(name=f'Matière {i // 2:02d}', reference=f'MAT-{i}', category=category,
+                     stock=1, min_stock=1, unit='kg', price=1)
+            for i in range(23)
+        ])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url):
+        ids, pages = [], 0
+        while url:
+            body = self.client.get(url).json()
+            ids += [row['id'] for row in body['results']]
+            url, pages = body['next'], pages + 1
+        return ids, pages
+
+    def test_unpaginated_by_default(self):
+        response = self.client.get('/api/warehouse/materials/')
+        self.assertEqual(len(response.json()), 23)
+
+    def test_walks_every_row_once(self):
+        expected = list(Material.objects.order_by('name', 'pk').values_list('pk', flat=True))
+        ids, pages = self.walk('/api/warehouse/materials/?page_size=5')
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 5)
+
+    def test_respects_ordering_param(self):
+        expected = list(Material.objects.order_by('-name', '-pk').values_list('pk', flat=True))
+        ids, _ = self.walk('/api/warehouse/materials/?page_size=4&ordering=-name')
+        self.assertEqual(ids, expected)
+
+    def test_previous_link(self):
+        first = self.client.get('/api/warehouse/materials/?page_size=5&count=true').json()
+        self.assertEqual(first['count'], 23)
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual([r['id'] for r in back['results']], [r['id'] for r in first['results']])
+        self.assertIsNone(back['previous'])
+
+    def test_page_queries_do_not_depend_on_depth(self):
+        first = self.client.get('/api/warehouse/materials/?page_size=5').json()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get(first['next'])
+        self.assertEqual(len(ctx), 1)
+        self.assertNotIn('OFFSET', ctx.captured_queries[0]['sql'])
+
+
+class ReceptionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.supplier = Supplier.objects.create(name='Tissus du Nord')
+
+    def order(self, count, quantity=10, number='PO-1'):
+        order = PurchaseOrder.objects.create(order_number=number, supplier=self.supplier, status='confirmed')
+        for i in range(count):
+            material = Material.objects.create(
+                name=f'{number}-{i}', reference=f'{number}-{i}', stock=5, min_stock=0, unit='mètre', price=2,
+            )
+            PurchaseOrderItem.objects.create(purchase_order=order, material=material, quantity=quantity, unit_price=2)
+        return order
+
+    def test_partial_then_full_receipt(self):
+        order = self.order(2)
+        first, second = order.items.order_by('pk')
+        receive_purchase_order(order.pk, {first.pk: 4})
+        order.refresh_from_db()
+        first.material.refresh_from_db()
+        self.assertEqual((order.status, first.material.stock), ('confirmed', 9))
+
+        receive_purchase_order(order.pk)  # le restant : 6 et 10
+        order.refresh_from_db()
+        self.assertEqual(order.status, 'received')
+        self.assertEqual(
+            list(order.items.order_by('pk').values_list('received_quantity', 'material__stock')),
+            [(10, 15), (10, 15)],
+        )
+        self.assertEqual(
+            list(StockMovement.objects.filter(material=first.material).order_by('created_at')
+                 .values_list('movement_type', 'quantity', 'previous_stock', 'new_stock')),
+            [('in', 4, 5, 9), ('in', 6, 9, 15)],
+        )
+
+    def test_over_receipt_capped_then_rejected(self):
+        order = self.order(1)
+        item = order.items.get()
+        receive_purchase_order(order.pk, {item.pk: 25})
+        item.refresh_from_db()
+        self.assertEqual((item.received_quantity, item.material.stock), (10, 15))
+        with self.assertRaisesMessage(ReceptionError, 'déjà été reçue'):
+            receive_purchase_order(order.pk, {item.pk: 1})
+        with self.assertRaises(ReceptionError):
+            receive_purchase_order(self.order(1, number='PO-2').pk, {item.pk: 1})  # article d'une autre commande
+        self.assertEqual(StockMovement.objects.count(), 1)
+
+    def test_queries_do_not_depend_on_item_count(self):
+        def run(count):
+            order = self.order(count, number=f'PO-{count}')
+            with CaptureQueriesContext(connection) as ctx:
+                receive_purchase_order(order.pk)
+            self.assertEqual(StockMovement.objects.filter(material__reference__startswith=f'PO-{count}-').count(), count)
+            return len(ctx)
+
+        self.assertEqual(run(2), run(12))
+
+
+class SnapshotTests(TestCase):
+
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.material = Material.objects.create(
+            name='Coton', reference='COT', stock=20, min_stock=0, unit='mètre', price=3,
+        )
+        Material.objects.filter(pk=self.material.pk).update(created_at=self.at(-10))
+
+    def at(self, days):
+        return timezone.make_aware(datetime.datetime.combine(self.today + datetime.timedelta(days=days), datetime.time(12)))
+
+    def move(self, days, previous, new):
+        movement = StockMovement.objects.create(
+            material=self.material, movement_type='in' if new > previous else 'out',
+            quantity=abs(new - previous), previous_stock=previous, new_stock=new,
+        )
+        StockMovement.objects.filter(pk=movement.pk).update(created_at=self.at(days))
+
+    def stock(self, days):
+        return stock_at(self.today + datetime.timedelta(days=days))['materials'][0]['stock']
+
+    def test_point_in_time_ignores_later_movements(self):
+        self.move(-3, 0, 10)
+        self.move(-2, 10, 6)
+        self.move(-2, 6, 4)
+        self.assertEqual(build_snapshots(), 2)  # un point par jour où la matière a bougé
+        self.assertEqual(
+            list(StockSnapshot.objects.order_by('date').values_list('stock', flat=True)), [10, 4],
+        )
+
+        self.move(-1, 4, 12)  # après les points de contrôle
+        self.move(0, 12, 20)
+        self.assertEqual((self.stock(-4), self.stock(-3), self.stock(-2), self.stock(-1)), (0, 10, 4, 12))
+        self.assertEqual(stock_at(self.today + datetime.timedelta(days=-2))['total_value'], 12)
+
+    def test_only_movements_after_watermark_are_read(self):
+        self.move(-3, 0, 10)
+        self.assertEqual(build_snapshots(), 1)
+        self.assertEqual(build_snapshots(), 0)
+        self.move(-1, 10, 15)
+        self.move(0, 15, 20)  # journée en cours : pas encore close
+        self.assertEqual(build_snapshots(), 1)
+        self.assertEqual(
+            list(StockSnapshot.objects.order_by('date').values_list('date', 'stock')),
+            [(self.today - datetime.timedelta(days=3), 10), (self.today - datetime.timedelta(days=1), 15)],
+        )
+
+
+class ImportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        cls.supplier = Supplier.objects.create(name='Tissus du Nord', nif='NIF-1')
+        cls.category = Category.objects.create(name='Tissus')
+        cls.material = Material.objects.create(
+            name='Coton', reference='MAT-1', category=cls.category, supplier=cls.supplier,
+            stock=10, min_stock=1, unit='mètre', price=4,
+        )
+
+    def test_suppliers_upsert_by_nif_then_name(self):
+        report = import_suppliers([
+            {'name': 'Tissus du Nord SARL', 'nif': 'NIF-1', 'phone': '0102'},
+            {'name': 'Fils & Co'},
+            {'name': 'Fils & Co', 'email': 'contact@fils.example'},
+            {'name': 'Sans email', 'email': 'invalide'},
+        ])
+        self.assertEqual((report.created, report.updated, report.failed), (1, 1, 2))
+        self.supplier.refresh_from_db()
+        self.assertEqual((self.supplier.name, self.supplier.phone), ('Tissus du Nord SARL', '0102'))
+        self.assertEqual(Supplier.objects.count(), 2)
+
+    def test_materials_resolve_references_and_journal_stock(self):
+        report = import_materials([
+            {'reference': 'MAT-1', 'stock': '7'},
+            {'reference': 'MAT-2', 'name': 'Lin', 'category': 'tissus', 'supplier': 'NIF-1', 'stock': '25'},
+            {'reference': 'MAT-3', 'name': 'Bouton', 'category': 'Mercerie', 'stock': '0'},
+            {'reference': 'MAT-4', 'name': 'Zip', 'supplier': 'Inconnu'},
+        ])
+        self.assertEqual((report.created, report.updated, report.failed), (2, 1, 1))
+        self.assertEqual(report.errors[0]['key'], 'MAT-4')
+
+        lin = Material.objects.get(reference='MAT-2')
+        self.assertEqual((lin.category, lin.supplier), (self.category, self.supplier))
+        self.assertEqual(Material.objects.get(reference='MAT-3').category.name, 'Mercerie')
+        self.material.refresh_from_db()
+        self.assertEqual((self.material.stock, self.material.category), (7, self.category))
+        self.assertEqual(
+            sorted(StockMovement.objects.values_list('material__reference', 'movement_type', 'previous_stock', 'new_stock')),
+            [('MAT-1', 'adjustment', 10, 7), ('MAT-2', 'in', 0, 25)],
+        )
+
+    def test_queries_per_batch_not_per_row(self):
+        rows = [{'reference': f'B-{i}', 'name': f'Matière {i}', 'category': 'Tissus',
+                 'supplier': 'Tissus du Nord', 'stock': '1'} for i in range(40)]
+        with CaptureQueriesContext(connection) as small:
+            import_materials(rows[:4], batch_size=50)
+        with CaptureQueriesContext(connection) as large:
+            import_materials(rows[4:], batch_size=50)
+        self.assertEqual(len(small), len(large))
+
+    def test_failed_batch_reports_every_row(self):
+        rows = [{'reference': 'LOCK-1', 'name': 'Lin'}, {'reference': 'LOCK-2', 'supplier': 'Inconnu'},
+                {'reference': 'LOCK-1', 'name': 'Lin'}]
+        with mock.patch('warehouse.imports._write_materials', side_effect=[DatabaseError('deadlock'), None]):
+            report = import_materials(rows, batch_size=2)
+        self.assertEqual((report.total, report.failed, report.created), (3, 2, 1))
+        self.assertEqual([(e['row'], e['key'], e['errors']) for e in report.errors], [
+            (1, 'LOCK-1', {'non_field_errors': 'deadlock'}), (2, 'LOCK-2', {'non_field_errors': 'deadlock'}),
+        ])
+
+        rows = [{'name': 'Fils & Co', 'nif': 'NIF-2'}, {'name': 'Fils & Co', 'nif': 'NIF-2'}]
+        with mock.patch.object(Supplier.objects, 'bulk_create', side_effect=[DatabaseError('deadlock'), []]):
+            report = import_suppliers(rows, batch_size=1)
+        self.assertEqual((report.failed, report.created), (1, 1))
+        self.assertEqual(report.errors[0]['key'], 'NIF-2')
+
+    def test_endpoint_dry_run(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/warehouse/materials/import/?dry_run=1',
+                               [{'reference': 'NEW-1', 'name': 'Essai'}], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+        self.assertFalse(Material.objects.filter(reference='NEW-1').exists())
+        self.assertEqual(client.post('/api/warehouse/suppliers/import/', {'x': 1}, format='json').status_code, 400)
+
+    def test_endpoint_reports_non_object_items(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        for url in ('/api/warehouse/suppliers/import/', '/api/warehouse/materials/import/'):
+            response = client.post(url + '?dry_run=1', [1, 'x', {'name': 'Lin', 'reference': 'NEW-2'}], format='json')
+            self.assertEqual(response.status_code, 200, url)
+            body = response.json()
+            self.assertEqual((body['total'], body['failed'], body['created']), (3, 2, 1))
+            self.assertEqual([e['row'] for e in body['errors']], [1, 2])
+
+
+class ReplenishmentTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'x')
+        cls.supplier = Supplier.objects.create(name='Tissus du Nord')
+        cls.other = Supplier.objects.create(name='Fils & Co')
+
+    def material(self, reference, stock, min_stock, supplier=None):
+        return Material.objects.create(
+            name=reference, reference=reference, supplier=supplier, stock=stock, min_stock=min_stock,
+            unit='mètre', price=2,
+        )
+
+    def test_orders_up_to_target_net_of_open_orders(self):
+        low = self.material('LOW', 2, 10, self.supplier)
+        partly = self.material('PART', 4, 10, self.supplier)
+        covered = self.material('COV', 1, 10, self.other)
+        self.material('OK', 12, 10, self.supplier)
+        self.material('ORPHAN', 0, 5)
+        open_order = PurchaseOrder.objects.create(order_number='PO-1', supplier=self.supplier)
+        PurchaseOrderItem.objects.create(purchase_order=open_order, material=partly, quantity=5, unit_price=2)
+        PurchaseOrderItem.objects.create(purchase_order=open_order, material=covered, quantity=20, unit_price=2,
+                                         received_quantity=5)
+        done = PurchaseOrder.objects.create(order_number='PO-2', supplier=self.supplier, status='received')
+        PurchaseOrderItem.objects.create(purchase_order=done, material=low, quantity=50, unit_price=2,
+                                         received_quantity=50)
+
+        result = plan_replenishment()
+        self.assertEqual((result['orders'], result['items'], result['materials_without_supplier']), (1, 2, 1))
+        order = PurchaseOrder.objects.get(pk=result['purchase_orders'][0]['id'])
+        self.assertEqual((order.supplier, order.status), (self.supplier, 'draft'))
+        self.assertEqual(
+            dict(order.items.values_list('material__reference', 'quantity')),
+            {'LOW': 18, 'PART': 11},  # cible 20 : 20 - 2 ; 20 - 4 - 5 en commande
+        )
+        self.assertEqual(order.total_amount, 58)
+        # les brouillons créés comptent comme en commande
+        self.assertEqual(plan_replenishment()['orders'], 0)
+
+    def test_numbers_taken_concurrently_are_reallocated(self):
+        self.material('LOW', 2, 10, self.supplier)
+        real, calls = replenishment._next_numbers, []
+
+        def first_numbers_stale(count, day):
+            numbers = real(count, day)
+            if not calls:
+                # passage concurrent validé entre la lecture des numéros et l'insertion
+                PurchaseOrder.objects.create(order_number=numbers[0], supplier=self.other)
+            calls.append(numbers)
+            return numbers
+
+        with mock.patch('warehouse.replenishment._next_numbers', side_effect=first_numbers_stale):
+            result = plan_replenishment()
+        self.assertEqual(result['orders'], 1)
+        self.assertEqual(result['purchase_orders'][0]['order_number'], f'REA-{timezone.localdate():%Y%m%d}-0002')
+        self.assertEqual(PurchaseOrder.objects.get(pk=result['purchase_orders'][0]['id']).items.count(), 1)
+
+    def test_queries_do_not_depend_on_material_count(self):
+        def run(count):
+            PurchaseOrder.objects.all().delete()
+            Material.objects.all().delete()
+            for i in range(count):
+                self.material(f'M{count}-{i}', 0, 5, self.supplier if i % 2 else self.other)
+            with CaptureQueriesContext(connection) as ctx:
+                plan_replenishment()
+            return len(ctx)
+
+        self.assertEqual(run(2), run(12))
 
-# Create your tests here.
+    def test_endpoint_dry_run(self):
+        self.material('LOW', 2, 10, self.supplier)
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.post('/api/warehouse/purchase-orders/replenish/?dry_run=1', {'target_factor': 3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['items'], 1)
+        self.assertFalse(PurchaseOrder.objects.exists())
+        response = client.post('/api/warehouse/purchase-orders/replenish/', {'target_factor': 'x'}, format='json')
+        self.assertEqual(response.status_code, 400)
@@ -40,6 +40,7 @@ PUT    /api/suppliers/{id}/              - Modifier un fournisseur
 PATCH  /api/suppliers/{id}/              - Modifier partiellement un fournisseur
 DELETE /api/suppliers/{id}/              - Supprimer un fournisseur
 GET    /api/suppliers/{id}/materials/    - Matières d'un fournisseur
+POST   /api/suppliers/import/            - Import en masse CSV/JSON (?dry_run=1)
 
 # Materials
 GET    /api/materials/                   - Liste des matières
@@ -51,6 +52,7 @@ DELETE /api/materials/{id}/              - Supprimer une matière
 GET    /api/materials/low_stock/         - Matières avec stock bas
 GET    /api/materials/statistics/        - Statistiques sur les matières
 POST   /api/materials/{id}/adjust_stock/ - Ajuster le stock d'une matière
+POST   /api/materials/import/            - Import en masse CSV/JSON, stock initial journalisé (?dry_run=1)
 
 # Stock Movements
 GET    /api/stock-movements/             - Liste des mouvements
@@ -58,6 +60,8 @@ POST   /api/stock-movements/             - Créer un mouvement
 GET    /api/stock-movements/{id}/        - Détail d'un mouvement
 GET    /api/stock-movements/by_material/ - Mouvements par matière (?material_id=X)
 GET    /api/stock-movements/statistics/  - Statistiques sur les mouvements
+GET    /api/stock-movements/balance_at/  - Stock valorisé à une date (?date=YYYY-MM-DD)
+GET    /api/stock-movements/export/      - Export en flux (?as=csv|ndjson, mêmes filtres que la liste)
 
 # Purchase Orders
 GET    /api/purchase-orders/             - Liste des commandes
@@ -68,9 +72,11 @@ PATCH  /api/purchase-orders/{id}/        - Modifier partiellement une commande
 DELETE /api/purchase-orders/{id}/        - Supprimer une commande
 POST   /api/purchase-orders/{id}/receive/ - Recevoir une commande
 GET    /api/purchase-orders/statistics/  - Statistiques sur les commandes
+POST   /api/purchase-orders/replenish/   - Commandes brouillons pour les matières en stock bas (?dry_run=1)
 
 # Dashboard
-GET    /api/dashboard/stats/             - Statistiques du tableau de bord
+GET    /api/dashboard/stats/             - Statistiques du tableau de bord (cache court)
+GET    /api/dashboard/cache_metrics/     - Hits/misses du cache des indicateurs
 
 # Paramètres de recherche disponibles :
 # - search: Recherche textuelle
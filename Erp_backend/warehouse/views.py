@@ -2,12 +2,23 @@ from rest_framework import viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.db.models import Q, Sum, Count, F
-from django.db.models.functions import TruncMonth
+from django.utils import timezone
 from django_filters.rest_framework import DjangoFilterBackend
-from datetime import datetime, timedelta
+from datetime import datetime
 from decimal import Decimal
 
+from erp_api import caching
+from erp_api.export import ExportMixin
+from erp_api.fastlist import FastListMixin
+from erp_api.importing import ImportFormatError, is_dry_run, request_rows
+from erp_api.pagination import KeysetPagination
+
+from . import dashboard
+from .imports import import_materials, import_suppliers
 from .models import Category, Supplier, Material, StockMovement, PurchaseOrder
+from .receiving import ReceptionError, receive_purchase_order
+from .replenishment import plan_replenishment
+from .snapshots import stock_at
 from .permissions import (
     CategoriesPermission,
     SuppliersPermission,
@@ -31,6 +42,14 @@ from .serializers import (
 )
 
 
+def _import_response(request, importer):
+    try:
+        report = importer(request_rows(request), dry_run=is_dry_run(request), created_by=request.user.get_username())
+    except ImportFormatError as exc:
+        return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response(report.as_dict())
+
+
 class CategoryViewSet(viewsets.ModelViewSet):
     """ViewSet pour les catégories"""
     queryset = Category.objects.all()
@@ -40,6 +59,9 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
 
+    def get_queryset(self):
+        return super().get_queryset().annotate(materials_count=Count('materials'))
+
 
 class SupplierViewSet(viewsets.ModelViewSet):
     """ViewSet pour les fournisseurs"""
@@ -50,6 +72,9 @@ class SupplierViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at']
     ordering = ['name']
 
+    def get_queryset(self):
+        return super().get_queryset().annotate(materials_count=Count('materials'))
+
     @action(detail=True, methods=['get'])
     def materials(self, request, pk=None):
         """Récupère toutes les matières d'un fournisseur"""
@@ -60,78 +85,36 @@ class SupplierViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """Statistiques sur les fournisseurs"""
-        # Statistiques de base
-        total_suppliers = Supplier.objects.count()
-        active_suppliers = Supplier.objects.filter(materials__isnull=False).distinct().count()
-        inactive_suppliers = total_suppliers - active_suppliers
-        
-        # Fournisseurs avec commandes en attente (approximation pour "avec dette")
-        suppliers_with_pending_orders = PurchaseOrder.objects.filter(
-            status__in=['sent', 'confirmed']
-        ).values('supplier').distinct().count()
-        
-        # Données mensuelles (9 derniers mois)
-        nine_months_ago = datetime.now() - timedelta(days=270)
-        
-        # Achats par mois (basé sur les purchase orders)
-        monthly_purchases = PurchaseOrder.objects.filter(
-            order_date__gte=nine_months_ago
-        ).annotate(
-            month=TruncMonth('order_date')
-        ).values('month').annotate(
-            total=Sum('total_amount')
-        ).order_by('month')
-        
-        # Formater les données mensuelles
-        monthly_data = []
-        months_fr = ['Jan', 'Fév', 'Mar', 'Avr', 'Mai', 'Juin', 'Juil', 'Août', 'Sept', 'Oct', 'Nov', 'Déc']
-        
-        # Créer un dictionnaire des données existantes
-        purchases_dict = {}
-        for item in monthly_purchases:
-            month_key = item['month'].strftime('%Y-%m')
-            purchases_dict[month_key] = float(item['total'] or 0)
-        
-        # Générer les 9 derniers mois avec données ou 0
-        current_date = datetime.now()
-        for i in range(8, -1, -1):
-            target_date = current_date - timedelta(days=30 * i)
-            month_key = target_date.strftime('%Y-%m')
-            month_num = target_date.month - 1
-            
-            achats = purchases_dict.get(month_key, 0)
-            # Approximation: 90% des achats sont payés
-            paiements = achats * 0.9
-            
-            monthly_data.append({
-                'month': months_fr[month_num],
-                'achats': achats,
-                'paiements': paiements,
-            })
-        
-        # Totaux
-        total_achats = sum(item['achats'] for item in monthly_data)
-        total_paiements = sum(item['paiements'] for item in monthly_data)
-        solde = total_achats - total_paiements
-        
-        stats = {
-            'total_suppliers': total_suppliers,
-            'active_suppliers': active_suppliers,
-            'inactive_suppliers': inactive_suppliers,
-            'suppliers_with_debt': suppliers_with_pending_orders,
-            'monthly_data': monthly_data,
-            'total_achats': total_achats,
-            'total_paiements': total_paiements,
-            'solde': solde,
-        }
-        
-        return Response(stats)
+        """
+        Statistiques sur les fournisseurs : achats par mois calendaire.
+        ?months=N (défaut 9, max 60), ?supplier=ID pour un seul fournisseur.
+        """
+        try:
+            months = int(request.query_params.get('months', 9))
+            supplier_id = request.query_params.get('supplier')
+            supplier_id = int(supplier_id) if supplier_id else None
+        except ValueError:
+            return Response(
+                {'error': 'months and supplier must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        months = min(max(months, 1), 60)
+        return Response(dashboard.supplier_statistics(months, supplier_id))
+
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Import en masse, clé nif ou nom (voir warehouse.imports).
+        Body: fichier CSV/JSON en multipart ("file") ou liste JSON de fournisseurs.
+        ?dry_run=1 : validation seule, rien n'est écrit.
+        """
+        return _import_response(request, import_suppliers)
 
 
-class MaterialViewSet(viewsets.ModelViewSet):
+class MaterialViewSet(FastListMixin, viewsets.ModelViewSet):
     """ViewSet pour les matières premières"""
     queryset = Material.objects.select_related('category', 'supplier').all()
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['category', 'supplier', 'unit']
     search_fields = ['name', 'reference', 'supplier__name']
@@ -154,27 +137,19 @@ class MaterialViewSet(viewsets.ModelViewSet):
         serializer = MaterialListSerializer(materials, many=True)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'], url_path='import')
+    def bulk_import(self, request):
+        """
+        Import en masse, upsert par référence (voir warehouse.imports).
+        category / supplier : nom (ou nif du fournisseur) ; stock initial journalisé.
+        ?dry_run=1 : validation seule, rien n'est écrit.
+        """
+        return _import_response(request, import_materials)
+
     @action(detail=False, methods=['get'])
     def statistics(self, request):
-        """Statistiques générales sur les matières"""
-        stats = {
-            'total_count': Material.objects.count(),
-            'low_stock_count': Material.objects.filter(stock__lt=F('min_stock')).count(),
-            'total_value': Material.objects.aggregate(
-                total=Sum(F('stock') * F('price'))
-            )['total'] or 0,
-            'by_category': list(
-                Material.objects.values('category__name')
-                .annotate(count=Count('id'), total_value=Sum(F('stock') * F('price')))
-                .order_by('-count')
-            ),
-            'by_supplier': list(
-                Material.objects.values('supplier__name')
-                .annotate(count=Count('id'))
-                .order_by('-count')
-            ),
-        }
-        return Response(stats)
+        """Statistiques générales sur les matières (mises en cache, voir warehouse.dashboard)"""
+        return Response(dashboard.material_statistics())
 
     @action(detail=True, methods=['post'])
     def adjust_stock(self, request, pk=None):
@@ -196,13 +171,20 @@ class MaterialViewSet(viewsets.ModelViewSet):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class StockMovementViewSet(viewsets.ModelViewSet):
+class StockMovementViewSet(FastListMixin, ExportMixin, viewsets.ModelViewSet):
     """ViewSet pour les mouvements de stock"""
     queryset = StockMovement.objects.select_related('material', 'material__category').all()
+    pagination_class = KeysetPagination
     filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
     filterset_fields = ['material', 'movement_type']
     ordering_fields = ['created_at']
     ordering = ['-created_at']
+    export_fields = [
+        ('created_at', 'created_at'), ('material_reference', 'material__reference'),
+        ('material_name', 'material__name'), ('movement_type', 'movement_type'),
+        ('quantity', 'quantity'), ('unit', 'material__unit'), ('previous_stock', 'previous_stock'),
+        ('new_stock', 'new_stock'), ('created_by', 'created_by'), ('notes', 'notes'),
+    ]
 
     def get_serializer_class(self):
         if self.action == 'create':
@@ -237,6 +219,22 @@ class StockMovementViewSet(viewsets.ModelViewSet):
         }
         return Response(stats)
 
+    @action(detail=False, methods=['get'])
+    def balance_at(self, request):
+        """Stock et valorisation à une date (?date=YYYY-MM-DD, défaut aujourd'hui)"""
+        day = request.query_params.get('date')
+        if day:
+            try:
+                day = datetime.strptime(day, '%Y-%m-%d').date()
+            except ValueError:
+                return Response(
+                    {'error': 'date must be YYYY-MM-DD'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        else:
+            day = timezone.localdate()
+        return Response(stock_at(day))
+
 
 class PurchaseOrderViewSet(viewsets.ModelViewSet):
     """ViewSet pour les bons de commande"""
@@ -247,6 +245,12 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
     ordering_fields = ['order_date', 'created_at']
     ordering = ['-order_date']
 
+    def get_queryset(self):
+        if self.action == 'list':
+            # La liste n'affiche pas les lignes : pas de prefetch, juste leur nombre
+            return PurchaseOrder.objects.select_related('supplier').annotate(items_count=Count('items'))
+        return super().get_queryset()
+
     def get_serializer_class(self):
         if self.action == 'retrieve':
             return PurchaseOrderDetailSerializer
@@ -259,39 +263,17 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
         """Marquer une commande comme reçue et mettre à jour le stock"""
         purchase_order = self.get_object()
 
-        if purchase_order.status == 'received':
-            return Response(
-                {'error': 'Cette commande a déjà été reçue'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
-        # Mettre à jour le stock pour chaque item
-        for item in purchase_order.items.all():
-            # Créer un mouvement de stock
-            StockMovement.objects.create(
-                material=item.material,
-                movement_type='in',
-                quantity=item.quantity,
-                previous_stock=item.material.stock,
-                new_stock=item.material.stock + item.quantity,
+        try:
+            receive_purchase_order(
+                purchase_order.pk,
                 notes=f"Réception commande {purchase_order.order_number}",
-                created_by=request.data.get('created_by', 'System')
+                created_by=request.data.get('created_by', 'System'),
+                delivery_date=request.data.get('delivery_date'),
             )
+        except ReceptionError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
 
-            # Mettre à jour le stock
-            item.material.stock += item.quantity
-            item.material.save()
-
-            # Marquer l'item comme reçu
-            item.received_quantity = item.quantity
-            item.save()
-
-        # Mettre à jour le statut de la commande
-        purchase_order.status = 'received'
-        purchase_order.actual_delivery_date = request.data.get('delivery_date')
-        purchase_order.save()
-
-        serializer = PurchaseOrderDetailSerializer(purchase_order)
+        serializer = PurchaseOrderDetailSerializer(self.get_queryset().get(pk=purchase_order.pk))
         return Response(serializer.data)
 
     @action(detail=True, methods=['post'])
@@ -341,54 +323,26 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
                 {'error': 'Aucun article à recevoir'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+        try:
+            quantities = {}
+            for item_data in received_items:
+                item_id = int(item_data.get('id'))
+                quantities[item_id] = quantities.get(item_id, 0) + Decimal(str(item_data.get('quantity', 0)))
+            receive_purchase_order(
+                purchase_order.pk,
+                quantities,
+                notes=f"Réception partielle commande {purchase_order.order_number}",
+                created_by=request.data.get('created_by', 'System'),
+                delivery_date=request.data.get('delivery_date'),
+            )
+        except (ReceptionError, TypeError, ValueError, ArithmeticError) as e:
+            return Response(
+                {'error': f'Erreur lors de la réception de l\'article: {str(e)}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         
-        for item_data in received_items:
-            try:
-                item = purchase_order.items.get(id=item_data.get('id'))
-                quantity = Decimal(str(item_data.get('quantity', 0)))
-                
-                if quantity <= 0:
-                    continue
-                
-                # Vérifier qu'on ne reçoit pas plus que commandé
-                remaining = item.quantity - item.received_quantity
-                if quantity > remaining:
-                    quantity = remaining
-                
-                # Créer un mouvement de stock
-                StockMovement.objects.create(
-                    material=item.material,
-                    movement_type='in',
-                    quantity=quantity,
-                    previous_stock=item.material.stock,
-                    new_stock=item.material.stock + quantity,
-                    notes=f"Réception partielle commande {purchase_order.order_number}",
-                    created_by=request.data.get('created_by', 'System')
-                )
-                
-                # Mettre à jour le stock
-                item.material.stock += quantity
-                item.material.save()
-                
-                # Mettre à jour la quantité reçue
-                item.received_quantity += quantity
-                item.save()
-                
-            except Exception as e:
-                return Response(
-                    {'error': f'Erreur lors de la réception de l\'article: {str(e)}'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-        
-        # Vérifier si tout est reçu
-        all_received = all(item.is_fully_received for item in purchase_order.items.all())
-        if all_received:
-            purchase_order.status = 'received'
-            if not purchase_order.actual_delivery_date:
-                purchase_order.actual_delivery_date = request.data.get('delivery_date')
-            purchase_order.save()
-        
-        serializer = PurchaseOrderDetailSerializer(purchase_order)
+        serializer = PurchaseOrderDetailSerializer(self.get_queryset().get(pk=purchase_order.pk))
         return Response(serializer.data)
 
     @action(detail=False, methods=['get'])
@@ -408,6 +362,27 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
         }
         return Response(stats)
 
+    @action(detail=False, methods=['post'])
+    def replenish(self, request):
+        """
+        Bons de commande brouillons (un par fournisseur) pour les matières en stock bas,
+        commandes en cours déduites (voir warehouse.replenishment).
+        Body optionnel : {"suppliers": [ids], "target_factor": 2}. ?dry_run=1 : calcul seul.
+        """
+        suppliers = request.data.get('suppliers') or None
+        try:
+            target_factor = Decimal(str(request.data.get('target_factor') or 0)) or None
+            if suppliers is not None:
+                suppliers = [int(pk) for pk in suppliers]
+        except (ArithmeticError, TypeError, ValueError):
+            return Response(
+                {'error': 'target_factor doit être un nombre, suppliers une liste d\'identifiants'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if target_factor is not None and (not target_factor.is_finite() or target_factor < 1):
+            return Response({'error': 'target_factor doit être au moins 1'}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(plan_replenishment(target_factor=target_factor, suppliers=suppliers, dry_run=is_dry_run(request)))
+
 
 class DashboardViewSet(viewsets.ViewSet):
     """ViewSet pour le tableau de bord"""
@@ -415,30 +390,12 @@ class DashboardViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'])
     def stats(self, request):
         """Récupère toutes les statistiques du tableau de bord"""
-        # Statistiques générales
-        total_materials = Material.objects.count()
-        low_stock_materials = Material.objects.filter(stock__lt=F('min_stock'))
-        low_stock_count = low_stock_materials.count()
-        
-        total_value = Material.objects.aggregate(
-            total=Sum(F('stock') * F('price'))
-        )['total'] or 0
-
-        categories_count = Category.objects.count()
-
-        # Mouvements récents
-        recent_movements = StockMovement.objects.select_related(
-            'material', 'material__category'
-        ).all()[:10]
-
-        data = {
-            'total_materials': total_materials,
-            'low_stock_count': low_stock_count,
-            'total_value': float(total_value),
-            'categories_count': categories_count,
-            'recent_movements': StockMovementSerializer(recent_movements, many=True).data,
-            'low_stock_materials': MaterialListSerializer(low_stock_materials[:10], many=True).data,
-        }
+        def compute():
+            return DashboardStatsSerializer(dashboard.dashboard_stats()).data
 
-        serializer = DashboardStatsSerializer(data)
-        return Response(serializer.data)
\ No newline at end of file
+        return Response(caching.get_or_compute(dashboard.CACHE_NAMESPACE, 'dashboard_stats', compute))
+
+    @action(detail=False, methods=['get'])
+    def cache_metrics(self, request):
+        """Compteurs hits/misses du cache des indicateurs"""
+        return Response(caching.metrics())